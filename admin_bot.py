@@ -4,9 +4,8 @@
 import logging
 import os
 import asyncio
+import importlib.util
 import ipaddress
-import re
-import shutil
 import time as time_module
 from datetime import datetime, time, timedelta
 import pytz
@@ -22,17 +21,40 @@ from config import (
     DEFAULT_DAILY_TIME, DEFAULT_TIMEZONE, CACHE_TTL_CURRENCIES,
     CACHE_TTL_CRYPTO, CACHE_TTL_STOCKS, CACHE_TTL_COMMODITIES, CACHE_TTL_INDICES,
     SUPPORTED_CURRENCIES, SUPPORTED_CRYPTO, SUPPORTED_STOCKS,
-    FALLBACK_USD_RUB_RATE, PING_TARGETS
+    FALLBACK_USD_RUB_RATE, PING_TARGETS, LOOP_LAG_CHECK_INTERVAL, LOOP_LAG_THRESHOLD,
+    CACHE_TTL_PDF_REPORT, PDF_RENDER_WORKERS,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    COORDINATION_BACKEND, COORDINATION_LEASE_FILE, LEADER_LEASE_TTL,
+    ALERT_SHARDS, ALERT_SHARD_MIN_SUBSCRIBERS, LATENCY_PROBE_INTERVAL, LATENCY_WINDOW_SAMPLES,
+    PING_STREAMING, PING_EDIT_INTERVAL,
+    MARKET_SNAPSHOT_FILE, MARKET_SNAPSHOT_PERSIST_INTERVAL, MARKET_SNAPSHOT_MAX_AGE,
+    CANDLES_BACKFILL_INTERVAL, CANDLES_FLUSH_INTERVAL, CHART_RENDER_WORKERS, CHART_CACHE_SIZE
 )
 from utils import (
     is_admin, get_cached_data, fetch_with_retry, validate_positive_number,
     validate_asset, escape_html, format_price, clear_cache,
-    save_last_known_rate, get_last_known_rate
+    save_last_known_rate, get_last_known_rate,
+    export_cache_entries, restore_cache_entries, start_cache_ticker, stop_cache_ticker
 )
 from data_sources import (
     get_cbr_rates, get_forex_rates, get_crypto_data, get_moex_stocks,
     get_commodities_data, get_indices_data
 )
+import monitoring
+from monitoring import get_metrics, increment_metric, start_loop_monitor
+from probe_engine import icmp_available, probe_host
+import latency_monitor
+from latency_monitor import start_latency_monitor
+from alert_engine import evaluate_notifications, shutdown_alert_executor
+from market_snapshot import CATEGORIES as SNAPSHOT_CATEGORIES, MarketSnapshot, snapshot_from_sources
+from asset_registry import registry as asset_registry
+from fetch_planner import demanded_assets, plan_sources
+from rates_renderer import render_rates, section_assets
+from snapshot_store import load_snapshot, save_snapshot
+from candle_store import backfill_candles, candle_store, moex_instruments
+from media_cache import send_cached_media
+import coordination
+from coordination import configure_coordination, leader_only
 from autobuy_module import (
     configure_autobuy, initialize_autobuy_settings, ensure_autobuy_job,
     autobuy_on_command, autobuy_off_command, autobuy_status_command,
@@ -47,35 +69,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Безопасный импорт reportlab (может отсутствовать)
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.pdfgen import canvas
-    REPORTLAB_AVAILABLE = True
+# PDF рендерится в отдельном процессе (reportlab может отсутствовать)
+from pdf_report import (
+    REPORTLAB_AVAILABLE, build_pdf_report, snapshot_version,
+    get_pdf_executor, shutdown_pdf_executor
+)
+
+# Графики /chart рендерятся в отдельном процессе (Pillow может отсутствовать)
+from chart_render import (
+    PILLOW_AVAILABLE, CHART_PERIODS, DEFAULT_CHART_PERIOD, build_chart_png, resolve_period,
+    get_cached_chart, store_chart, get_chart_executor, shutdown_chart_executor
+)
+if REPORTLAB_AVAILABLE:
     logger.info("✅ ReportLab доступен для PDF экспорта")
-except ImportError:
-    REPORTLAB_AVAILABLE = False
-    # Создаем заглушки для типов
-    letter = A4 = None
-    SimpleDocTemplate = Paragraph = Spacer = Table = TableStyle = None
-    getSampleStyleSheet = ParagraphStyle = None
-    inch = None
-    colors = None
-    canvas = None
+else:
     logger.warning("⚠️ ReportLab недоступен - PDF экспорт отключен")
 
-import io
-
-# Безопасный импорт schedule (может отсутствовать)
-try:
-    import schedule
-    SCHEDULE_AVAILABLE = True
-except ImportError:
-    SCHEDULE_AVAILABLE = False
+# schedule (может отсутствовать) нужен только альтернативному планировщику
+# и импортируется при первом использовании
+SCHEDULE_AVAILABLE = importlib.util.find_spec('schedule') is not None
 
 # Логирование уже настроено выше
 
@@ -83,6 +95,9 @@ except ImportError:
 if not SCHEDULE_AVAILABLE:
     logger.warning("⚠️ Модуль 'schedule' не установлен. Альтернативная система задач будет использовать только Timer")
 
+# Бот обрабатывает только сообщения и нажатия inline-кнопок
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
 # Глобальная переменная для системы задач
 GLOBAL_JOB_QUEUE = None
 _data_file_lock = threading.RLock()
@@ -249,7 +264,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/start - Главное меню\n"
         "/help - Эта справка\n"
         "/ping [IP[:PORT] ...] - Проверка задержки до серверов\n"
-        "/rates - Показать все курсы\n\n"
+        "/rates - Показать курсы (избранное или все: /rates all)\n"
+        "/watchlist - Избранные активы\n"
+        "/chart SBER 1mo - График цены (1d, 1w, 1mo, 3mo, 1y, 5y)\n\n"
         "🔔 <b>Уведомления:</b>\n"
         "/subscribe - Подписаться на уведомления\n"
         "/unsubscribe - Отписаться\n"
@@ -268,6 +285,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "/set_daily_time HH:MM - Настроить время сводки\n"
             "/get_daily_settings - Посмотреть настройки\n"
             "/restart_daily_job - Перезапустить задачу сводки\n"
+            "/metrics - Метрики и блокировки event loop\n"
             "/autobuy_on [HH:MM] - Включить автопокупку\n"
             "/autobuy_off - Выключить автопокупку\n"
             "/autobuy_status - Статус автопокупки\n"
@@ -292,9 +310,6 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /ping"""
-    ping_binary = shutil.which("ping")
-    default_tcp_ports = (443, 80, 53)
-
     def parse_host_specs(args):
         """Парсит аргументы /ping в список {'host': ip, 'port': optional_int}."""
         if not args:
@@ -346,109 +361,6 @@ async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
         return specs, errors
 
-    async def tcp_probe_port_once(host: str, port: int, timeout_seconds: int = 2):
-        started = time_module.perf_counter()
-        try:
-            open_conn = asyncio.open_connection(host, port)
-            _, writer = await asyncio.wait_for(open_conn, timeout=timeout_seconds)
-            latency_ms = (time_module.perf_counter() - started) * 1000
-            writer.close()
-            await writer.wait_closed()
-            return latency_ms, ""
-        except Exception as exc:
-            return None, f"{type(exc).__name__}: {exc}"
-
-    async def ping_host(host: str, port: int | None, count: int = 4, timeout_seconds: int = 2) -> dict:
-        result = {
-            "host": host,
-            "ok": False,
-            "packet_loss": "100",
-            "min_ms": None,
-            "avg_ms": None,
-            "max_ms": None,
-            "raw_error": "",
-            "mode": "tcp_fallback",
-            "probe_port": port,
-            "checked_ports": []
-        }
-
-        if ping_binary:
-            cmd = [
-                ping_binary,
-                "-c", str(count),
-                "-W", str(timeout_seconds),
-                host
-            ]
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-            output = (stdout or b"").decode("utf-8", errors="ignore")
-            error_text = (stderr or b"").decode("utf-8", errors="ignore").strip()
-
-            packet_loss_match = re.search(r"([0-9]+(?:\.[0-9]+)?)% packet loss", output)
-            rtt_match = re.search(
-                r"(?:rtt|round-trip) min/avg/max(?:/(?:mdev|stddev))? = "
-                r"([0-9]+(?:\.[0-9]+)?)/([0-9]+(?:\.[0-9]+)?)/([0-9]+(?:\.[0-9]+)?)/([0-9]+(?:\.[0-9]+)?) ms",
-                output
-            )
-
-            result["mode"] = "icmp"
-            result["ok"] = process.returncode == 0
-            result["packet_loss"] = packet_loss_match.group(1) if packet_loss_match else "100"
-            result["raw_error"] = error_text
-
-            if rtt_match:
-                result["min_ms"] = rtt_match.group(1)
-                result["avg_ms"] = rtt_match.group(2)
-                result["max_ms"] = rtt_match.group(3)
-            return result
-
-        ports_to_try = [port] if port is not None else list(default_tcp_ports)
-        result["checked_ports"] = ports_to_try
-        latencies = []
-        failures = 0
-        used_port = port
-        last_error = ""
-
-        for _ in range(count):
-            sample_latency = None
-            for candidate_port in ports_to_try:
-                latency_ms, err = await tcp_probe_port_once(
-                    host=host,
-                    port=candidate_port,
-                    timeout_seconds=timeout_seconds
-                )
-                if latency_ms is not None:
-                    sample_latency = latency_ms
-                    if used_port is None:
-                        used_port = candidate_port
-                    break
-                if err:
-                    last_error = err
-
-            if sample_latency is None:
-                failures += 1
-            else:
-                latencies.append(sample_latency)
-
-        loss = (failures / count) * 100
-        result["packet_loss"] = f"{loss:.1f}".rstrip("0").rstrip(".")
-        result["ok"] = len(latencies) > 0
-        result["raw_error"] = last_error
-        if used_port is not None:
-            result["probe_port"] = used_port
-
-        if latencies:
-            result["min_ms"] = f"{min(latencies):.2f}"
-            result["avg_ms"] = f"{(sum(latencies) / len(latencies)):.2f}"
-            result["max_ms"] = f"{max(latencies):.2f}"
-
-        return result
-
     current_time = get_moscow_time().strftime("%d.%m.%Y %H:%M:%S")
     host_specs, parse_errors = parse_host_specs(context.args)
 
@@ -471,21 +383,37 @@ async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("❌ Можно проверить не более 10 серверов за один вызов.")
         return
 
-    await update.message.reply_text(f"📡 Проверяю {len(host_specs)} сервер(а)...")
-    ping_results = await asyncio.gather(
-        *(ping_host(item["host"], item["port"]) for item in host_specs),
-        return_exceptions=True
-    )
-
-    lines = [f"🏓 <b>Ping report</b> ({current_time})"]
-    if not ping_binary:
-        lines.append("ℹ️ Системный ping недоступен, использую TCP‑проверку.")
+    # Без аргументов отвечаем мгновенно из скользящего окна фонового мониторинга
+    if not context.args and latency_monitor.latency_monitor and latency_monitor.latency_monitor.has_data():
+        lines = [f"🏓 <b>Ping report</b> ({current_time})"]
+        summaries = latency_monitor.latency_monitor.summaries()
+        for host, stats in summaries.items():
+            if stats['p50_ms'] is None:
+                lines.append(f"• <code>{host}</code>: ❌ недоступен, loss {stats['loss_pct']:.0f}% (окно {stats['samples']})")
+                continue
+            status = "✅" if stats['loss_pct'] < 100 else "⚠️"
+            jitter = f", jitter {stats['jitter_ms']:.2f}" if stats['jitter_ms'] is not None else ""
+            lines.append(
+                f"• <code>{host}</code>: {status} p50 {stats['p50_ms']:.2f} ms "
+                f"(p95 {stats['p95_ms']:.2f}, p99 {stats['p99_ms']:.2f}{jitter}), "
+                f"loss {stats['loss_pct']:.1f}%"
+            )
+        oldest_update = min(stats['last_updated'] or 0 for stats in summaries.values())
+        window = max(stats['samples'] for stats in summaries.values())
+        lines.append(
+            f"\nℹ️ Фоновый мониторинг: последние {window} замеров, "
+            f"обновлено {max(0, int(time_module.time() - oldest_update))} с назад"
+        )
+        lines.append("💡 Живая проверка: <code>/ping 1.1.1.1 8.8.8.8</code>")
+        await update.message.reply_html("\n".join(lines))
+        return
 
-    for spec, item in zip(host_specs, ping_results):
+    def format_result_line(spec, item):
         host = spec["host"]
+        if item is None:
+            return f"• <code>{host}</code>: ⏳ проверяется..."
         if isinstance(item, Exception):
-            lines.append(f"• <code>{host}</code>: ❌ ошибка ({escape_html(str(item))})")
-            continue
+            return f"• <code>{host}</code>: ❌ ошибка ({escape_html(str(item))})"
 
         loss = item["packet_loss"]
         port_hint = ""
@@ -497,20 +425,255 @@ async def ping_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
         if item["avg_ms"] is not None:
             status = "✅" if float(loss) < 100 else "⚠️"
-            lines.append(
+            return (
                 f"• <code>{host}</code>: {status} avg {item['avg_ms']} ms "
                 f"(min {item['min_ms']}, max {item['max_ms']}), loss {loss}%{port_hint}"
             )
+        err = escape_html(item["raw_error"] or "таймаут/недоступен")
+        return f"• <code>{host}</code>: ❌ недоступен, loss {loss}%{port_hint} ({err})"
+
+    def render_report(results, final):
+        lines = [f"🏓 <b>Ping report</b> ({current_time})"]
+        if not icmp_available() and any(item["port"] is None for item in host_specs):
+            lines.append("ℹ️ ICMP недоступен, использую TCP‑проверку.")
+        for spec, item in zip(host_specs, results):
+            lines.append(format_result_line(spec, item))
+        if final:
+            lines.append("\n💡 Использование: <code>/ping 1.1.1.1 8.8.8.8</code>")
+            lines.append("💡 С портом: <code>/ping 77.221.148.155:22</code> или <code>/ping 77.221.148.155 22</code>")
         else:
-            err = escape_html(item["raw_error"] or "таймаут/недоступен")
-            lines.append(f"• <code>{host}</code>: ❌ недоступен, loss {loss}%{port_hint} ({err})")
+            done_count = sum(1 for item in results if item is not None)
+            lines.append(f"\n📡 Готово {done_count}/{len(host_specs)}...")
+        return "\n".join(lines)
+
+    if not PING_STREAMING:
+        await update.message.reply_text(f"📡 Проверяю {len(host_specs)} сервер(а)...")
+        ping_results = await asyncio.gather(
+            *(probe_host(item["host"], item["port"]) for item in host_specs),
+            return_exceptions=True
+        )
+        await update.message.reply_html(render_report(ping_results, final=True))
+        return
 
-    lines.append("\n💡 Использование: <code>/ping 1.1.1.1 8.8.8.8</code>")
-    lines.append("💡 С портом: <code>/ping 77.221.148.155:22</code> или <code>/ping 77.221.148.155 22</code>")
-    await update.message.reply_html("\n".join(lines))
+    # Потоковый режим: одно сообщение, которое редактируется по мере готовности хостов.
+    # Правки объединяются не чаще PING_EDIT_INTERVAL, чтобы не упираться в лимиты Telegram.
+    results = [None] * len(host_specs)
+    status_message = await update.message.reply_html(render_report(results, final=False))
+    dirty = asyncio.Event()
+
+    async def edit_report(text):
+        try:
+            await status_message.edit_text(text, parse_mode='HTML')
+        except Exception as e:
+            if "not modified" not in str(e).lower():
+                logger.warning(f"Не удалось обновить ping report: {e}")
+
+    async def coalescing_editor():
+        last_text = None
+        while True:
+            await dirty.wait()
+            dirty.clear()
+            text = render_report(results, final=False)
+            if text != last_text:
+                await edit_report(text)
+                last_text = text
+            await asyncio.sleep(PING_EDIT_INTERVAL)
+
+    async def probe_indexed(index, spec):
+        try:
+            return index, await probe_host(spec["host"], spec["port"])
+        except Exception as e:
+            return index, e
+
+    editor_task = asyncio.create_task(coalescing_editor())
+    try:
+        for next_done in asyncio.as_completed(
+            [probe_indexed(i, spec) for i, spec in enumerate(host_specs)]
+        ):
+            index, item = await next_done
+            results[index] = item
+            dirty.set()
+    finally:
+        editor_task.cancel()
+
+    await edit_report(render_report(results, final=True))
+
+# Ключи кэша источников по категориям снимка (они же сохраняются на диск)
+MARKET_CACHE_KEYS = {
+    'currencies': 'cbr_rates',
+    'forex': 'forex_rates',
+    'crypto': 'crypto_data',
+    'stocks': 'moex_stocks',
+    'commodities': 'commodities',
+    'indices': 'indices',
+}
+
+async def fetch_market_data(session: aiohttp.ClientSession, sources=SNAPSHOT_CATEGORIES):
+    """
+    Получить рыночные данные параллельно с кэшированием
+    
+    Args:
+        sources: Какие категории запрашивать (по умолчанию все, см. fetch_planner)
+    
+    Returns:
+        Словарь {категория: ответ источника};
+        при ошибке источника на его месте будет исключение
+    """
+    async def fetch_cbr():
+        async def _fetch():
+            return await get_cbr_rates(session)
+        return await get_cached_data(MARKET_CACHE_KEYS['currencies'], _fetch, CACHE_TTL_CURRENCIES)
+    
+    async def fetch_forex():
+        async def _fetch():
+            return await get_forex_rates(session)
+        return await get_cached_data(MARKET_CACHE_KEYS['forex'], _fetch, CACHE_TTL_CURRENCIES)
+    
+    async def fetch_crypto():
+        async def _fetch():
+            return await get_crypto_data(session)
+        return await get_cached_data(MARKET_CACHE_KEYS['crypto'], _fetch, CACHE_TTL_CRYPTO)
+    
+    async def fetch_stocks():
+        async def _fetch():
+            return await get_moex_stocks(session)
+        return await get_cached_data(MARKET_CACHE_KEYS['stocks'], _fetch, CACHE_TTL_STOCKS)
+    
+    async def fetch_commodities():
+        async def _fetch():
+            return await get_commodities_data(session)
+        return await get_cached_data(MARKET_CACHE_KEYS['commodities'], _fetch, CACHE_TTL_COMMODITIES)
+    
+    async def fetch_indices():
+        async def _fetch():
+            return await get_indices_data(session)
+        return await get_cached_data(MARKET_CACHE_KEYS['indices'], _fetch, CACHE_TTL_INDICES)
+    
+    fetchers = {
+        'currencies': fetch_cbr,
+        'forex': fetch_forex,
+        'crypto': fetch_crypto,
+        'stocks': fetch_stocks,
+        'commodities': fetch_commodities,
+        'indices': fetch_indices,
+    }
+    categories = [category for category in SNAPSHOT_CATEGORIES if category in sources]
+    results = await asyncio.gather(
+        *(fetchers[category]() for category in categories),
+        return_exceptions=True
+    )
+    return dict(zip(categories, results))
+
+async def get_market_snapshot(session: aiohttp.ClientSession, sources=SNAPSHOT_CATEGORIES) -> MarketSnapshot:
+    """
+    Получить типизированный снимок рынка (пересобирается только при обновлении источников)
+    
+    Args:
+        sources: Категории для запроса; остальные берутся из предыдущего снимка
+    """
+    results = await fetch_market_data(session, sources)
+    for category, result in results.items():
+        if isinstance(result, Exception):
+            logger.error(f"Ошибка получения данных ({category}): {result}")
+    snapshot = snapshot_from_sources(results)
+    record_live_candles(snapshot)
+    return snapshot
+
+# Версии секций снимка, цены которых уже учтены в свечах
+_candle_section_versions = {}
+
+def record_live_candles(snapshot: MarketSnapshot) -> None:
+    """
+    Учесть живые цены MOEX в текущих свечах 1m/1h/1d
+    
+    Учитываются только секции, обновленные с прошлой записи (перенесенные из
+    прошлого снимка или восстановленные с диска цены уже учтены или устарели),
+    по времени получения данных источником, а не по времени запроса.
+    """
+    # Ряды в общем каталоге CANDLES_DIR ведет и записывает только лидер
+    if not coordination.is_leader():
+        return
+    for category in ('stocks', 'indices'):
+        version = snapshot.section_versions.get(category)
+        if version is None or version == _candle_section_versions.get(category):
+            continue
+        _candle_section_versions[category] = version
+        entry = export_cache_entries([MARKET_CACHE_KEYS[category]]).get(MARKET_CACHE_KEYS[category])
+        if entry is None:
+            continue
+        fetched_at = entry[0]
+        for key, secid, _ in moex_instruments():
+            quote = snapshot.quote(key)
+            if quote is not None and quote.category == category and quote.price and quote.is_live:
+                candle_store.record_price(secid, quote.price, fetched_at)
+
+async def backfill_candles_job(context: ContextTypes.DEFAULT_TYPE):
+    """Догрузка истории свечей MOEX из ISS (только недостающий хвост)"""
+    try:
+        session = await get_http_session()
+        instruments = [(secid, market) for _, secid, market in moex_instruments()]
+        added = await backfill_candles(session, candle_store, instruments)
+        written = candle_store.flush()
+        logger.info(f"🕯️ История свечей обновлена: {added} свечей, записано рядов: {written}")
+    except Exception as e:
+        logger.error(f"Ошибка загрузки истории свечей: {e}")
+
+async def flush_candles_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая запись рядов свечей на диск"""
+    candle_store.flush()
+
+_persisted_snapshot_signature = None
+_prewarm_task = None
+
+def persist_market_snapshot() -> None:
+    """Сохранить ответы источников на диск, если они изменились с прошлого сохранения"""
+    global _persisted_snapshot_signature
+    entries = export_cache_entries(MARKET_CACHE_KEYS.values())
+    signature = tuple(sorted((key, fetched_at) for key, (fetched_at, _) in entries.items()))
+    if not entries or signature == _persisted_snapshot_signature:
+        return
+    try:
+        size = save_snapshot(MARKET_SNAPSHOT_FILE, entries)
+        _persisted_snapshot_signature = signature
+        logger.debug(f"💾 Снимок рынка сохранен ({size} байт)")
+    except Exception as e:
+        logger.error(f"Ошибка сохранения снимка рынка: {e}")
+
+async def persist_market_snapshot_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическое сохранение снимка рынка"""
+    persist_market_snapshot()
+
+def restore_market_snapshot() -> int:
+    """
+    Восстановить кэш источников из снимка на диске
+    
+    Восстановленные данные отдаются сразу (stale-but-valid), а первый же
+    запрос к источнику обновляет их в фоне.
+    """
+    global _persisted_snapshot_signature
+    entries = load_snapshot(MARKET_SNAPSHOT_FILE, MARKET_SNAPSHOT_MAX_AGE)
+    restored = restore_cache_entries(entries, MARKET_SNAPSHOT_MAX_AGE)
+    _persisted_snapshot_signature = tuple(sorted((key, fetched_at) for key, (fetched_at, _) in entries.items()))
+    if restored:
+        oldest = min(fetched_at for fetched_at, _ in entries.values())
+        logger.info(f"♻️ Восстановлен снимок рынка: {restored} источников, возраст до {time_module.time() - oldest:.0f} с")
+    return restored
+
+async def prewarm_market_snapshot() -> None:
+    """Собрать снимок из восстановленных данных и запустить их фоновое обновление"""
+    try:
+        session = await get_http_session()
+        await get_market_snapshot(session)
+    except Exception as e:
+        logger.error(f"Ошибка прогрева снимка рынка: {e}")
 
 async def rates_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Получить полные курсы валют, криптовалют, акций, товаров и индексов"""
+    """
+    Получить курсы валют, криптовалют, акций, товаров и индексов
+    
+    Если у пользователя есть избранные активы, показываются только они
+    и запрашиваются только нужные для них источники; /rates all — все курсы.
+    """
     try:
         reply_target = update.effective_message
         if reply_target is None:
@@ -519,403 +682,104 @@ async def rates_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
         await reply_target.reply_text("📊 Получаю информацию")
         
+        show_all = bool(getattr(context, 'args', None)) and context.args[0].lower() in ('all', 'все')
+        watchlist = None if show_all else get_user_watchlist(update.effective_user.id)
+        watch = set(watchlist) if watchlist else None
+        sources = plan_sources(watch)
+        
         session = await get_http_session()
         
-        # Получаем все данные параллельно с кэшированием
-        async def fetch_cbr():
-            async def _fetch():
-                return await get_cbr_rates(session)
-            return await get_cached_data('cbr_rates', _fetch, CACHE_TTL_CURRENCIES)
-        
-        async def fetch_forex():
-            async def _fetch():
-                return await get_forex_rates(session)
-            return await get_cached_data('forex_rates', _fetch, CACHE_TTL_CURRENCIES)
-        
-        async def fetch_crypto():
-            async def _fetch():
-                return await get_crypto_data(session)
-            return await get_cached_data('crypto_data', _fetch, CACHE_TTL_CRYPTO)
-        
-        async def fetch_stocks():
-            async def _fetch():
-                return await get_moex_stocks(session)
-            return await get_cached_data('moex_stocks', _fetch, CACHE_TTL_STOCKS)
-        
-        async def fetch_commodities():
-            async def _fetch():
-                return await get_commodities_data(session)
-            return await get_cached_data('commodities', _fetch, CACHE_TTL_COMMODITIES)
-        
-        async def fetch_indices():
-            async def _fetch():
-                return await get_indices_data(session)
-            return await get_cached_data('indices', _fetch, CACHE_TTL_INDICES)
-        
-        # Параллельный запрос всех данных
-        cbr_data, forex_data, crypto_data, stocks_data, commodities_data, indices_data = await asyncio.gather(
-            fetch_cbr(), fetch_forex(), fetch_crypto(), fetch_stocks(), fetch_commodities(), fetch_indices(),
-            return_exceptions=True
-        )
+        # Параллельный запрос нужных источников с кэшированием
+        snapshot = await get_market_snapshot(session, sources)
         
-        # Обработка курсов валют ЦБ РФ
-        usd_str = eur_str = cny_str = "❌ Ошибка API"
-        usd_to_rub_rate = 0
+        # Курсы валют ЦБ РФ
+        usd_rate, eur_rate, cny_rate = snapshot.usd_rub, snapshot.eur_rub, snapshot.cny_rub
+        usd_to_rub_rate = usd_rate or 0
         
-        try:
-            if isinstance(cbr_data, Exception):
-                raise cbr_data
-            
-            if not cbr_data or not isinstance(cbr_data, dict):
-                logger.error("Данные ЦБ РФ не получены или имеют неправильный формат")
-                raise ValueError("Данные ЦБ РФ недоступны")
-            
-            valute = cbr_data.get('Valute', {})
-            if not valute:
-                logger.error("Данные Valute отсутствуют в ответе ЦБ РФ")
-                raise ValueError("Данные валют отсутствуют")
-            
-            # Получаем курсы валют (только 4 основные) с индивидуальной обработкой ошибок
-            usd_info = valute.get('USD', {})
-            usd_rate = usd_info.get('Value') if isinstance(usd_info, dict) else None
-            
-            eur_info = valute.get('EUR', {})
-            eur_rate = eur_info.get('Value') if isinstance(eur_info, dict) else None
-            
-            cny_info = valute.get('CNY', {})
-            cny_rate = cny_info.get('Value') if isinstance(cny_info, dict) else None
-            
-            # Сохраняем курс доллара для конвертации в рубли
-            usd_to_rub_rate = usd_rate if isinstance(usd_rate, (int, float)) else 0
-            
-            # Сохраняем успешно полученный курс для будущего использования
-            if usd_to_rub_rate > 0:
-                save_last_known_rate('USD_RUB', usd_to_rub_rate)
-            
-            # Форматируем валютные курсы индивидуально
-            if isinstance(usd_rate, (int, float)):
-                usd_str = f"{format_price(usd_rate)} ₽"
-            else:
-                usd_str = "❌ Ошибка API"
-                logger.warning(f"USD курс не получен: {usd_rate}")
-            
-            if isinstance(eur_rate, (int, float)):
-                eur_str = f"{format_price(eur_rate)} ₽"
-            else:
-                eur_str = "❌ Ошибка API"
-                logger.warning(f"EUR курс не получен: {eur_rate}")
-            
-            if isinstance(cny_rate, (int, float)):
-                cny_str = f"{format_price(cny_rate)} ₽"
-            else:
-                cny_str = "❌ Ошибка API"
-                logger.warning(f"CNY курс не получен: {cny_rate}")
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения курсов ЦБ РФ: {e}")
-            import traceback
-            logger.error(f"Трассировка: {traceback.format_exc()}")
-            # Не меняем значения, если они уже установлены индивидуально
+        # Сохраняем успешно полученный курс для будущего использования
+        if usd_to_rub_rate > 0:
+            save_last_known_rate('USD_RUB', usd_to_rub_rate)
         
-        # Обработка курса USD/RUB с FOREX
-        try:
-            if isinstance(forex_data, Exception):
-                raise forex_data
-            
-            # Получаем курс USD/RUB с FOREX
-            forex_rates = forex_data.get('rates', {})
-            forex_usd_rub = forex_rates.get('RUB', None)
+        usd_str = f"{format_price(usd_rate)} ₽" if usd_rate is not None else "❌ Ошибка API"
+        eur_str = f"{format_price(eur_rate)} ₽" if eur_rate is not None else "❌ Ошибка API"
+        cny_str = f"{format_price(cny_rate)} ₽" if cny_rate is not None else "❌ Ошибка API"
+        
+        # Курс USD/RUB с FOREX
+        # (избранному без валют, крипты и товаров курс рубля не нужен)
+        forex_usd_rub = snapshot.forex_usd_rub
+        needs_rub = 'currencies' in sources
+        if needs_rub and forex_usd_rub:
+            # Если ЦБ РФ недоступен, используем FOREX как основной источник
+            if usd_to_rub_rate == 0:
+                usd_to_rub_rate = forex_usd_rub
+                usd_str = f"{format_price(forex_usd_rub)} ₽ (FOREX)"
+                logger.debug(f"Используем FOREX как основной источник: {forex_usd_rub:.2f} ₽")
+            else:
+                # Вычисляем разницу с курсом ЦБ РФ
+                diff = forex_usd_rub - usd_to_rub_rate
+                diff_pct = (diff / usd_to_rub_rate) * 100
+                usd_str += f" (FOREX: {format_price(forex_usd_rub)} ₽, разница: {diff:+.2f} ₽, {diff_pct:+.2f}%)"
+                logger.debug(f"FOREX USD/RUB: {forex_usd_rub:.2f} ₽")
             
-            if forex_usd_rub and isinstance(forex_usd_rub, (int, float)):
-                # Если ЦБ РФ недоступен, используем FOREX как основной источник
-                if usd_to_rub_rate == 0:
-                    usd_to_rub_rate = forex_usd_rub
-                    usd_str = f"{format_price(forex_usd_rub)} ₽ (FOREX)"
-                    logger.debug(f"Используем FOREX как основной источник: {forex_usd_rub:.2f} ₽")
-                else:
-                    # Вычисляем разницу с курсом ЦБ РФ
-                    diff = forex_usd_rub - usd_to_rub_rate
-                    diff_pct = (diff / usd_to_rub_rate) * 100
-                    diff_str = f" (FOREX: {format_price(forex_usd_rub)} ₽, разница: {diff:+.2f} ₽, {diff_pct:+.2f}%)"
-                    usd_str += diff_str
-                    logger.debug(f"FOREX USD/RUB: {forex_usd_rub:.2f} ₽")
-                
-                # EUR/RUB и CNY/RUB через FOREX (кросс через USD)
-                forex_eur_usd = forex_rates.get('EUR')
-                if forex_eur_usd and isinstance(forex_eur_usd, (int, float)) and forex_eur_usd != 0:
-                    forex_eur_rub = forex_usd_rub / forex_eur_usd
-                    if isinstance(eur_rate, (int, float)) and eur_rate > 0:
-                        diff = forex_eur_rub - eur_rate
-                        diff_pct = (diff / eur_rate) * 100
-                        eur_str += f" (FOREX: {format_price(forex_eur_rub)} ₽, разница: {diff:+.2f} ₽, {diff_pct:+.2f}%)"
-                    else:
-                        eur_str = f"{format_price(forex_eur_rub)} ₽ (FOREX)"
-                
-                forex_cny_usd = forex_rates.get('CNY')
-                if forex_cny_usd and isinstance(forex_cny_usd, (int, float)) and forex_cny_usd != 0:
-                    forex_cny_rub = forex_usd_rub / forex_cny_usd
-                    if isinstance(cny_rate, (int, float)) and cny_rate > 0:
-                        diff = forex_cny_rub - cny_rate
-                        diff_pct = (diff / cny_rate) * 100
-                        cny_str += f" (FOREX: {format_price(forex_cny_rub)} ₽, разница: {diff:+.2f} ₽, {diff_pct:+.2f}%)"
+            # EUR/RUB и CNY/RUB через FOREX (кросс через USD)
+            for cross_usd, cbr_rate, target in (
+                (snapshot.forex_eur_usd, eur_rate, 'eur'),
+                (snapshot.forex_cny_usd, cny_rate, 'cny'),
+            ):
+                if not cross_usd:
+                    continue
+                cross_rub = forex_usd_rub / cross_usd
+                if cbr_rate:
+                    diff = cross_rub - cbr_rate
+                    diff_pct = (diff / cbr_rate) * 100
+                    cross_str = f" (FOREX: {format_price(cross_rub)} ₽, разница: {diff:+.2f} ₽, {diff_pct:+.2f}%)"
+                    if target == 'eur':
+                        eur_str += cross_str
                     else:
-                        cny_str = f"{format_price(forex_cny_rub)} ₽ (FOREX)"
-                
-        except Exception as e:
-            logger.error(f"Ошибка получения курса FOREX: {e}")
-            if usd_to_rub_rate == 0:
-                # Пробуем взять последнее известное значение (не старше 24 часов)
-                last_rate = get_last_known_rate('USD_RUB', max_age_hours=24)
-                if last_rate:
-                    usd_to_rub_rate = last_rate
-                    logger.warning(f"⚠️ Используется последний известный курс USD/RUB: {usd_to_rub_rate:.2f}")
+                        cny_str += cross_str
+                elif target == 'eur':
+                    eur_str = f"{format_price(cross_rub)} ₽ (FOREX)"
                 else:
-                    # Только если нет последнего значения - используем fallback
-                    usd_to_rub_rate = FALLBACK_USD_RUB_RATE
-                    logger.error(f"⚠️ Все источники недоступны, используется fallback курс USD/RUB: {usd_to_rub_rate:.2f}")
-                    
-                # Сохраняем используемое значение для статистики
-                save_last_known_rate('USD_RUB', usd_to_rub_rate)
+                    cny_str = f"{format_price(cross_rub)} ₽ (FOREX)"
+        elif needs_rub and usd_to_rub_rate == 0:
+            logger.error("Курс USD/RUB недоступен ни от ЦБ РФ, ни от FOREX")
+            # Пробуем взять последнее известное значение (не старше 24 часов)
+            last_rate = get_last_known_rate('USD_RUB', max_age_hours=24)
+            if last_rate:
+                usd_to_rub_rate = last_rate
+                logger.warning(f"⚠️ Используется последний известный курс USD/RUB: {usd_to_rub_rate:.2f}")
+            else:
+                # Только если нет последнего значения - используем fallback
+                usd_to_rub_rate = FALLBACK_USD_RUB_RATE
+                logger.error(f"⚠️ Все источники недоступны, используется fallback курс USD/RUB: {usd_to_rub_rate:.2f}")
+                
+            # Сохраняем используемое значение для статистики
+            save_last_known_rate('USD_RUB', usd_to_rub_rate)
         
         # Загружаем историю цен для динамики
         price_history = load_price_history()
         
-        def format_delta(asset_key, current_price):
-            """Форматировать изменение относительно последней зафиксированной цены"""
-            if current_price is None:
-                return ""
-            previous_price = price_history.get(asset_key)
-            if previous_price is None or previous_price == 0:
-                return ""
-            change_pct = ((current_price - previous_price) / previous_price) * 100
-            return f" (Δ {change_pct:+.2f}% от последнего)"
-        
-        # Обработка криптовалют
-        if isinstance(crypto_data, Exception):
-            logger.error(f"Ошибка получения криптовалют: {crypto_data}")
-            crypto_data = {}
-        
-        # Форматируем криптовалютные цены (доллары + рубли)
-        crypto_strings = {}
-        crypto_list = [
-            {'id': 'bitcoin', 'name': 'Bitcoin', 'decimals': 0},
-            {'id': 'the-open-network', 'name': 'TON', 'decimals': 2},
-            {'id': 'solana', 'name': 'Solana', 'decimals': 2},
-            {'id': 'tether', 'name': 'Tether', 'decimals': 2}
-        ]
-        
-        for crypto in crypto_list:
-            crypto_id = crypto['id']
-            crypto_name = crypto['name']
-            decimals = crypto['decimals']
-            
-            if crypto_id in crypto_data:
-                price = crypto_data[crypto_id]['price']
-                change_24h = crypto_data[crypto_id]['change_24h']
-                source = crypto_data[crypto_id]['source']
-                
-                if isinstance(price, (int, float)) and usd_to_rub_rate > 0:
-                    rub_price = price * usd_to_rub_rate
-                    change_str = f" ({change_24h:+.2f}% за 24ч)" if change_24h != 0 else ""
-                    source_str = f" [{source}]" if source != 'CoinGecko' else ""
-                    crypto_strings[crypto_id] = f"{crypto_name}: ${format_price(price, decimals)} ({format_price(rub_price, decimals)} ₽){change_str}{source_str}"
-                elif isinstance(price, (int, float)):
-                    change_str = f" ({change_24h:+.2f}% за 24ч)" if change_24h != 0 else ""
-                    source_str = f" [{source}]" if source != 'CoinGecko' else ""
-                    crypto_strings[crypto_id] = f"{crypto_name}: ${format_price(price, decimals)}{change_str}{source_str}"
-                else:
-                    crypto_strings[crypto_id] = f"{crypto_name}: ❌ Н/Д"
-            else:
-                crypto_strings[crypto_id] = f"{crypto_name}: ❌ Н/Д"
-        
-        # Обработка акций
-        if isinstance(stocks_data, Exception):
-            logger.error(f"Ошибка получения акций: {stocks_data}")
-            stocks_data = {}
-        
-        # Обработка товаров
-        if isinstance(commodities_data, Exception):
-            logger.error(f"Ошибка получения товаров: {commodities_data}")
-            commodities_data = {}
-        
-        # Обработка индексов
-        if isinstance(indices_data, Exception):
-            logger.error(f"Ошибка получения индексов: {indices_data}")
-            indices_data = {}
-        
-        # Формируем итоговое сообщение с улучшенным форматированием
-        message = "📊 **На сегодня курсы такие:**\n\n"
-        
-        # Валюты ЦБ РФ
-        message += "🏛️ **ВАЛЮТЫ (по курсу ЦБ РФ):**\n"
-        message += f"├ USD: **{usd_str}**\n"
-        message += f"├ EUR: **{eur_str}**\n"
-        message += f"└ CNY: **{cny_str}**\n\n"
-        
-        # Криптовалюты
-        message += "💎 **КРИПТА:**\n"
-        crypto_items = ['bitcoin', 'the-open-network', 'solana', 'tether']
-        for i, crypto_id in enumerate(crypto_items):
-            crypto_key = crypto_id if crypto_id != 'the-open-network' else 'ton'
-            if crypto_id in crypto_strings:
-                prefix = "├" if i < len(crypto_items) - 1 else "└"
-                message += f"{prefix} {crypto_strings[crypto_id]}\n"
-        message += "\n"
-        
-        # Российские акции
-        message += "📈 **РОССИЙСКИЕ АКЦИИ (MOEX):**\n"
-        stock_names = {
-            'SBER': 'Сбер', 'YDEX': 'Яндекс', 'VKCO': 'ВК', 
-            'T': 'T-Технологии', 'GAZP': 'Газпром', 'GMKN': 'Норникель',
-            'ROSN': 'Роснефть', 'LKOH': 'ЛУКОЙЛ', 'MTSS': 'МТС', 'MFON': 'Мегафон',
-            'TGLD@': 'TGLD', 'TOFZ@': 'TOFZ', 'DOMRF': 'DOMRF'
-        }
-        stock_items = list(stock_names.keys())
-        
-        # Проверяем, есть ли живые данные
-        has_live_data = any(
-            stocks_data.get(ticker, {}).get('price') is not None 
-            for ticker in stock_items
-        )
-        
-        is_moscow_weekend = get_moscow_time().weekday() >= 5
-
-        if has_live_data:
-            for i, ticker in enumerate(stock_items):
-                if ticker in stocks_data and stocks_data[ticker].get('price'):
-                    name = stock_names[ticker]
-                    price = stocks_data[ticker]['price']
-                    change_pct = stocks_data[ticker].get('change_pct', 0)
-                    is_live = stocks_data[ticker].get('is_live', True)
-                    status_icon = "🟢" if is_live else "🟡"
-                    prefix = "├" if i < len(stock_items) - 1 else "└"
-                    
-                    # Добавляем изменение с открытия для российских акций
-                    change_str = f" ({change_pct:+.2f}% с открытия)" if change_pct is not None and change_pct != 0 and is_live else ""
-                    delta_str = format_delta(ticker, price)
-                    message += f"{prefix} {status_icon} {name}: **{format_price(price)} ₽**{change_str}{delta_str}\n"
-        else:
-            if is_moscow_weekend:
-                message += "🔴 **Торги закрыты** (выходной день)\n"
-            else:
-                message += "🔴 **Данные временно недоступны**\n"
-        message += "\n"
-        
-        # Недвижимость
-        message += "🏠 **НЕДВИЖИМОСТЬ:**\n"
-        real_estate_tickers = ['PIKK', 'SMLT']
-        real_estate_names = {'PIKK': 'ПИК', 'SMLT': 'Самолёт'}
-        
-        has_real_estate_data = any(
-            stocks_data.get(ticker, {}).get('price') is not None 
-            for ticker in real_estate_tickers
+        # Секции рендерятся заново только при изменении их данных (см. rates_renderer)
+        message = render_rates(
+            snapshot,
+            currency_values={'USD': usd_str, 'EUR': eur_str, 'CNY': cny_str},
+            usd_to_rub_rate=usd_to_rub_rate,
+            price_history=price_history,
+            watch=watch,
+            is_weekend=get_moscow_time().weekday() >= 5,
         )
         
-        if has_real_estate_data:
-            for i, ticker in enumerate(real_estate_tickers):
-                if ticker in stocks_data and stocks_data[ticker].get('price'):
-                    name = real_estate_names[ticker]
-                    price = stocks_data[ticker]['price']
-                    change_pct = stocks_data[ticker].get('change_pct', 0)
-                    is_live = stocks_data[ticker].get('is_live', True)
-                    status_icon = "🟢" if is_live else "🟡"
-                    prefix = "├" if i < len(real_estate_tickers) - 1 else "└"
-                    
-                    # Добавляем изменение с открытия для акций недвижимости
-                    change_str = f" ({change_pct:+.2f}% с открытия)" if change_pct is not None and change_pct != 0 and is_live else ""
-                    delta_str = format_delta(ticker, price)
-                    message += f"{prefix} {status_icon} {name}: **{format_price(price)} ₽**{change_str}{delta_str}\n"
-        else:
-            if is_moscow_weekend:
-                message += "🔴 **Торги закрыты** (выходной день)\n"
-            else:
-                message += "🔴 **Данные временно недоступны**\n"
-        message += "\n"
-        
-        # Товары 
-        message += "🛠️ **ЗОЛОТО, НЕФТЬ:**\n"
-        commodity_items = ['gold', 'silver', 'brent', 'urals']
-        commodity_names = {
-            'gold': 'Золото', 
-            'silver': 'Серебро', 
-            'brent': 'Нефть Brent',
-            'urals': 'Нефть Urals'
-        }
-        
-        for i, commodity in enumerate(commodity_items):
-            if commodity in commodities_data:
-                name = commodity_names[commodity]
-                price = commodities_data[commodity]['price']
-                rub_price = price * usd_to_rub_rate if usd_to_rub_rate > 0 else 0
-                prefix = "├" if i < len(commodity_items) - 1 else "└"
-                delta_str = format_delta(commodity, price)
-                if rub_price > 0:
-                    message += f"{prefix} {name}: **${format_price(price)}** ({format_price(rub_price)} ₽){delta_str}\n"
-                else:
-                    message += f"{prefix} {name}: **${format_price(price)}**{delta_str}\n"
-        message += "\n"
-        
-        # Фондовые индексы
-        message += "📊 **ФОНДОВЫЕ ИНДЕКСЫ:**\n"
-        index_items = ['imoex', 'sp500']
-        
-        for i, index in enumerate(index_items):
-            if index in indices_data:
-                name = indices_data[index]['name']
-                price = indices_data[index].get('price')
-                change = indices_data[index].get('change_pct', 0)
-                is_live = indices_data[index].get('is_live', True)
-                note = indices_data[index].get('note', '')
-                
-                prefix = "├" if i < len(index_items) - 1 else "└"
-                
-                if price is not None and price != 0:
-                    # Определяем тип изменения для индекса
-                    if index in ['imoex']:
-                        change_period = "с открытия" if is_live else "с закрытия"
-                    elif index == 'sp500':
-                        change_period = "с закрытия" if not is_live else "с открытия"
-                    else:
-                        change_period = ""
-                    
-                    change_str = f"({change:+.2f}% {change_period})" if change != 0 else ""
-                    status_icon = "🟢" if is_live else "🟡"
-                    note_str = f" ({note})" if note else ""
-                    delta_str = format_delta(index, price)
-                    message += f"{prefix} {status_icon} {name}: **{format_price(price)}** {change_str}{note_str}{delta_str}\n"
-                else:
-                    # Если данных нет, но индекс был запрошен - показываем что данные временно недоступны
-                    message += f"{prefix} 🔴 {name}: **Данные временно недоступны**\n"
-            else:
-                # Если индекса вообще нет в данных
-                index_name = {'imoex': 'IMOEX', 'sp500': 'S&P 500'}.get(index, index)
-                prefix = "├" if i < len(index_items) - 1 else "└"
-                message += f"{prefix} 🔴 {index_name}: **Данные временно недоступны**\n"
-        message += "\n"
-        
         # Обновляем историю цен для динамики (чтобы дельты появлялись в /rates)
         try:
             history_update = {}
-            for ticker in stock_items:
-                price = stocks_data.get(ticker, {}).get('price')
-                if price is not None:
-                    history_update[ticker] = price
-            for ticker in real_estate_tickers:
-                price = stocks_data.get(ticker, {}).get('price')
-                if price is not None:
-                    history_update[ticker] = price
-            for commodity in commodity_items:
-                if commodity in commodities_data:
-                    price = commodities_data[commodity].get('price')
+            shown = section_assets(watch)
+            for section in ('stocks', 'real_estate', 'commodities', 'indices'):
+                for asset in shown[section]:
+                    price = snapshot.price(asset.key)
                     if price is not None:
-                        history_update[commodity] = price
-            for index in index_items:
-                if index in indices_data:
-                    price = indices_data[index].get('price')
-                    if price is not None:
-                        history_update[index] = price
+                        history_update[asset.key] = price
             if history_update:
-                price_history.update(history_update)
+                record_price_history(price_history, history_update)
                 save_price_history(price_history)
         except Exception as e:
             logger.error(f"Ошибка обновления истории цен в /rates: {e}")
@@ -924,6 +788,8 @@ async def rates_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         current_time = get_moscow_time().strftime("%d.%m.%Y %H:%M")
         message += f"🕐 **Время:** {current_time}\n"
         message += f"📡 **Источники:** ЦБ РФ, CoinGecko/Coinbase/Binance/CryptoCompare, Т-Инвестиции API, MOEX, Gold-API, Alpha Vantage"
+        if watch is not None:
+            message += "\n\n⭐ Показаны избранные активы (/watchlist). Все курсы: /rates all"
 
         await reply_target.reply_text(message, parse_mode='Markdown')
         
@@ -1019,9 +885,9 @@ async def set_alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "• <code>/set_alert BTC 115000</code> - биткоин выше 115K$\n"
             "• <code>/set_alert SBER 200</code> - Сбер выше 200₽\n\n"
             "💡 Поддерживаемые активы:\n"
-            "• Валюты: USD, EUR, CNY\n"
-            "• Криптовалюты: BTC, TON, SOL, USDT\n"
-            "• Акции: SBER, YDEX, VKCO, T, GAZP, GMKN, ROSN, LKOH, MTSS, MFON, PIKK, SMLT, TGLD@, TOFZ@, DOMRF"
+            f"• Валюты: {', '.join(SUPPORTED_CURRENCIES)}\n"
+            f"• Криптовалюты: {', '.join(SUPPORTED_CRYPTO)}\n"
+            f"• Акции: {', '.join(SUPPORTED_STOCKS)}"
         )
         return
     
@@ -1105,6 +971,203 @@ async def view_alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     await update.message.reply_html(message)
 
+# Категории избранного в меню ⭐ Избранные активы
+WATCHLIST_CATEGORIES = (
+    ('currencies', '💱 Валюты'),
+    ('crypto', '💎 Крипта'),
+    ('stocks', '📈 Акции'),
+    ('commodities', '🛠️ Товары'),
+    ('indices', '📊 Индексы'),
+)
+
+def get_user_watchlist(user_id) -> list:
+    """Избранные активы пользователя (пустой список — все активы)"""
+    user_notifications = load_notification_data().get(str(user_id), {})
+    return [key for key in user_notifications.get('watchlist', []) if asset_registry.get(key) is not None]
+
+def set_user_watchlist(user_id, keys) -> list:
+    """Сохранить избранные активы пользователя в порядке реестра"""
+    notifications = load_notification_data()
+    user_notifications = notifications.setdefault(str(user_id), {
+        'subscribed': False,
+        'threshold': DEFAULT_THRESHOLD,
+        'alerts': {},
+        'daily_summary': True
+    })
+    watchlist = sorted(
+        {key for key in keys if asset_registry.get(key) is not None},
+        key=asset_registry.id_of
+    )
+    user_notifications['watchlist'] = watchlist
+    save_notification_data(notifications)
+    return watchlist
+
+def build_watchlist_menu(user_id):
+    """Сообщение и клавиатура главного экрана избранного"""
+    watchlist = get_user_watchlist(user_id)
+    if watchlist:
+        names = ", ".join(escape_html(asset_registry.get(key).name) for key in watchlist)
+        current = f"⭐ <b>Сейчас в избранном:</b> {names}"
+    else:
+        current = "⭐ <b>Избранное пусто</b> — /rates и уведомления показывают все активы"
+    message = (
+        "⭐ <b>ИЗБРАННЫЕ АКТИВЫ</b>\n\n"
+        f"{current}\n\n"
+        "/rates покажет только избранное и запросит только нужные источники.\n"
+        "Выберите категорию, чтобы добавить или убрать активы:"
+    )
+    buttons = [
+        InlineKeyboardButton(title, callback_data=f"fav_cat:{category}")
+        for category, title in WATCHLIST_CATEGORIES
+    ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    if watchlist:
+        keyboard.append([
+            InlineKeyboardButton("📊 Курсы избранного", callback_data="rates"),
+            InlineKeyboardButton("🗑 Очистить", callback_data="fav_clear")
+        ])
+    if is_admin(user_id):
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="settings_back")])
+    return message, InlineKeyboardMarkup(keyboard)
+
+def build_watchlist_category(user_id, category):
+    """Сообщение и клавиатура выбора активов одной категории"""
+    watchlist = set(get_user_watchlist(user_id))
+    title = dict(WATCHLIST_CATEGORIES).get(category, category)
+    buttons = [
+        InlineKeyboardButton(
+            f"{'✅' if asset.key in watchlist else '➕'} {asset.name}",
+            callback_data=f"fav_toggle:{asset.key}"
+        )
+        for asset in asset_registry.in_category(category)
+    ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    keyboard.append([InlineKeyboardButton("🔙 К категориям", callback_data="fav_menu")])
+    message = (
+        f"⭐ <b>ИЗБРАННОЕ: {escape_html(title)}</b>\n\n"
+        "✅ — в избранном, ➕ — добавить. Нажмите на актив, чтобы переключить."
+    )
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def watchlist_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопки меню избранного (fav_*, доступны всем пользователям)"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    data = query.data
+    
+    if data.startswith("fav_cat:"):
+        message, reply_markup = build_watchlist_category(user_id, data.split(":", 1)[1])
+    elif data.startswith("fav_toggle:"):
+        asset = asset_registry.get(data.split(":", 1)[1])
+        if asset is None:
+            await query.edit_message_text("❌ Актив больше не поддерживается")
+            return
+        watchlist = set(get_user_watchlist(user_id))
+        if asset.key in watchlist:
+            watchlist.discard(asset.key)
+        else:
+            watchlist.add(asset.key)
+        set_user_watchlist(user_id, watchlist)
+        message, reply_markup = build_watchlist_category(user_id, asset.category)
+    elif data == "fav_clear":
+        set_user_watchlist(user_id, [])
+        message, reply_markup = build_watchlist_menu(user_id)
+    else:
+        message, reply_markup = build_watchlist_menu(user_id)
+    
+    await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
+
+async def watchlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Избранные активы: /watchlist — меню, /watchlist BTC SBER — задать список, /watchlist clear — очистить"""
+    user_id = update.effective_user.id
+    
+    if context.args:
+        if context.args[0].lower() in ('clear', 'очистить'):
+            set_user_watchlist(user_id, [])
+            await update.message.reply_html("🗑 Избранное очищено — /rates снова показывает все активы")
+            return
+        
+        resolved = [(arg, asset_registry.resolve(arg)) for arg in context.args]
+        unknown = [escape_html(arg) for arg, asset in resolved if asset is None]
+        if unknown:
+            await update.message.reply_html(
+                f"❌ <b>Неизвестные активы:</b> {', '.join(unknown)}\n\n"
+                "💡 Используйте /watchlist без аргументов, чтобы выбрать активы кнопками"
+            )
+            return
+        
+        watchlist = set_user_watchlist(user_id, [asset.key for _, asset in resolved])
+        names = ", ".join(escape_html(asset_registry.get(key).name) for key in watchlist)
+        await update.message.reply_html(
+            f"⭐ <b>Избранное сохранено:</b> {names}\n\n"
+            "📊 /rates покажет только эти активы, все курсы — /rates all"
+        )
+        return
+    
+    message, reply_markup = build_watchlist_menu(user_id)
+    await update.message.reply_html(message, reply_markup=reply_markup)
+
+async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """График цены по истории свечей: /chart SBER 1mo"""
+    periods = ", ".join(CHART_PERIODS)
+    instruments = {key: secid for key, secid, _ in moex_instruments()}
+    if not context.args:
+        await update.message.reply_html(
+            "📈 <b>График цены</b>\n\n"
+            "Использование: /chart &lt;актив&gt; [период]\n"
+            f"Периоды: {periods} (по умолчанию {DEFAULT_CHART_PERIOD})\n"
+            f"Активы: {', '.join(escape_html(key) for key in instruments)}"
+        )
+        return
+    
+    asset = asset_registry.resolve(context.args[0])
+    if asset is None or asset.key not in instruments:
+        await update.message.reply_html(
+            f"❌ Нет истории цен для <b>{escape_html(context.args[0])}</b>\n\n"
+            f"💡 Графики доступны для: {', '.join(escape_html(key) for key in instruments)}"
+        )
+        return
+    period = resolve_period(context.args[1] if len(context.args) > 1 else None)
+    if period is None:
+        await update.message.reply_html(f"❌ Неизвестный период. Доступны: {periods}")
+        return
+    if not PILLOW_AVAILABLE:
+        await update.message.reply_text("❌ Графики недоступны: библиотека Pillow не установлена (pip install Pillow)")
+        return
+    
+    resolution, days = CHART_PERIODS[period]
+    series = candle_store.query(instruments[asset.key], resolution, time_module.time() - days * 86400)
+    if len(series['time']) < 2:
+        await update.message.reply_text("⏳ История цен еще загружается, попробуйте позже")
+        return
+    
+    try:
+        # Текущая свеча меняется до закрытия, поэтому в ключе и время, и цена последней свечи
+        key = (asset.key, period, series['time'][-1], series['close'][-1])
+        png = get_cached_chart(key)
+        if png is None:
+            increment_metric('chart_cache_misses_total')
+            payload = {
+                'title': f"{instruments[asset.key]} {period}",
+                'resolution': resolution,
+                'time': series['time'],
+                'close': series['close'],
+                'high': series['high'],
+                'low': series['low'],
+            }
+            loop = asyncio.get_running_loop()
+            png = await loop.run_in_executor(get_chart_executor(CHART_RENDER_WORKERS), build_chart_png, payload)
+            store_chart(key, png, CHART_CACHE_SIZE)
+        else:
+            increment_metric('chart_cache_hits_total')
+        
+        # Повторная отправка того же PNG — по file_id, без загрузки
+        caption = f"{asset.emoji} {asset.name}: {period}".strip()
+        await send_cached_media(context.bot, 'photo', update.effective_chat.id, png, caption=caption)
+    except Exception as e:
+        logger.error(f"Ошибка построения графика {asset.key} {period}: {e}")
+        await update.message.reply_text(f"❌ Ошибка построения графика: {str(e)}")
+
 async def test_daily_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Тестовая команда для проверки ежедневной сводки (только для админа)"""
     user_id = update.effective_user.id
@@ -1205,6 +1268,10 @@ NOTIFICATION_DATA_FILE = 'notifications.json'
 PRICE_HISTORY_FILE = 'price_history.json'
 SETTINGS_FILE = 'bot_settings.json'
 
+PRICE_CHECK_INTERVAL = 1800  # 30 минут в секундах
+# Время записи цен в истории (служебный ключ рядом с ценами активов)
+PRICE_HISTORY_STAMPS_KEY = '_updated_at'
+
 def load_notification_data():
     """Загрузить данные уведомлений"""
     try:
@@ -1245,6 +1312,29 @@ def save_price_history(data):
     except Exception as e:
         logger.error(f"Ошибка сохранения истории: {e}")
 
+def record_price_history(price_history, prices):
+    """Записать цены в историю вместе со временем записи"""
+    now = time_module.time()
+    stamps = price_history.setdefault(PRICE_HISTORY_STAMPS_KEY, {})
+    for key, price in prices.items():
+        if price is not None:
+            price_history[key] = price
+            stamps[key] = now
+
+def recent_price_history(price_history, max_age):
+    """
+    Цены из истории, записанные не раньше max_age секунд назад
+    
+    Цена актива, который долго не запрашивался (не было в избранном),
+    не годится как база для изменения "за 30 мин" и пересечения порога.
+    """
+    cutoff = time_module.time() - max_age
+    stamps = price_history.get(PRICE_HISTORY_STAMPS_KEY, {})
+    return {
+        key: price for key, price in price_history.items()
+        if key != PRICE_HISTORY_STAMPS_KEY and stamps.get(key, 0) >= cutoff
+    }
+
 def load_bot_settings():
     """Загрузить настройки бота"""
     try:
@@ -1298,175 +1388,54 @@ def validate_time_format(time_str):
 async def check_price_changes(context: ContextTypes.DEFAULT_TYPE):
     """Проверить изменения цен и отправить уведомления"""
     try:
-        session = await get_http_session()
-        current_prices = {}
-        estimated_assets = set()
-        
-        # Получаем данные параллельно с кэшированием
-        async def fetch_cbr():
-            try:
-                async def _fetch_cbr():
-                    return await get_cbr_rates(session)
-                cbr_data = await get_cached_data('cbr_rates_check', _fetch_cbr, CACHE_TTL_CURRENCIES)
-                return {
-                'USD': cbr_data.get('Valute', {}).get('USD', {}).get('Value'),
-                'EUR': cbr_data.get('Valute', {}).get('EUR', {}).get('Value'),
-                'CNY': cbr_data.get('Valute', {}).get('CNY', {}).get('Value')
-                }
-            except Exception as e:
-                logger.error(f"Ошибка получения курсов валют для проверки: {e}")
-                return {}
-        
-        async def fetch_crypto():
-            try:
-                async def _fetch_crypto():
-                    return await get_crypto_data(session)
-                crypto_data = await get_cached_data('crypto_data_check', _fetch_crypto, CACHE_TTL_CRYPTO)
-                crypto_mapping = {
-                    'bitcoin': 'BTC',
-                    'the-open-network': 'TON',
-                    'solana': 'SOL',
-                    'tether': 'USDT'
-                    }
-                result = {}
-                for crypto_id, price_data in crypto_data.items():
-                    if crypto_id in crypto_mapping:
-                        symbol = crypto_mapping[crypto_id]
-                        result[symbol] = price_data['price']
-                return result
-            except Exception as e:
-                logger.error(f"Ошибка получения криптовалют для проверки: {e}")
-                return {}
-        
-        async def fetch_stocks():
-            try:
-                async def _fetch_stocks():
-                    return await get_moex_stocks(session)
-                moex_data = await get_cached_data('moex_stocks_check', _fetch_stocks, CACHE_TTL_STOCKS)
-                result = {}
-                for ticker, data in moex_data.items():
-                    result[ticker] = data.get('price')
-                return result
-            except Exception as e:
-                logger.error(f"Ошибка получения акций для проверки: {e}")
-                return {}
+        notifications = load_notification_data()
         
-        async def fetch_commodities():
-            try:
-                async def _fetch_commodities():
-                    return await get_commodities_data(session)
-                commodities = await get_cached_data('commodities_check', _fetch_commodities, CACHE_TTL_COMMODITIES)
-                result = {}
-                for key in ['gold', 'silver', 'brent', 'urals']:
-                    if key in commodities:
-                        commodity_info = commodities[key]
-                        result[key] = commodity_info.get('price')
-                        # Уведомления не отправляем, если цена расчетная.
-                        # Для Urals цена всегда расчетная.
-                        note = str(commodity_info.get('note', '')).lower()
-                        name = str(commodity_info.get('name', '')).lower()
-                        is_estimated = (
-                            key == 'urals'
-                            or 'расчет' in note
-                            or 'calculated' in note
-                            or 'расчет' in name
-                            or 'calculated' in name
-                        )
-                        if is_estimated:
-                            estimated_assets.add(key)
-                return result
-            except Exception as e:
-                logger.error(f"Ошибка получения товаров для проверки: {e}")
-                return {}
+        # Запрашиваем только источники активов, нужных подписчикам (None — всех)
+        demand = demanded_assets(notifications)
+        if demand is not None and not demand:
+            logger.debug("Нет активных подписчиков, проверка цен пропущена")
+            return
         
-        # Параллельный запрос данных
-        currencies, crypto, stocks, commodities = await asyncio.gather(
-            fetch_cbr(), fetch_crypto(), fetch_stocks(), fetch_commodities(),
-            return_exceptions=True
-        )
+        session = await get_http_session()
         
-        if not isinstance(currencies, Exception):
-            current_prices.update(currencies)
-        if not isinstance(crypto, Exception):
-            current_prices.update(crypto)
-        if not isinstance(stocks, Exception):
-            current_prices.update(stocks)
-        if not isinstance(commodities, Exception):
-            current_prices.update(commodities)
+        # Тот же снимок и кэш, что и у /rates: расчетные цены помечены в самом снимке
+        sources = plan_sources(demand)
+        snapshot = await get_market_snapshot(session, sources)
+        # Цены всех запрошенных сейчас категорий (не только избранного) — для истории
+        fetched_prices = {
+            k: v for k, v in snapshot.alert_prices().items()
+            if snapshot.quote(k) is not None and snapshot.quote(k).category in sources
+        }
+        current_prices = fetched_prices
+        if demand is not None:
+            current_prices = {k: v for k, v in current_prices.items() if k in demand}
+        estimated_assets = snapshot.estimated_assets()
         
-        # Загружаем предыдущие цены
+        # Загружаем предыдущие цены; устаревшие (актив давно не запрашивался) не сравниваем
         price_history = load_price_history()
-        notifications = load_notification_data()
+        # Полтора интервала: запас на задержку запуска задачи
+        previous_prices = recent_price_history(price_history, PRICE_CHECK_INTERVAL * 1.5)
+        
+        # Считаем уведомления (шардами в пуле процессов для больших баз подписчиков)
+        batches = await evaluate_notifications(
+            notifications, current_prices, previous_prices, estimated_assets,
+            shard_count=ALERT_SHARDS,
+            min_subscribers_for_sharding=ALERT_SHARD_MIN_SUBSCRIBERS
+        )
         
-        # Проверяем изменения и отправляем уведомления
-        for user_id, user_notifications in notifications.items():
-            if not user_notifications.get('subscribed', False):
-                continue
-            
-            threshold = user_notifications.get('threshold', DEFAULT_THRESHOLD)
-            alerts = user_notifications.get('alerts', {})
-            
-            notifications_to_send = []
-            
-            # Проверяем резкие изменения
-            for asset, current_price in current_prices.items():
-                if current_price is None:
-                    continue
-                if asset in estimated_assets:
-                    continue
-                
-                previous_price = price_history.get(asset)
-                if previous_price is None:
-                    continue
-                
-                change_pct = ((current_price - previous_price) / previous_price) * 100
-                
-                if abs(change_pct) >= threshold:
-                    emoji = "📈" if change_pct > 0 else "📉"
-                    asset_name = escape_html(str(asset))
-                    notifications_to_send.append(
-                        f"{emoji} <b>{asset_name}</b>: {change_pct:+.2f}% за 30 мин "
-                        f"({previous_price:.2f} → {current_price:.2f})"
-                    )
-            
-            # Проверяем пороговые алерты
-            for asset, alert_threshold in alerts.items():
-                current_price = current_prices.get(asset)
-                if current_price is None:
-                    continue
-                if asset in estimated_assets:
-                    continue
-
-                # Отправляем алерт только при пересечении порога снизу вверх,
-                # чтобы избежать повторного спама в каждом цикле.
-                previous_price = price_history.get(asset)
-                crossed_up = (
-                    previous_price is not None
-                    and previous_price < alert_threshold <= current_price
+        # Отправляем уведомления
+        for user_id, message in batches:
+            try:
+                await context.bot.send_message(
+                    chat_id=int(user_id),
+                    text=message,
+                    parse_mode='HTML'
                 )
-                first_seen_above = previous_price is None and current_price >= alert_threshold
-
-                if crossed_up or first_seen_above:
-                    asset_name = escape_html(str(asset))
-                    notifications_to_send.append(
-                        f"🚨 <b>АЛЕРТ:</b> {asset_name} достиг {current_price:.2f} "
-                        f"(порог: {alert_threshold})"
-                    )
-            
-            # Отправляем уведомления
-            if notifications_to_send:
-                message = "🔔 <b>УВЕДОМЛЕНИЯ О ЦЕНАХ</b>\n\n" + "\n".join(notifications_to_send)
-                try:
-                    await context.bot.send_message(
-                        chat_id=int(user_id),
-                        text=message,
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
         
         # Сохраняем текущие цены как историю
-        price_history.update({k: v for k, v in current_prices.items() if v is not None})
+        record_price_history(price_history, fetched_prices)
         save_price_history(price_history)
         
     except Exception as e:
@@ -1617,7 +1586,7 @@ async def set_daily_time_command(update: Update, context: ContextTypes.DEFAULT_T
                 
                 # Создаем новую задачу
                 job_queue.run_daily(
-                    daily_summary_job,
+                    leader_only(daily_summary_job),
                     time=daily_time,
                     name="daily_summary"
                 )
@@ -1770,7 +1739,7 @@ async def restart_daily_job_command(update: Update, context: ContextTypes.DEFAUL
         
         # Создаем новую задачу
         job_queue.run_daily(
-            daily_summary_job,
+            leader_only(daily_summary_job),
             time=daily_time,
             name="daily_summary"
         )
@@ -1845,6 +1814,8 @@ class AlternativeJobQueue:
         logger.info(f"📅 Настраиваю альтернативную ежедневную задачу '{name}' на {time_str}")
         
         if SCHEDULE_AVAILABLE:
+            import schedule
+            
             # Удаляем предыдущие schedule задачи
             schedule.clear(name)
             
@@ -2007,6 +1978,7 @@ class AlternativeJobQueue:
             return
             
         import time as time_module
+        import schedule
         
         logger.info("🔄 Альтернативный планировщик задач запущен")
         while self.running:
@@ -2096,8 +2068,11 @@ def main() -> None:
     # Загружаем данные пользователей при старте
     load_user_data()
     
+    # Координация экземпляров: задачи по расписанию выполняет только лидер
+    configure_coordination(COORDINATION_BACKEND, COORDINATION_LEASE_FILE, LEADER_LEASE_TTL)
+    
     # Создаем приложение с явно включенным JobQueue
-    application = Application.builder().token(BOT_TOKEN).post_init(setup_bot_commands).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(on_startup).post_shutdown(on_shutdown).build()
     
     # Проверяем доступность JobQueue и выводим детальную диагностику
     job_queue = application.job_queue
@@ -2161,8 +2136,8 @@ def main() -> None:
         # Сохраняем успешную JobQueue в глобальную переменную
         GLOBAL_JOB_QUEUE = job_queue
 
-    # Даем модулю автопокупки доступ к общей очереди задач.
-    configure_autobuy(get_job_queue)
+    # Даем модулю автопокупки доступ к общей очереди задач и пулу HTTP соединений.
+    configure_autobuy(get_job_queue, get_http_session)
 
     # JobQueue уже получен выше в диагностике
 
@@ -2177,11 +2152,14 @@ def main() -> None:
     application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     application.add_handler(CommandHandler("set_alert", set_alert_command))
     application.add_handler(CommandHandler("view_alerts", view_alerts_command))
+    application.add_handler(CommandHandler("watchlist", watchlist_command))
+    application.add_handler(CommandHandler("chart", chart_command))
     application.add_handler(CommandHandler("test_daily", test_daily_command))
     application.add_handler(CommandHandler("check_subscribers", check_subscribers_command))
     application.add_handler(CommandHandler("set_daily_time", set_daily_time_command))
     application.add_handler(CommandHandler("get_daily_settings", get_daily_settings_command))
     application.add_handler(CommandHandler("restart_daily_job", restart_daily_job_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
     
     # Новые команды
     application.add_handler(CommandHandler("settings", settings_command))
@@ -2205,13 +2183,35 @@ def main() -> None:
         logger.info(f"🔧 Используется система задач: {type(job_queue).__name__}")
         # Проверка изменений цен каждые 30 минут
         job_queue.run_repeating(
-            check_price_changes,
-            interval=1800,  # 30 минут в секундах
+            leader_only(check_price_changes),
+            interval=PRICE_CHECK_INTERVAL,
             first=60,  # Первый запуск через 1 минуту
             name="price_changes_check"
         )
         logger.info("⏰ Настроена проверка изменений цен каждые 30 минут")
         
+        # Периодическое сохранение снимка рынка (для быстрого старта после рестарта)
+        job_queue.run_repeating(
+            leader_only(persist_market_snapshot_job),
+            interval=MARKET_SNAPSHOT_PERSIST_INTERVAL,
+            first=MARKET_SNAPSHOT_PERSIST_INTERVAL,
+            name="market_snapshot_persist"
+        )
+        
+        # История свечей MOEX: догрузка из ISS и запись живых свечей на диск
+        job_queue.run_repeating(
+            leader_only(backfill_candles_job),
+            interval=CANDLES_BACKFILL_INTERVAL,
+            first=120,
+            name="candles_backfill"
+        )
+        job_queue.run_repeating(
+            leader_only(flush_candles_job),
+            interval=CANDLES_FLUSH_INTERVAL,
+            first=CANDLES_FLUSH_INTERVAL,
+            name="candles_flush"
+        )
+        
         # Ежедневная сводка - время из настроек
         settings = load_bot_settings()
         daily_time_str = settings.get('daily_summary_time', '09:00')
@@ -2230,7 +2230,7 @@ def main() -> None:
             logger.info(f"📅 Настраиваю ежедневную сводку на: {daily_time_str} МСК (из настроек)")
             
             job_queue.run_daily(
-                daily_summary_job,
+                leader_only(daily_summary_job),
                 time=daily_time,
                 name="daily_summary"
             )
@@ -2254,7 +2254,7 @@ def main() -> None:
             moscow_tz = pytz.timezone('Europe/Moscow')
             daily_time = time(hour=9, minute=0, tzinfo=moscow_tz)
             job_queue.run_daily(
-                daily_summary_job,
+                leader_only(daily_summary_job),
                 time=daily_time,
                 name="daily_summary"
             )
@@ -2269,7 +2269,29 @@ def main() -> None:
     logger.info("📊 Доступные функции: курсы валют, криптовалют, акций, товаров, индексов")
     logger.info("🔔 Уведомления: резкие изменения, пороговые алерты, ежедневная сводка")
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            raise ValueError("Для BOT_MODE=webhook необходимо установить WEBHOOK_URL")
+        secret_token = WEBHOOK_SECRET
+        if not secret_token:
+            import secrets
+            secret_token = secrets.token_urlsafe(32)
+            logger.warning("⚠️ WEBHOOK_SECRET не задан - сгенерирован случайный секрет (только для одного экземпляра)")
+        logger.info("🌐 Режим получения обновлений: webhook")
+        # aiohttp.web нужен только в режиме webhook
+        from webhook_server import run_webhook
+        asyncio.run(run_webhook(
+            application,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=secret_token,
+            allowed_updates=ALLOWED_UPDATES
+        ))
+    else:
+        logger.info("🔄 Режим получения обновлений: polling")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Меню настроек бота"""
@@ -2328,6 +2350,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif query.data == "subscribe":
         await subscribe_command(update, context)
         return
+    elif query.data.startswith("fav_"):
+        await watchlist_callback(update, context)
+        return
     
     # Проверяем права администратора для админских функций
     if not is_admin(user_id):
@@ -2438,19 +2463,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
     
     elif query.data == "settings_favorites":
-        message = """
-⭐ **ИЗБРАННЫЕ АКТИВЫ**
-
-Эта функция находится в разработке.
-
-Планируется:
-• Сохранение любимых активов
-• Быстрый доступ к избранному
-• Персональные дашборды
-"""
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="settings_back")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
+        message, reply_markup = build_watchlist_menu(user_id)
+        await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
     
     elif query.data == "settings_personal":
         message = """
@@ -2490,343 +2504,37 @@ async def export_pdf_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text("📊 Создаю красивый PDF отчет...")
     
     try:
-        # Создаем PDF в памяти
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        story = []
-        
-        # Создаем стили с поддержкой русского языка
-        styles = getSampleStyleSheet()
-        
-        # Стиль для заголовка
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=20,
-            alignment=1,  # Центр
-            textColor=colors.darkblue,
-            fontName='Helvetica-Bold',
-            encoding='utf-8'
-        )
-        
-        # Стиль для подзаголовков
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=12,
-            spaceAfter=10,
-            spaceBefore=15,
-            textColor=colors.darkgreen,
-            fontName='Helvetica-Bold',
-            encoding='utf-8'
-        )
-        
-        # Стиль для обычного текста
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=9,
-            spaceAfter=5,
-            fontName='Helvetica',
-            encoding='utf-8'
-        )
-        
-        # Стиль для информации
-        info_style = ParagraphStyle(
-            'CustomInfo',
-            parent=styles['Normal'],
-            fontSize=8,
-            spaceAfter=3,
-            textColor=colors.grey,
-            fontName='Helvetica',
-            encoding='utf-8'
-        )
-        
-        # Заголовок отчета
-        current_time = get_moscow_time().strftime("%d.%m.%Y %H:%M")
-        title = Paragraph(f"<b>FINANCIAL REPORT</b><br/>from {current_time}", title_style)
-        story.append(title)
-        
-        # Информация о боте
-        bot_info = Paragraph(
-            "Financial Bot - current data on currencies, cryptocurrencies, stocks and indices", 
-            info_style
-        )
-        story.append(bot_info)
-        story.append(Spacer(1, 20))
-        
-        # Получаем данные
+        # Получаем данные (через общий кэш)
         await update.message.reply_text("📡 Получаю актуальные данные...")
         
         session = await get_http_session()
+        market = await get_market_snapshot(session)
         
-        # Получаем все данные параллельно
-        try:
-            cbr_data, forex_data, fetched_crypto_data, stocks_data, commodities_data, indices_data = await asyncio.gather(
-                get_cbr_rates(session),
-                get_forex_rates(session),
-                get_crypto_data(session),
-                get_moex_stocks(session),
-                get_commodities_data(session),
-                get_indices_data(session),
-                return_exceptions=True
-            )
-            
-            # Обрабатываем валюты из ЦБ РФ
-            if isinstance(cbr_data, Exception):
-                usd_rate = eur_rate = cny_rate = 0
-            else:
-                usd_rate = cbr_data.get('Valute', {}).get('USD', {}).get('Value', 0)
-                eur_rate = cbr_data.get('Valute', {}).get('EUR', {}).get('Value', 0)
-                cny_rate = cbr_data.get('Valute', {}).get('CNY', {}).get('Value', 0)
-            
-            # Обрабатываем FOREX курс
-            if isinstance(forex_data, Exception):
-                forex_usd_rub = None
-            else:
-                forex_usd_rub = forex_data.get('rates', {}).get('RUB', None)
-            
-            # Обрабатываем остальные данные
-            if isinstance(fetched_crypto_data, Exception):
-                fetched_crypto_data = {}
-            if isinstance(stocks_data, Exception):
-                stocks_data = {}
-            if isinstance(commodities_data, Exception):
-                commodities_data = {}
-            if isinstance(indices_data, Exception):
-                indices_data = {}
-        except Exception as e:
-            logger.error(f"Ошибка получения данных для PDF: {e}")
-            usd_rate = eur_rate = cny_rate = 0
-            forex_usd_rub = None
-            fetched_crypto_data = {}
-            stocks_data = {}
-            commodities_data = {}
-            indices_data = {}
-        
-        # Создаем разделы отчета
-        
-        # 1. КУРСЫ ВАЛЮТ
-        currencies_heading = Paragraph("<b>CURRENCY RATES</b>", heading_style)
-        story.append(currencies_heading)
-        
-        currency_data = [
-            ['Currency', 'Rate (RUB)', 'Source', 'Status']
-        ]
-        
-        # Добавляем валюты
-        currencies = [
-            ('USD', usd_rate, 'CBR'),
-            ('EUR', eur_rate, 'CBR'),
-            ('CNY', cny_rate, 'CBR')
-        ]
-        
-        for currency, rate, source in currencies:
-            if rate and rate > 0:
-                status = "Active"
-                if currency == 'USD' and forex_usd_rub:
-                    diff = forex_usd_rub - rate
-                    diff_pct = (diff / rate) * 100
-                    status = f"FOREX: {forex_usd_rub:.2f}RUB ({diff:+.2f}, {diff_pct:+.2f}%)"
-            else:
-                status = "No data"
-            
-            currency_data.append([currency, f"{format_price(rate)}", source, status])
-        
-        currency_table = Table(currency_data, colWidths=[1.2*inch, 1.5*inch, 1.2*inch, 2.1*inch])
-        currency_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        story.append(currency_table)
-        story.append(Spacer(1, 15))
-        
-        # 2. КРИПТОВАЛЮТЫ
-        crypto_heading = Paragraph("<b>CRYPTOCURRENCIES</b>", heading_style)
-        story.append(crypto_heading)
-        
-        crypto_names = {
-            'bitcoin': 'Bitcoin',
-            'the-open-network': 'TON',
-            'solana': 'Solana',
-            'tether': 'Tether'
-        }
-        
-        crypto_table_data = [['Cryptocurrency', 'Price (USD)', '24h Change', 'Status']]
-
-        for crypto_id, crypto_name in crypto_names.items():
-            if crypto_id in fetched_crypto_data:
-                price = fetched_crypto_data[crypto_id].get('price', 0)
-                change = fetched_crypto_data[crypto_id].get('change_24h', 0)
-                
-                if price and price > 0:
-                    change_str = f"{change:+.2f}%" if change is not None else "N/A"
-                    if change and change > 0:
-                        status = "Up"
-                    elif change and change < 0:
-                        status = "Down"
-                    else:
-                        status = "No change"
-                    
-                    crypto_table_data.append([crypto_name, f"${format_price(price)}", change_str, status])
-        
-        if len(crypto_table_data) > 1:  # Есть данные
-            crypto_table = Table(crypto_table_data, colWidths=[1.5*inch, 1.5*inch, 1.2*inch, 1.8*inch])
-            crypto_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ]))
-            story.append(crypto_table)
-        else:
-            no_data = Paragraph("Cryptocurrency data temporarily unavailable", normal_style)
-            story.append(no_data)
-        
-        story.append(Spacer(1, 15))
+        # Собираем сериализуемый снимок для рабочего процесса
+        current_time = get_moscow_time().strftime("%d.%m.%Y %H:%M")
+        snapshot = market.to_report_dict(current_time)
         
-        # 3. ФОНДОВЫЕ ИНДЕКСЫ
-        if indices_data:
-            indices_heading = Paragraph("<b>STOCK INDICES</b>", heading_style)
-            story.append(indices_heading)
-            
-            indices_data_table = [['Index', 'Value', 'Change', 'Status']]
-            
-            for index_id, index_info in indices_data.items():
-                name = index_info.get('name', index_id.upper())
-                price = index_info.get('price', 0)
-                change = index_info.get('change_pct', 0)
-                is_live = index_info.get('is_live', True)
-                
-                if price and price > 0:
-                    change_str = f"{change:+.2f}%" if change != 0 else "0.00%"
-                    if is_live:
-                        status = "Trading open"
-                    else:
-                        status = "Trading closed"
-                    
-                    indices_data_table.append([name, str(price), change_str, status])
-            
-            if len(indices_data_table) > 1:
-                indices_table = Table(indices_data_table, colWidths=[1.5*inch, 1.5*inch, 1.2*inch, 1.8*inch])
-                indices_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 9),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightcoral),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                story.append(indices_table)
-        
-        story.append(Spacer(1, 15))
-        
-        # 4. ДРАГОЦЕННЫЕ МЕТАЛЛЫ
-        if commodities_data:
-            metals_heading = Paragraph("<b>PRECIOUS METALS</b>", heading_style)
-            story.append(metals_heading)
-            
-            metals_data = [['Metal', 'Price (USD)', 'Price (RUB)', 'Status']]
-            
-            metals = {
-                'gold': ('Gold', 'XAU'),
-                'silver': ('Silver', 'XAG')
-            }
-            
-            for metal_id, (metal_name, symbol) in metals.items():
-                if metal_id in commodities_data:
-                    price_usd = commodities_data[metal_id]['price']
-                    price_rub = price_usd * usd_rate if usd_rate > 0 else 0
-                    
-                    if price_usd and price_usd > 0:
-                        metals_data.append([
-                            metal_name,
-                            f"${format_price(price_usd)}",
-                            f"{format_price(price_rub)} RUB",
-                            "Active"
-                        ])
-            
-            if len(metals_data) > 1:
-                metals_table = Table(metals_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1.5*inch])
-                metals_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.darkgoldenrod),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 9),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightyellow),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                story.append(metals_table)
-        
-        story.append(Spacer(1, 20))
-        
-        # 5. ИСТОЧНИКИ ДАННЫХ
-        sources_heading = Paragraph("<b>DATA SOURCES</b>", heading_style)
-        story.append(sources_heading)
-        
-        sources_data = [
-            ['Source', 'Data', 'Status'],
-            ['CBR', 'Currency rates', 'Active'],
-            ['CoinGecko', 'Cryptocurrencies', 'Active'],
-            ['MOEX', 'Russian indices and stocks', 'Active'],
-            ['Gold-API', 'Precious metals', 'Active'],
-            ['Alpha Vantage', 'International data', 'Demo key'],
-            ['FOREX', 'Interbank rates', 'Active']
-        ]
+        # Рендерим в пуле процессов; одинаковый снимок в пределах TTL берется из кэша
+        async def _render():
+            loop = asyncio.get_running_loop()
+            pdf_bytes = await loop.run_in_executor(get_pdf_executor(PDF_RENDER_WORKERS), build_pdf_report, snapshot)
+            return {'bytes': pdf_bytes, 'generated_at': current_time}
         
-        sources_table = Table(sources_data, colWidths=[2*inch, 3*inch, 1*inch])
-        sources_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        story.append(sources_table)
-        
-        story.append(Spacer(1, 20))
-        
-        # 6. ФУТЕР
-        footer_text = f"""
-        <b>Report generated:</b> {current_time}<br/>
-        <b>Financial Bot</b> - your assistant in the world of finance<br/>
-        <i>Data updates in real time</i>
-        """
-        footer = Paragraph(footer_text, info_style)
-        story.append(footer)
-        
-        # Создаем PDF
-        doc.build(story)
-        buffer.seek(0)
-        
-        # Отправляем файл
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=buffer,
-            filename=f"financial_report_{current_time.replace(' ', '_').replace(':', '-')}.pdf",
+        version = snapshot_version(snapshot)
+        report = await get_cached_data(
+            f"pdf_report:{version}", _render, CACHE_TTL_PDF_REPORT, refresh=False
+        )
+        report_time = report['generated_at']
+        
+        # Отправляем файл: отчет по тем же данным повторно уходит по file_id без загрузки.
+        # Ключ — версия данных, а не хэш байтов: в PDF есть время генерации
+        await send_cached_media(
+            context.bot,
+            'document',
+            update.effective_chat.id,
+            report['bytes'],
+            filename=f"financial_report_{report_time.replace(' ', '_').replace(':', '-')}.pdf",
+            cache_key=f"pdf_report:{version}",
             caption="📊 Your beautiful financial report is ready! 🎨"
         )
         
@@ -2836,6 +2544,66 @@ async def export_pdf_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logger.error(f"Ошибка создания PDF: {e}")
         await update.message.reply_text(f"❌ Ошибка создания PDF: {str(e)}")
 
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показать метрики бота и последние блокировки event loop (только для админа)"""
+    user_id = update.effective_user.id
+    
+    # Проверяем права администратора
+    if not is_admin(user_id):
+        await update.message.reply_text("🚫 Команда доступна только администратору")
+        return
+    
+    metrics = get_metrics()
+    lines = ["📈 <b>МЕТРИКИ БОТА</b>\n"]
+    if metrics:
+        for name in sorted(metrics):
+            lines.append(f"• <code>{escape_html(name)}</code>: {metrics[name]:g}")
+    else:
+        lines.append("Метрик пока нет")
+    
+    events = monitoring.loop_monitor.get_recent_events() if monitoring.loop_monitor else []
+    if events:
+        lines.append("\n🐢 <b>Последние блокировки event loop:</b>")
+        for event in events[-5:]:
+            happened_at = datetime.fromtimestamp(event['timestamp'], pytz.timezone(DEFAULT_TIMEZONE))
+            lines.append(
+                f"• {happened_at.strftime('%H:%M:%S')} — {event['stalled_ms']:.0f} мс\n"
+                f"  <code>{escape_html(event['location'])}</code>"
+            )
+    
+    await update.message.reply_html("\n".join(lines))
+
+async def on_startup(application):
+    """Действия после инициализации приложения"""
+    global _prewarm_task
+    start_cache_ticker()
+    if restore_market_snapshot():
+        _prewarm_task = asyncio.create_task(prewarm_market_snapshot())
+    await setup_bot_commands(application)
+    start_loop_monitor(LOOP_LAG_CHECK_INTERVAL, LOOP_LAG_THRESHOLD)
+    start_latency_monitor(PING_TARGETS, LATENCY_PROBE_INTERVAL, LATENCY_WINDOW_SAMPLES)
+    if coordination.leader_elector:
+        await coordination.leader_elector.renew_once()
+        coordination.leader_elector.start()
+
+async def on_shutdown(application):
+    """Действия при остановке приложения"""
+    # Снимок и ряды свечей в общих файлах пишет только лидер,
+    # иначе экземпляры перезаписывают друг друга
+    if coordination.is_leader():
+        persist_market_snapshot()
+        candle_store.flush()
+    stop_cache_ticker()
+    if monitoring.loop_monitor:
+        monitoring.loop_monitor.stop()
+    if latency_monitor.latency_monitor:
+        latency_monitor.latency_monitor.stop()
+    shutdown_pdf_executor()
+    shutdown_chart_executor()
+    shutdown_alert_executor()
+    if coordination.leader_elector:
+        await coordination.leader_elector.stop()
+
 async def setup_bot_commands(application):
     """Настройка команд бота для автодополнения в Telegram"""
     from telegram import BotCommand
@@ -2850,6 +2618,8 @@ async def setup_bot_commands(application):
         BotCommand("unsubscribe", "Отписаться от уведомлений"),
         BotCommand("set_alert", "Установить алерт"),
         BotCommand("view_alerts", "Просмотр алертов"),
+        BotCommand("watchlist", "Избранные активы"),
+        BotCommand("chart", "График цены"),
         BotCommand("settings", "Меню настроек"),
         BotCommand("export_pdf", "Экспорт в PDF"),
         BotCommand("autobuy_status", "Статус автопокупки"),
@@ -2891,6 +2661,7 @@ async def command_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE
             "/restart_daily_job - Перезапустить сводку",
             "/test_daily - Тест сводки",
             "/check_subscribers - Проверить подписчиков",
+            "/metrics - Метрики бота",
             "/autobuy_on [HH:MM] - Включить автопокупку",
             "/autobuy_off - Выключить автопокупку SBER",
             "/autobuy_status - Статус автопокупки",
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Вычисление уведомлений о ценах для подписчиков.
+Подписчики делятся на шарды по user_id, шарды считаются в пуле процессов.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import DEFAULT_THRESHOLD
+from utils import escape_html
+
+logger = logging.getLogger(__name__)
+
+_alert_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_alert_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Получить (или создать) пул процессов для расчета уведомлений"""
+    global _alert_executor
+    if _alert_executor is None:
+        _alert_executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _alert_executor
+
+
+def shutdown_alert_executor() -> None:
+    """Остановить пул процессов расчета уведомлений"""
+    global _alert_executor
+    if _alert_executor is not None:
+        _alert_executor.shutdown(wait=False, cancel_futures=True)
+        _alert_executor = None
+
+
+def build_user_notifications(
+    user_notifications: Dict[str, Any],
+    current_prices: Dict[str, Optional[float]],
+    price_history: Dict[str, float],
+    estimated_assets: Iterable[str],
+) -> List[str]:
+    """
+    Сформировать строки уведомлений для одного подписчика
+
+    Args:
+        user_notifications: Настройки подписчика из notifications.json
+        current_prices: Текущие цены по активам
+        price_history: Цены предыдущей проверки
+        estimated_assets: Активы с расчетной ценой (по ним не уведомляем)
+
+    Returns:
+        Список строк уведомлений (пустой, если уведомлять не о чем)
+    """
+    threshold = user_notifications.get('threshold', DEFAULT_THRESHOLD)
+    alerts = user_notifications.get('alerts', {})
+    # Резкие изменения — только по избранному, если оно задано
+    watchlist = set(user_notifications.get('watchlist') or ())
+
+    notifications_to_send = []
+
+    # Проверяем резкие изменения
+    for asset, current_price in current_prices.items():
+        if current_price is None:
+            continue
+        if watchlist and asset not in watchlist:
+            continue
+        if asset in estimated_assets:
+            continue
+
+        previous_price = price_history.get(asset)
+        if previous_price is None:
+            continue
+
+        change_pct = ((current_price - previous_price) / previous_price) * 100
+
+        if abs(change_pct) >= threshold:
+            emoji = "📈" if change_pct > 0 else "📉"
+            asset_name = escape_html(str(asset))
+            notifications_to_send.append(
+                f"{emoji} <b>{asset_name}</b>: {change_pct:+.2f}% за 30 мин "
+                f"({previous_price:.2f} → {current_price:.2f})"
+            )
+
+    # Проверяем пороговые алерты
+    for asset, alert_threshold in alerts.items():
+        current_price = current_prices.get(asset)
+        if current_price is None:
+            continue
+        if asset in estimated_assets:
+            continue
+
+        # Отправляем алерт только при пересечении порога снизу вверх,
+        # чтобы избежать повторного спама в каждом цикле.
+        previous_price = price_history.get(asset)
+        crossed_up = (
+            previous_price is not None
+            and previous_price < alert_threshold <= current_price
+        )
+        first_seen_above = previous_price is None and current_price >= alert_threshold
+
+        if crossed_up or first_seen_above:
+            asset_name = escape_html(str(asset))
+            notifications_to_send.append(
+                f"🚨 <b>АЛЕРТ:</b> {asset_name} достиг {current_price:.2f} "
+                f"(порог: {alert_threshold})"
+            )
+
+    return notifications_to_send
+
+
+def evaluate_shard(
+    subscribers: Dict[str, Dict[str, Any]],
+    current_prices: Dict[str, Optional[float]],
+    price_history: Dict[str, float],
+    estimated_assets: Iterable[str],
+) -> List[Tuple[str, str]]:
+    """
+    Посчитать уведомления для шарда подписчиков (выполняется в рабочем процессе)
+
+    Returns:
+        Список готовых к отправке пар (user_id, текст сообщения)
+    """
+    estimated = set(estimated_assets)
+    batch = []
+    for user_id, user_notifications in subscribers.items():
+        if not user_notifications.get('subscribed', False):
+            continue
+        lines = build_user_notifications(user_notifications, current_prices, price_history, estimated)
+        if lines:
+            batch.append((user_id, "🔔 <b>УВЕДОМЛЕНИЯ О ЦЕНАХ</b>\n\n" + "\n".join(lines)))
+    return batch
+
+
+def shard_subscribers(notifications: Dict[str, Dict[str, Any]], shard_count: int) -> List[Dict[str, Dict[str, Any]]]:
+    """Разбить подписчиков на шарды по user_id (стабильно между запусками)"""
+    shards: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(max(1, shard_count))]
+    for user_id, user_notifications in notifications.items():
+        try:
+            shard_index = int(user_id) % len(shards)
+        except (TypeError, ValueError):
+            shard_index = 0
+        shards[shard_index][user_id] = user_notifications
+    return [shard for shard in shards if shard]
+
+
+async def evaluate_notifications(
+    notifications: Dict[str, Dict[str, Any]],
+    current_prices: Dict[str, Optional[float]],
+    price_history: Dict[str, float],
+    estimated_assets: Iterable[str],
+    shard_count: int,
+    min_subscribers_for_sharding: int,
+) -> List[Tuple[str, str]]:
+    """
+    Посчитать уведомления для всех подписчиков
+
+    Небольшие базы считаются прямо в event loop: накладные расходы на передачу
+    данных в процессы для них больше самого расчета.
+    """
+    estimated = sorted(estimated_assets)
+    if shard_count <= 1 or len(notifications) < min_subscribers_for_sharding:
+        return evaluate_shard(notifications, current_prices, price_history, estimated)
+
+    loop = asyncio.get_running_loop()
+    executor = get_alert_executor(shard_count)
+    shards = shard_subscribers(notifications, shard_count)
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, evaluate_shard, shard, current_prices, price_history, estimated)
+            for shard in shards
+        ),
+        return_exceptions=True
+    )
+
+    batches: List[Tuple[str, str]] = []
+    for shard, result in zip(shards, results):
+        if isinstance(result, Exception):
+            # Шард не посчитался в процессе — считаем его локально, чтобы не потерять уведомления
+            logger.error(f"Ошибка расчета шарда уведомлений ({len(shard)} подписчиков): {result}")
+            result = evaluate_shard(shard, current_prices, price_history, estimated)
+        batches.extend(result)
+    return batches
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Единый реестр активов.
+Каждый актив получает плотный целочисленный ID и символы провайдеров
+(CoinGecko, T-Invest, MOEX ISS и т.д.). Источники данных, снимок рынка,
+уведомления и рендеры берут списки активов отсюда, а не из своих таблиц.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    CURRENCY_ASSETS, CRYPTO_ASSETS, STOCK_ASSETS, COMMODITY_ASSETS, INDEX_ASSETS
+)
+
+# Поля описания актива, которые не являются символами провайдеров
+_ASSET_FIELDS = ('key', 'name', 'emoji', 'decimals', 'section')
+
+
+class Asset:
+    """Описание актива в реестре"""
+
+    __slots__ = ('id', 'key', 'category', 'name', 'emoji', 'decimals', 'section', 'symbols')
+
+    def __init__(
+        self,
+        asset_id: int,
+        key: str,
+        category: str,
+        name: str,
+        emoji: str = '',
+        decimals: int = 2,
+        section: str = '',
+        symbols: Optional[Dict[str, str]] = None,
+    ):
+        self.id = asset_id
+        self.key = key
+        self.category = category
+        self.name = name
+        self.emoji = emoji
+        self.decimals = decimals
+        self.section = section or category
+        self.symbols = dict(symbols or {})
+
+    def symbol(self, provider: str) -> Optional[str]:
+        return self.symbols.get(provider)
+
+    def __repr__(self) -> str:
+        return f"Asset({self.id}, {self.key!r}, {self.category!r})"
+
+
+class AssetRegistry:
+    """Реестр активов: ключ -> Asset, (провайдер, символ) -> Asset, ID по порядку регистрации"""
+
+    def __init__(self):
+        self._assets: List[Asset] = []
+        self._by_key: Dict[str, Asset] = {}
+        self._by_symbol: Dict[Tuple[str, str], Asset] = {}
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def __iter__(self) -> Iterator[Asset]:
+        return iter(self._assets)
+
+    def register(
+        self,
+        key: str,
+        category: str,
+        name: Optional[str] = None,
+        emoji: str = '',
+        decimals: int = 2,
+        section: str = '',
+        **symbols: str,
+    ) -> Asset:
+        """
+        Зарегистрировать актив (повторная регистрация возвращает существующий)
+
+        Args:
+            key: Ключ актива (используется в алертах и истории цен)
+            category: currencies, crypto, stocks, commodities или indices
+            symbols: Символы провайдеров, например coingecko='bitcoin'
+        """
+        asset = self._by_key.get(key)
+        if asset is None:
+            asset = Asset(len(self._assets), key, category, name or key, emoji, decimals, section, symbols)
+            self._assets.append(asset)
+            self._by_key[key] = asset
+        else:
+            asset.symbols.update(symbols)
+        for provider, symbol in symbols.items():
+            self._by_symbol[(provider, symbol)] = asset
+        return asset
+
+    def get(self, key: str) -> Optional[Asset]:
+        return self._by_key.get(key)
+
+    def resolve(self, text: str) -> Optional[Asset]:
+        """Найти актив по пользовательскому вводу без учета регистра (btc, SBER, Gold)"""
+        asset = self._by_key.get(text)
+        if asset is not None:
+            return asset
+        lowered = text.strip().lower()
+        for asset in self._assets:
+            if asset.key.lower() == lowered:
+                return asset
+        return None
+
+    def id_of(self, key: str) -> Optional[int]:
+        asset = self._by_key.get(key)
+        return asset.id if asset is not None else None
+
+    def by_id(self, asset_id: int) -> Asset:
+        return self._assets[asset_id]
+
+    def by_symbol(self, provider: str, symbol: str) -> Optional[Asset]:
+        return self._by_symbol.get((provider, symbol))
+
+    def in_category(self, category: str) -> List[Asset]:
+        return [asset for asset in self._assets if asset.category == category]
+
+    def in_section(self, section: str) -> List[Asset]:
+        return [asset for asset in self._assets if asset.section == section]
+
+
+def _register_table(target: AssetRegistry, category: str, table: List[Dict], default_symbols=None) -> None:
+    for item in table:
+        symbols = dict(default_symbols(item['key']) if default_symbols else {})
+        symbols.update({k: v for k, v in item.items() if k not in _ASSET_FIELDS})
+        target.register(
+            item['key'],
+            category,
+            name=item.get('name'),
+            emoji=item.get('emoji', ''),
+            decimals=item.get('decimals', 2),
+            section=item.get('section', ''),
+            **symbols,
+        )
+
+
+def _crypto_symbols(key: str) -> Dict[str, str]:
+    return {'coinbase': f"{key}-USD", 'binance': f"{key}USDT"}
+
+
+def _stock_symbols(key: str) -> Dict[str, str]:
+    return {'tinvest': f"{key}_TQBR", 'moex': key}
+
+
+def build_default_registry() -> AssetRegistry:
+    """Реестр из таблиц активов config.py"""
+    result = AssetRegistry()
+    _register_table(result, 'currencies', CURRENCY_ASSETS)
+    _register_table(result, 'crypto', CRYPTO_ASSETS, _crypto_symbols)
+    _register_table(result, 'stocks', STOCK_ASSETS, _stock_symbols)
+    _register_table(result, 'commodities', COMMODITY_ASSETS)
+    _register_table(result, 'indices', INDEX_ASSETS)
+    return result
+
+
+registry = build_default_registry()
@@ -6,11 +6,13 @@
 Все настройки меняются командами бота, без новых деплоев.
 """
 
+import asyncio
 import json
 import logging
 import os
 import threading
-from datetime import datetime, time
+import time as time_module
+from datetime import datetime, time, timedelta
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
@@ -19,25 +21,62 @@ import pytz
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from config import ADMIN_USER_ID, API_TIMEOUT, DEFAULT_TIMEZONE, TINVEST_API_TOKEN
+from config import (
+    ADMIN_USER_ID, API_TIMEOUT, DEFAULT_TIMEZONE, TINVEST_API_TOKEN,
+    AUTOBUY_ACCOUNT_CACHE_TTL, AUTOBUY_INSTRUMENT_CACHE_TTL, AUTOBUY_MAX_CONCURRENT_ORDERS,
+    AUTOBUY_WARMUP_SECONDS, AUTOBUY_KEEPALIVE_INTERVAL, AUTOBUY_CONNECTIONS_LEAD, TINVEST_REST_BASE,
+    AUTOBUY_PENDING_RETRY_DELAY, AUTOBUY_PENDING_RETRIES
+)
+from coordination import leader_only
 from utils import is_admin
 
 logger = logging.getLogger(__name__)
 
 AUTOBUY_SETTINGS_FILE = "autobuy_settings.json"
+AUTOBUY_INSTRUMENTS_CACHE_FILE = "autobuy_instruments_cache.json"
+AUTOBUY_JOURNAL_FILE = "autobuy_journal.json"
 AUTOBUY_JOB_NAME = "autobuy_daily"
+AUTOBUY_RESUME_JOB_NAME = "autobuy_resume"
+AUTOBUY_WARMUP_JOB_NAME = "autobuy_warmup"
 DEFAULT_AUTOBUY_TIME = "10:00"
 DEFAULT_TIMEZONE_NAME = DEFAULT_TIMEZONE
-_TINVEST_REST_BASE = "https://invest-public-api.tinkoff.ru/rest"
+_TINVEST_REST_BASE = TINVEST_REST_BASE
 
 _settings_lock = threading.RLock()
+_cache_lock = threading.RLock()
+_journal_lock = threading.RLock()
 _get_job_queue_func = None
+_get_http_session_func = None
+_own_session: Optional[aiohttp.ClientSession] = None
 
+# Результат прогрева: счет, инструменты и шаблоны заявок на сегодняшний запуск
+_warm_state: Optional[Dict[str, Any]] = None
+_keepalive_task: Optional[asyncio.Task] = None
 
-def configure_autobuy(get_job_queue_func) -> None:
-    """Подключить функцию получения job_queue из основного приложения."""
-    global _get_job_queue_func
+
+class OrderRejected(RuntimeError):
+    """Брокер однозначно отклонил заявку (4xx): повтор возможен только с новым orderId"""
+
+
+class OrderOutcomeUnknown(RuntimeError):
+    """Ответ на PostOrder не получен или не разобран (5xx, шлюз, битый JSON): заявка могла быть принята"""
+
+
+def configure_autobuy(get_job_queue_func, get_http_session_func=None) -> None:
+    """Подключить функции получения job_queue и общей HTTP сессии из основного приложения."""
+    global _get_job_queue_func, _get_http_session_func
     _get_job_queue_func = get_job_queue_func
+    _get_http_session_func = get_http_session_func
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """Общая сессия бота (пул соединений), либо собственная, если модуль не подключен."""
+    global _own_session
+    if _get_http_session_func:
+        return await _get_http_session_func()
+    if _own_session is None or _own_session.closed:
+        _own_session = aiohttp.ClientSession()
+    return _own_session
 
 
 def _atomic_write_json(file_path: str, data: Dict[str, Any]) -> None:
@@ -133,6 +172,130 @@ def save_autobuy_settings(settings: Dict[str, Any]) -> None:
         _atomic_write_json(AUTOBUY_SETTINGS_FILE, normalized)
 
 
+def _load_lookup_cache() -> Dict[str, Any]:
+    with _cache_lock:
+        if not os.path.exists(AUTOBUY_INSTRUMENTS_CACHE_FILE):
+            return {"account": None, "instruments": {}}
+        try:
+            with open(AUTOBUY_INSTRUMENTS_CACHE_FILE, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения {AUTOBUY_INSTRUMENTS_CACHE_FILE}: {e}")
+            return {"account": None, "instruments": {}}
+    if not isinstance(raw, dict):
+        raw = {}
+    raw.setdefault("account", None)
+    if not isinstance(raw.get("instruments"), dict):
+        raw["instruments"] = {}
+    return raw
+
+
+def _save_lookup_cache(cache: Dict[str, Any]) -> None:
+    try:
+        with _cache_lock:
+            _atomic_write_json(AUTOBUY_INSTRUMENTS_CACHE_FILE, cache)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения {AUTOBUY_INSTRUMENTS_CACHE_FILE}: {e}")
+
+
+# Кэш в памяти поверх файла: файл читается один раз за процесс.
+_lookup_cache: Optional[Dict[str, Any]] = None
+
+
+def _get_lookup_cache() -> Dict[str, Any]:
+    global _lookup_cache
+    if _lookup_cache is None:
+        _lookup_cache = _load_lookup_cache()
+    return _lookup_cache
+
+
+def _is_fresh(entry: Optional[Dict[str, Any]], ttl: float) -> bool:
+    return bool(entry) and time_module.time() - float(entry.get("cached_at", 0)) < ttl
+
+
+def invalidate_instrument_cache(ticker: Optional[str] = None) -> None:
+    """Сбросить кэш инструмента (или весь кэш поиска, если тикер не указан)."""
+    cache = _get_lookup_cache()
+    if ticker is None:
+        cache["account"] = None
+        cache["instruments"] = {}
+    else:
+        cache["instruments"].pop(ticker.upper(), None)
+    _save_lookup_cache(cache)
+
+
+def _durable_write_json(file_path: str, data: Dict[str, Any]) -> None:
+    """Как _atomic_write_json, но с fsync: запись переживает падение процесса и ОС."""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+
+def load_autobuy_journal() -> Dict[str, Any]:
+    """
+    Журнал заявок текущего запуска.
+
+    Формат: {"date": "YYYY-MM-DD", "orders": {ticker: {"order_id", "qty", "state", ...}}},
+    state: pending (orderId записан до отправки), done, failed (ошибка без отказа брокера,
+    повтор с тем же orderId), rejected (отказ 4xx, повтор с новым orderId).
+    """
+    with _journal_lock:
+        if not os.path.exists(AUTOBUY_JOURNAL_FILE):
+            return {"date": None, "orders": {}}
+        try:
+            with open(AUTOBUY_JOURNAL_FILE, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения {AUTOBUY_JOURNAL_FILE}: {e}")
+            return {"date": None, "orders": {}}
+    if not isinstance(raw, dict) or not isinstance(raw.get("orders"), dict):
+        return {"date": None, "orders": {}}
+    return raw
+
+
+def save_autobuy_journal(journal: Dict[str, Any]) -> None:
+    with _journal_lock:
+        _durable_write_json(AUTOBUY_JOURNAL_FILE, journal)
+
+
+def _prepare_journal(today_str: str, orders: List[tuple]) -> Dict[str, Any]:
+    """
+    Записать orderId всех заявок до отправки (write-ahead).
+
+    Заявки сегодняшнего запуска сохраняют свой orderId при любом повторе:
+    T-Invest использует его как ключ идемпотентности, поэтому повторная
+    отправка после перезапуска не приведет к двойной покупке. Новый orderId
+    выдается только после однозначного отказа брокера (state "rejected").
+    """
+    journal = load_autobuy_journal()
+    previous = journal.get("orders", {}) if journal.get("date") == today_str else {}
+
+    entries: Dict[str, Any] = {}
+    for ticker, qty in orders:
+        entry = previous.get(ticker)
+        if entry and entry.get("qty") == qty and entry.get("state") in ("pending", "done"):
+            entries[ticker] = entry
+        elif entry and entry.get("qty") == qty and entry.get("state") == "failed":
+            # Ошибка без отказа брокера: повторяем с тем же orderId
+            entries[ticker] = dict(entry, state="pending")
+        else:
+            entries[ticker] = {"order_id": str(uuid4()), "qty": qty, "state": "pending"}
+
+    journal = {"date": today_str, "orders": entries}
+    save_autobuy_journal(journal)
+    return journal
+
+
+def has_unfinished_journal(today_str: str) -> bool:
+    journal = load_autobuy_journal()
+    return journal.get("date") == today_str and any(
+        entry.get("state") == "pending" for entry in journal["orders"].values()
+    )
+
+
 def _validate_time_format(time_str: str) -> bool:
     try:
         parts = time_str.split(":")
@@ -178,6 +341,23 @@ def _format_rub(value: Optional[float]) -> str:
     return f"{value:,.2f} ₽".replace(",", " ")
 
 
+def _auth_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {TINVEST_API_TOKEN}",
+        "Content-Type": "application/json",
+    }
+
+
+def _collect_orders(positions: List[Dict[str, Any]]) -> List[tuple]:
+    orders = []
+    for pos in positions:
+        ticker = str(pos.get("ticker", "")).upper().strip()
+        qty = int(pos.get("qty", 1))
+        if ticker and qty > 0:
+            orders.append((ticker, qty))
+    return orders
+
+
 async def _get_primary_account_id(session: aiohttp.ClientSession, headers: Dict[str, str]) -> str:
     async with session.post(
         f"{_TINVEST_REST_BASE}/tinkoff.public.invest.api.contract.v1.UsersService/GetAccounts",
@@ -297,39 +477,117 @@ async def _resolve_share_by_ticker(
     for item in candidates:
         figi = item.get("figi")
         if figi:
+            try:
+                lot = int(item.get("lot") or 1)
+            except (TypeError, ValueError):
+                lot = 1
             return {
                 "ticker": ticker_upper,
                 "figi": figi,
+                "uid": item.get("uid"),
                 "name": item.get("name", ticker_upper),
+                "lot": lot,
+                "api_trade_available": bool(item.get("apiTradeAvailableFlag", True)),
             }
 
     raise RuntimeError(f"Для {ticker_upper} не найден FIGI для торгов")
 
 
-async def _place_market_buy(
+async def _get_account_id_cached(
     session: aiohttp.ClientSession,
     headers: Dict[str, str],
-    account_id: str,
-    figi: str,
-    qty: int,
+    force: bool = False,
+) -> str:
+    """ID счета из кэша (TTL AUTOBUY_ACCOUNT_CACHE_TTL), иначе GetAccounts."""
+    cache = _get_lookup_cache()
+    entry = cache.get("account")
+    if not force and _is_fresh(entry, AUTOBUY_ACCOUNT_CACHE_TTL) and entry.get("id"):
+        return entry["id"]
+
+    account_id = await _get_primary_account_id(session, headers)
+    cache["account"] = {"id": account_id, "cached_at": time_module.time()}
+    _save_lookup_cache(cache)
+    return account_id
+
+
+async def _resolve_instruments_cached(
+    session: aiohttp.ClientSession,
+    headers: Dict[str, str],
+    tickers: List[str],
 ) -> Dict[str, Any]:
-    payload = {
+    """
+    Метаданные инструментов (FIGI/UID, лот, флаги торгов) по тикерам.
+
+    Свежие записи берутся из кэша (TTL AUTOBUY_INSTRUMENT_CACHE_TTL),
+    промахи разрешаются параллельно. Ошибка по тикеру возвращается как исключение.
+    """
+    cache = _get_lookup_cache()
+    instruments = cache["instruments"]
+    resolved: Dict[str, Any] = {}
+    misses: List[str] = []
+    for ticker in tickers:
+        entry = instruments.get(ticker)
+        if _is_fresh(entry, AUTOBUY_INSTRUMENT_CACHE_TTL):
+            resolved[ticker] = entry
+        else:
+            misses.append(ticker)
+
+    if misses:
+        lookups = await asyncio.gather(
+            *(_resolve_share_by_ticker(session, headers, ticker) for ticker in misses),
+            return_exceptions=True,
+        )
+        for ticker, result in zip(misses, lookups):
+            if isinstance(result, Exception):
+                resolved[ticker] = result
+                continue
+            result["cached_at"] = time_module.time()
+            instruments[ticker] = result
+            resolved[ticker] = result
+        _save_lookup_cache(cache)
+
+    return resolved
+
+
+def _build_order_payload(account_id: str, figi: str, qty: int, order_id: Optional[str] = None) -> Dict[str, Any]:
+    return {
         "instrumentId": figi,
         "quantity": str(max(1, int(qty))),
         "direction": "ORDER_DIRECTION_BUY",
         "accountId": account_id,
         "orderType": "ORDER_TYPE_MARKET",
-        "orderId": str(uuid4()),
+        "orderId": order_id or str(uuid4()),
     }
+
+
+async def _place_market_buy(
+    session: aiohttp.ClientSession,
+    headers: Dict[str, str],
+    account_id: str,
+    figi: str,
+    qty: int,
+    order_id: Optional[str] = None,
+    payload_template: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    if payload_template is not None:
+        payload = dict(payload_template, orderId=order_id or str(uuid4()))
+    else:
+        payload = _build_order_payload(account_id, figi, qty, order_id)
     async with session.post(
         f"{_TINVEST_REST_BASE}/tinkoff.public.invest.api.contract.v1.OrdersService/PostOrder",
         headers=headers,
         json=payload,
         timeout=API_TIMEOUT,
     ) as resp:
-        body = await _safe_json(resp)
-        if resp.status != 200:
-            raise RuntimeError(f"PostOrder failed ({resp.status}): {str(body)[:500]}")
+        # Принята ли заявка, однозначно говорит только 4xx (отказ) или разобранный 200
+        if 400 <= resp.status < 500:
+            raise OrderRejected(f"PostOrder rejected ({resp.status}): {(await resp.text())[:500]}")
+        try:
+            body = await _safe_json(resp)
+        except ValueError as e:
+            raise OrderOutcomeUnknown(f"PostOrder ({resp.status}): ответ не разобран: {e}") from e
+        if resp.status != 200 or not isinstance(body, dict):
+            raise OrderOutcomeUnknown(f"PostOrder failed ({resp.status}): {str(body)[:500]}")
 
     return {
         "request_order_id": payload["orderId"],
@@ -338,11 +596,151 @@ async def _place_market_buy(
     }
 
 
+async def _touch_tinvest(session: aiohttp.ClientSession, headers: Dict[str, str]) -> None:
+    """Легкий запрос к T-Invest: открывает/поддерживает соединение (DNS, TCP, TLS)."""
+    async with session.post(
+        f"{_TINVEST_REST_BASE}/tinkoff.public.invest.api.contract.v1.UsersService/GetAccounts",
+        headers=headers,
+        json={},
+        timeout=API_TIMEOUT,
+    ) as resp:
+        await resp.read()
+
+
+async def _open_connections(session: aiohttp.ClientSession, headers: Dict[str, str], count: int) -> None:
+    # Параллельные запросы заставляют пул открыть сразу count соединений
+    results = await asyncio.gather(
+        *(_touch_tinvest(session, headers) for _ in range(max(1, count))),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.warning(f"⚠️ Прогрев соединений T-Invest: {len(errors)} ошибок, последняя: {errors[-1]}")
+
+
+async def _keepalive_loop(headers: Dict[str, str], connections: int, until: float) -> None:
+    # Пул aiohttp закрывает простаивающие соединения через 15 секунд. До покупки
+    # раз в интервал держим одно соединение легким запросом, а все connections
+    # открываем одним веером за AUTOBUY_CONNECTIONS_LEAD секунд до покупки:
+    # веер на каждом шаге съедал бы лимит UsersService.
+    fanout_at = until - AUTOBUY_CONNECTIONS_LEAD
+    try:
+        while True:
+            delay = min(AUTOBUY_KEEPALIVE_INTERVAL, fanout_at - time_module.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if _warm_state is None:
+                return
+            session = await _get_session()
+            if time_module.monotonic() >= fanout_at:
+                await _open_connections(session, headers, connections)
+                return
+            try:
+                await _touch_tinvest(session, headers)
+            except Exception as e:
+                logger.debug(f"Keep-alive T-Invest: {e}")
+    except asyncio.CancelledError:
+        pass
+
+
+def _stop_keepalive() -> None:
+    global _keepalive_task
+    if _keepalive_task is not None:
+        _keepalive_task.cancel()
+        _keepalive_task = None
+
+
+def _take_warm_state(today_str: str, orders: List[tuple]) -> Optional[Dict[str, Any]]:
+    """Забрать результат прогрева, если он относится к этому запуску."""
+    global _warm_state
+    state, _warm_state = _warm_state, None
+    _stop_keepalive()
+    if state and state["date"] == today_str and state["orders"] == orders:
+        return state
+    return None
+
+
+async def autobuy_warmup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Прогрев перед автопокупкой: соединения с T-Invest, проверка счета,
+    разрешение инструментов и шаблоны заявок. Сам запуск потом только отправляет заявки.
+    """
+    global _warm_state, _keepalive_task
+
+    settings = load_autobuy_settings()
+    if not settings.get("enabled", False) or not settings.get("positions"):
+        return
+    if not TINVEST_API_TOKEN:
+        logger.warning("⚠️ Прогрев автопокупки пропущен: TINVEST_API_TOKEN не задан")
+        return
+
+    tz = pytz.timezone(settings.get("timezone", DEFAULT_TIMEZONE_NAME))
+    now = datetime.now(tz)
+    today_str = now.date().isoformat()
+    if settings.get("last_run_date") == today_str:
+        return
+    hour, minute = map(int, settings.get("daily_time", DEFAULT_AUTOBUY_TIME).split(":"))
+    run_at = tz.localize(datetime.combine(now.date(), time(hour=hour, minute=minute)))
+    seconds_to_run = max(0.0, (run_at - now).total_seconds())
+
+    started = time_module.monotonic()
+    headers = _auth_headers()
+    orders = _collect_orders(settings["positions"])
+    connections = min(len(orders), max(1, AUTOBUY_MAX_CONCURRENT_ORDERS))
+
+    try:
+        session = await _get_session()
+        # DNS, TCP и TLS до первого запроса; все соединения откроет keep-alive перед покупкой
+        await _touch_tinvest(session, headers)
+        account_id, instruments = await asyncio.gather(
+            _get_account_id_cached(session, headers, force=True),
+            _resolve_instruments_cached(session, headers, [ticker for ticker, _ in orders]),
+        )
+    except Exception as e:
+        logger.error(f"Ошибка прогрева автопокупки: {e}")
+        await context.bot.send_message(chat_id=ADMIN_USER_ID, text=f"⚠️ Прогрев автопокупки не удался: {e}")
+        return
+
+    payloads: Dict[str, Dict[str, Any]] = {}
+    problems: List[str] = []
+    for ticker, qty in orders:
+        instrument = instruments.get(ticker)
+        if isinstance(instrument, Exception):
+            problems.append(f"{ticker}: {instrument}")
+            continue
+        if not instrument.get("api_trade_available", True):
+            problems.append(f"{ticker}: торговля через API недоступна")
+        payloads[ticker] = _build_order_payload(account_id, instrument["figi"], qty)
+
+    _warm_state = {
+        "date": today_str,
+        "orders": orders,
+        "account_id": account_id,
+        "instruments": instruments,
+        "payloads": payloads,
+    }
+    _stop_keepalive()
+    # Соединения держим только до времени покупки
+    _keepalive_task = asyncio.get_running_loop().create_task(
+        _keepalive_loop(headers, connections, started + seconds_to_run)
+    )
+
+    logger.info(
+        f"🔥 Прогрев автопокупки за {time_module.monotonic() - started:.2f}с: "
+        f"{len(payloads)}/{len(orders)} заявок готовы, соединений: {connections}"
+    )
+    if problems:
+        await context.bot.send_message(
+            chat_id=ADMIN_USER_ID,
+            text="⚠️ Прогрев автопокупки: проблемы с инструментами\n" + "\n".join(problems),
+        )
+
+
 def ensure_autobuy_job(job_queue) -> None:
     if not job_queue:
         return
 
-    for job in job_queue.get_jobs_by_name(AUTOBUY_JOB_NAME):
+    for job in job_queue.get_jobs_by_name(AUTOBUY_JOB_NAME) + job_queue.get_jobs_by_name(AUTOBUY_WARMUP_JOB_NAME):
         job.schedule_removal()
 
     settings = load_autobuy_settings()
@@ -364,12 +762,30 @@ def ensure_autobuy_job(job_queue) -> None:
     run_time = time(hour=hour, minute=minute, tzinfo=tz)
 
     job_queue.run_daily(
-        autobuy_job,
+        leader_only(autobuy_job),
         time=run_time,
         name=AUTOBUY_JOB_NAME,
     )
     logger.info(f"✅ Автопокупка запланирована на {time_str} ({tz_name})")
 
+    if AUTOBUY_WARMUP_SECONDS > 0:
+        run_at = datetime.combine(datetime.now(tz).date(), time(hour=hour, minute=minute))
+        # Прогрев не переносится на предыдущие сутки: его результат привязан к дате
+        # запуска, поэтому для покупки вскоре после 00:00 прогрев начинается в 00:00
+        warmup_at = max(run_at - timedelta(seconds=AUTOBUY_WARMUP_SECONDS), datetime.combine(run_at.date(), time()))
+        job_queue.run_daily(
+            leader_only(autobuy_warmup_job),
+            time=time(hour=warmup_at.hour, minute=warmup_at.minute, second=warmup_at.second, tzinfo=tz),
+            name=AUTOBUY_WARMUP_JOB_NAME,
+        )
+
+    # Запуск прервался (падение/рестарт) — дозавершаем его с теми же orderId
+    today_str = datetime.now(tz).date().isoformat()
+    if settings.get("last_run_date") != today_str and has_unfinished_journal(today_str):
+        if not job_queue.get_jobs_by_name(AUTOBUY_RESUME_JOB_NAME):
+            job_queue.run_once(leader_only(autobuy_job), when=5, name=AUTOBUY_RESUME_JOB_NAME)
+            logger.warning("⚠️ Найден незавершенный запуск автопокупки, возобновление через 5 секунд")
+
 
 async def autobuy_job(context: ContextTypes.DEFAULT_TYPE) -> None:
     settings = load_autobuy_settings()
@@ -393,63 +809,131 @@ async def autobuy_job(context: ContextTypes.DEFAULT_TYPE) -> None:
         await context.bot.send_message(chat_id=ADMIN_USER_ID, text=f"❌ Ошибка автопокупки: {err}")
         return
 
-    headers = {
-        "Authorization": f"Bearer {TINVEST_API_TOKEN}",
-        "Content-Type": "application/json",
-    }
+    headers = _auth_headers()
 
     results: List[Dict[str, Any]] = []
 
     try:
-        async with aiohttp.ClientSession() as session:
-            account_id = await _get_primary_account_id(session, headers)
-
-            for pos in positions:
-                ticker = str(pos.get("ticker", "")).upper().strip()
-                qty = int(pos.get("qty", 1))
-                if not ticker or qty <= 0:
-                    continue
-
-                try:
-                    instrument = await _resolve_share_by_ticker(session, headers, ticker)
+        session = await _get_session()
+        orders = _collect_orders(positions)
+
+        journal = _prepare_journal(today_str, orders)
+        journal_orders = journal["orders"]
+
+        warm = _take_warm_state(today_str, orders)
+        if warm:
+            account_id, instruments, payloads = warm["account_id"], warm["instruments"], warm["payloads"]
+        else:
+            # Прогрева не было — счет и инструменты из кэша, промахи разрешаются параллельно
+            account_id, instruments = await asyncio.gather(
+                _get_account_id_cached(session, headers),
+                _resolve_instruments_cached(session, headers, [ticker for ticker, _ in orders]),
+            )
+            payloads = {}
+
+        semaphore = asyncio.Semaphore(max(1, AUTOBUY_MAX_CONCURRENT_ORDERS))
+
+        async def submit(ticker: str, qty: int) -> Dict[str, Any]:
+            entry = journal_orders[ticker]
+            if entry.get("state") == "done":
+                # Заявка принята до перезапуска — повторно не отправляем
+                return {
+                    "ticker": ticker,
+                    "qty": qty,
+                    "ok": True,
+                    "order_id": entry.get("response_order_id") or entry["order_id"],
+                    "status": entry.get("status"),
+                }
+            submitted = False
+            try:
+                instrument = instruments.get(ticker)
+                if isinstance(instrument, Exception):
+                    raise instrument
+                async with semaphore:
+                    submitted = True
                     order_result = await _place_market_buy(
                         session=session,
                         headers=headers,
                         account_id=account_id,
                         figi=instrument["figi"],
                         qty=qty,
+                        order_id=entry["order_id"],
+                        payload_template=payloads.get(ticker),
                     )
-                    results.append(
-                        {
-                            "ticker": ticker,
-                            "qty": qty,
-                            "ok": True,
-                            "order_id": order_result.get("response_order_id") or order_result.get("request_order_id"),
-                            "status": order_result.get("execution_report_status"),
-                        }
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка покупки {ticker}: {e}")
-                    results.append({"ticker": ticker, "qty": qty, "ok": False, "error": str(e)})
+                entry.update(
+                    state="done",
+                    response_order_id=order_result.get("response_order_id"),
+                    status=order_result.get("execution_report_status"),
+                )
+                entry.pop("error", None)
+                # Фиксируем исполнение сразу: падение до конца запуска не приведет к повтору
+                save_autobuy_journal(journal)
+                return {
+                    "ticker": ticker,
+                    "qty": qty,
+                    "ok": True,
+                    "order_id": order_result.get("response_order_id") or order_result.get("request_order_id"),
+                    "status": order_result.get("execution_report_status"),
+                }
+            except Exception as e:
+                logger.error(f"Ошибка покупки {ticker}: {e}")
+                # Метаданные могли устареть (делистинг, смена FIGI) — перезапросим в следующий раз
+                invalidate_instrument_cache(ticker)
+                # Обрыв сети, 5xx или неразобранный ответ после отправки: заявка могла
+                # дойти до брокера, оставляем ее pending, чтобы повтор ушел с тем же orderId
+                lost_in_flight = submitted and isinstance(
+                    e, (aiohttp.ClientError, asyncio.TimeoutError, OrderOutcomeUnknown)
+                )
+                if lost_in_flight:
+                    entry.update(state="pending", error=str(e), attempts=entry.get("attempts", 0) + 1)
+                elif isinstance(e, OrderRejected):
+                    entry.update(state="rejected", error=str(e))
+                else:
+                    entry.update(state="failed", error=str(e))
+                save_autobuy_journal(journal)
+                return {"ticker": ticker, "qty": qty, "ok": False, "pending": lost_in_flight, "error": str(e)}
+
+        results = list(await asyncio.gather(*(submit(ticker, qty) for ticker, qty in orders)))
 
-        settings["last_run_date"] = today_str
+        success = [r for r in results if r.get("ok")]
+        pending = [r for r in results if r.get("pending")]
+        failed = [r for r in results if not r.get("ok") and not r.get("pending")]
+
+        # Пока есть заявки в неизвестном состоянии, запуск не считается выполненным:
+        # повтор отправит их с теми же orderId (брокер не исполнит заявку дважды)
+        retry_scheduled = False
+        if pending:
+            attempts = max(journal_orders[r["ticker"]].get("attempts", 0) for r in pending)
+            job_queue = _resolve_job_queue(context)
+            if job_queue and attempts <= AUTOBUY_PENDING_RETRIES:
+                job_queue.run_once(
+                    leader_only(autobuy_job), when=AUTOBUY_PENDING_RETRY_DELAY, name=AUTOBUY_RESUME_JOB_NAME
+                )
+                retry_scheduled = True
+        else:
+            settings["last_run_date"] = today_str
         settings["last_results"] = results
         save_autobuy_settings(settings)
 
-        success = [r for r in results if r.get("ok")]
-        failed = [r for r in results if not r.get("ok")]
-
         lines = [
-            "📈 Автопокупка выполнена",
+            "📈 Автопокупка выполнена" if not pending else "⏳ Автопокупка выполнена частично",
             f"Дата: {today_str}",
             f"Успешно: {len(success)}",
             f"Ошибок: {len(failed)}",
-            "",
         ]
+        if pending:
+            lines.append(f"Состояние неизвестно: {len(pending)}")
+        lines.append("")
         for r in success:
             lines.append(f"✅ {r['ticker']} x{r['qty']} | order_id: {r.get('order_id')}")
         for r in failed:
             lines.append(f"❌ {r['ticker']} x{r['qty']} | {r.get('error')}")
+        for r in pending:
+            lines.append(f"⏳ {r['ticker']} x{r['qty']} | обрыв связи, заявка могла дойти до брокера: {r.get('error')}")
+        if retry_scheduled:
+            lines.append(f"\n🔁 Повтор с теми же orderId через {AUTOBUY_PENDING_RETRY_DELAY} с")
+        elif pending:
+            lines.append("\n⚠️ Автоповторы исчерпаны, заявки будут дозавершены при следующем рестарте")
 
         await context.bot.send_message(chat_id=ADMIN_USER_ID, text="\n".join(lines))
 
@@ -519,6 +1003,7 @@ async def autobuy_on_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def autobuy_off_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global _warm_state
     user_id = update.effective_user.id
     if not is_admin(user_id):
         await update.message.reply_text("🚫 Команда доступна только администратору")
@@ -530,8 +1015,13 @@ async def autobuy_off_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     job_queue = _resolve_job_queue(context)
     if job_queue:
-        for job in job_queue.get_jobs_by_name(AUTOBUY_JOB_NAME):
-            job.schedule_removal()
+        for name in (AUTOBUY_JOB_NAME, AUTOBUY_WARMUP_JOB_NAME, AUTOBUY_RESUME_JOB_NAME):
+            for job in job_queue.get_jobs_by_name(name):
+                job.schedule_removal()
+
+    # Прогретое состояние и удержание соединений больше не нужны
+    _warm_state = None
+    _stop_keepalive()
 
     await update.message.reply_text("🛑 Автопокупка отключена")
 
@@ -548,16 +1038,13 @@ async def autobuy_status_command(update: Update, context: ContextTypes.DEFAULT_T
     cash_str = "н/д"
 
     if TINVEST_API_TOKEN:
-        headers = {
-            "Authorization": f"Bearer {TINVEST_API_TOKEN}",
-            "Content-Type": "application/json",
-        }
+        headers = _auth_headers()
         try:
-            async with aiohttp.ClientSession() as session:
-                account_id = await _get_primary_account_id(session, headers)
-                snapshot = await _get_account_snapshot(session, headers, account_id)
-                portfolio_str = _format_rub(snapshot.get("portfolio_total"))
-                cash_str = _format_rub(snapshot.get("cash_total"))
+            session = await _get_session()
+            account_id = await _get_account_id_cached(session, headers)
+            snapshot = await _get_account_snapshot(session, headers, account_id)
+            portfolio_str = _format_rub(snapshot.get("portfolio_total"))
+            cash_str = _format_rub(snapshot.get("cash_total"))
         except Exception as e:
             logger.warning(f"Не удалось получить snapshot счета в autobuy_status: {e}")
 
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+История цен MOEX: свечи 1m/1h/1d.
+Глубокая история загружается из MOEX ISS (candles.json) постранично и
+параллельно, дальше ряды дополняются только новыми свечами. Между
+загрузками свечи текущего периода собираются из живых опросов цен.
+Каждый ряд (бумага, интервал) хранится на диске в колоночном виде:
+массив времени и массивы open/high/low/close/volume, так что запрос
+диапазона — бинарный поиск и срез, без повторной загрузки истории.
+"""
+
+import array
+import asyncio
+import bisect
+import calendar
+import logging
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from asset_registry import registry
+from config import (
+    API_TIMEOUT, CANDLES_DIR, CANDLES_BACKFILL_DAYS, CANDLES_BACKFILL_CONCURRENCY
+)
+from iss_stream import iss_params, read_iss_tables
+from monitoring import increment_metric
+
+logger = logging.getLogger(__name__)
+
+# Категория реестра -> рынок ISS
+_ISS_MARKETS = {'stocks': 'shares', 'indices': 'index'}
+
+# Интервал -> (длина свечи в секундах, код интервала ISS)
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    '1m': (60, 1),
+    '1h': (3600, 60),
+    '1d': (86400, 24),
+}
+_MSK_OFFSET = 3 * 3600  # Москва круглый год UTC+3: дневные свечи начинаются в 00:00 МСК
+_ISS_PAGE_SIZE = 500  # ISS отдает свечи страницами по 500
+_CANDLE_COLUMNS = {'candles': ('open', 'close', 'high', 'low', 'volume')}
+_ISS_CANDLES_URL = "https://iss.moex.com/iss/engines/stock/markets/{market}/securities/{secid}/candles.json"
+
+_MAGIC = b'MCND'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sBII')  # магия, версия, длина свечи, число свечей
+_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+Candle = Tuple[int, float, float, float, float, float]  # время начала, open, high, low, close, volume
+
+
+def bucket_start(ts: float, seconds: int) -> int:
+    """Начало свечи, в которую попадает момент ts (секунды UTC)"""
+    shifted = int(ts) + _MSK_OFFSET
+    return shifted - shifted % seconds - _MSK_OFFSET
+
+
+def _parse_iss_time(value: str) -> int:
+    """'2024-01-05 10:00:00' (МСК) -> секунды UTC"""
+    return calendar.timegm(time.strptime(value, '%Y-%m-%d %H:%M:%S')) - _MSK_OFFSET
+
+
+def _iss_date(ts: float) -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime(ts + _MSK_OFFSET))
+
+
+class CandleSeries:
+    """Ряд свечей одного интервала в колоночном виде (время строго возрастает)"""
+
+    __slots__ = ('seconds', 'time', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.time = array.array('q')
+        self.open = array.array('d')
+        self.high = array.array('d')
+        self.low = array.array('d')
+        self.close = array.array('d')
+        self.volume = array.array('d')
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def last_time(self) -> Optional[int]:
+        return self.time[-1] if self.time else None
+
+    def _append(self, candle: Candle) -> None:
+        self.time.append(candle[0])
+        self.open.append(candle[1])
+        self.high.append(candle[2])
+        self.low.append(candle[3])
+        self.close.append(candle[4])
+        self.volume.append(candle[5])
+
+    def merge(self, candles: Iterable[Candle]) -> int:
+        """
+        Добавить свечи; свеча с уже известным временем заменяет прежнюю
+
+        Returns:
+            Сколько свечей добавлено или заменено
+        """
+        candles = sorted(candles)
+        if not candles:
+            return 0
+        last = self.last_time
+        if last is None or candles[0][0] > last:
+            # Частый случай: только новые свечи — дописываем в конец
+            previous = None
+            for candle in candles:
+                if candle[0] != previous:
+                    self._append(candle)
+                    previous = candle[0]
+            return len(candles)
+        merged = {self.time[i]: self.candle(i) for i in range(len(self))}
+        merged.update((candle[0], candle) for candle in candles)
+        self._replace(sorted(merged.values()))
+        return len(candles)
+
+    def candle(self, index: int) -> Candle:
+        return (
+            self.time[index], self.open[index], self.high[index],
+            self.low[index], self.close[index], self.volume[index],
+        )
+
+    def _replace(self, candles: Sequence[Candle]) -> None:
+        fresh = CandleSeries(self.seconds)
+        for candle in candles:
+            fresh._append(candle)
+        for name in ('time',) + _FIELDS:
+            setattr(self, name, getattr(fresh, name))
+
+    def update(self, ts: float, price: float) -> bool:
+        """
+        Учесть живую цену в текущей свече
+
+        Returns:
+            False, если момент старше последней свечи (цена не учтена)
+        """
+        start = bucket_start(ts, self.seconds)
+        last = self.last_time
+        if last is not None and start < last:
+            return False
+        if start == last:
+            self.high[-1] = max(self.high[-1], price)
+            self.low[-1] = min(self.low[-1], price)
+            self.close[-1] = price
+        else:
+            self._append((start, price, price, price, price, 0.0))
+        return True
+
+    def trim(self, min_time: int) -> int:
+        """Удалить свечи старше min_time; возвращает число удаленных"""
+        cut = bisect.bisect_left(self.time, min_time)
+        if cut:
+            for name in ('time',) + _FIELDS:
+                del getattr(self, name)[:cut]
+        return cut
+
+    def range(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, List]:
+        """Свечи с началом в [start, end] по колонкам: time/open/high/low/close/volume"""
+        lo = 0 if start is None else bisect.bisect_left(self.time, start)
+        hi = len(self) if end is None else bisect.bisect_right(self.time, end)
+        return {name: getattr(self, name)[lo:hi].tolist() for name in ('time',) + _FIELDS}
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_MAGIC, _FORMAT_VERSION, self.seconds, len(self))]
+        for name in ('time',) + _FIELDS:
+            column = getattr(self, name)
+            if sys.byteorder != 'little':
+                column = array.array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'CandleSeries':
+        magic, version, seconds, count = _HEADER.unpack_from(blob)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("неизвестный формат ряда свечей")
+        series = cls(seconds)
+        offset = _HEADER.size
+        for name in ('time',) + _FIELDS:
+            column = getattr(series, name)
+            size = count * column.itemsize
+            column.frombytes(blob[offset:offset + size])
+            if len(column) != count:
+                raise ValueError("ряд свечей обрезан")
+            if sys.byteorder != 'little':
+                column.byteswap()
+            offset += size
+        return series
+
+
+class CandleStore:
+    """
+    Ряды свечей по бумагам и интервалам с ленивой загрузкой с диска
+
+    Args:
+        directory: Каталог файлов рядов
+        retention_days: Интервал -> сколько дней истории хранить
+    """
+
+    def __init__(self, directory: str, retention_days: Dict[str, int]):
+        self.directory = directory
+        self.retention_days = dict(retention_days)
+        self._series: Dict[Tuple[str, str], CandleSeries] = {}
+        self._dirty: set = set()
+        # mtime файла на момент загрузки/записи: ряд, который записал другой
+        # экземпляр (лидер), перечитывается при следующем обращении
+        self._mtimes: Dict[Tuple[str, str], Optional[float]] = {}
+
+    def _path(self, secid: str, resolution: str) -> str:
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', secid)
+        return os.path.join(self.directory, f"{safe}_{resolution}.bin")
+
+    def series(self, secid: str, resolution: str) -> CandleSeries:
+        """Ряд свечей (с диска при первом обращении или после записи файла другим экземпляром)"""
+        key = (secid, resolution)
+        series = self._series.get(key)
+        if series is None or (key not in self._dirty and self._file_mtime(key) != self._mtimes.get(key)):
+            series = self._load(secid, resolution)
+            self._series[key] = series
+        return series
+
+    def _file_mtime(self, key: Tuple[str, str]) -> Optional[float]:
+        try:
+            return os.stat(self._path(*key)).st_mtime
+        except OSError:
+            return None
+
+    def _load(self, secid: str, resolution: str) -> CandleSeries:
+        path = self._path(secid, resolution)
+        self._mtimes[(secid, resolution)] = self._file_mtime((secid, resolution))
+        try:
+            with open(path, 'rb') as f:
+                return CandleSeries.from_bytes(f.read())
+        except FileNotFoundError:
+            pass
+        except (struct.error, ValueError) as e:
+            logger.warning(f"⚠️ Ряд свечей {path} поврежден, начинаю заново: {e}")
+        return CandleSeries(RESOLUTIONS[resolution][0])
+
+    def merge(self, secid: str, resolution: str, candles: Iterable[Candle]) -> int:
+        changed = self.series(secid, resolution).merge(candles)
+        if changed:
+            self._dirty.add((secid, resolution))
+        return changed
+
+    def record_price(self, secid: str, price: float, ts: Optional[float] = None) -> None:
+        """Учесть живую цену во всех интервалах"""
+        ts = time.time() if ts is None else ts
+        for resolution in RESOLUTIONS:
+            if self.series(secid, resolution).update(ts, price):
+                self._dirty.add((secid, resolution))
+
+    def query(
+        self,
+        secid: str,
+        resolution: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Dict[str, List]:
+        """Свечи бумаги за период (секунды UTC) по колонкам"""
+        return self.series(secid, resolution).range(
+            None if start is None else int(start),
+            None if end is None else int(end),
+        )
+
+    def flush(self) -> int:
+        """Обрезать по сроку хранения и записать измененные ряды; возвращает число записанных"""
+        if not self._dirty:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        written = 0
+        for secid, resolution in sorted(self._dirty):
+            series = self._series[(secid, resolution)]
+            series.trim(int(now - self.retention_days.get(resolution, 365) * 86400))
+            path = self._path(secid, resolution)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.candles-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(series.to_bytes())
+                os.replace(tmp_path, path)
+                self._mtimes[(secid, resolution)] = self._file_mtime((secid, resolution))
+                written += 1
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                logger.error(f"Ошибка записи ряда свечей {path}: {e}")
+        self._dirty.clear()
+        return written
+
+
+def moex_instruments() -> List[Tuple[str, str, str]]:
+    """Активы реестра с историей на MOEX: (ключ актива, SECID, рынок ISS)"""
+    return [
+        (asset.key, asset.symbol('moex'), market)
+        for category, market in _ISS_MARKETS.items()
+        for asset in registry.in_category(category)
+        if asset.symbol('moex')
+    ]
+
+
+async def fetch_candles(
+    session: aiohttp.ClientSession,
+    secid: str,
+    market: str,
+    resolution: str,
+    since: float,
+) -> List[Candle]:
+    """Все свечи ISS начиная с даты момента since (страницами по 500)"""
+    seconds, interval = RESOLUTIONS[resolution]
+    url = _ISS_CANDLES_URL.format(market=market, secid=secid)
+    params = iss_params(_CANDLE_COLUMNS, key_column='begin')
+    params.update({'interval': str(interval), 'from': _iss_date(since)})
+    candles: List[Candle] = []
+    start = 0
+    while True:
+        params['start'] = str(start)
+        async with session.get(url, params=params, timeout=API_TIMEOUT) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"ISS candles {secid} {resolution}: HTTP {resp.status}")
+            tables = await read_iss_tables(resp, _CANDLE_COLUMNS, key_column='begin')
+        page = tables['candles']
+        increment_metric('candles_pages_total')
+        for begin, row in page.items():
+            if None in (row.get('open'), row.get('high'), row.get('low'), row.get('close')):
+                continue
+            candles.append((
+                _parse_iss_time(begin), float(row['open']), float(row['high']),
+                float(row['low']), float(row['close']), float(row.get('volume') or 0),
+            ))
+        if len(page) < _ISS_PAGE_SIZE:
+            return candles
+        start += len(page)
+
+
+async def backfill_candles(
+    session: aiohttp.ClientSession,
+    store: CandleStore,
+    instruments: Sequence[Tuple[str, str]],
+    resolutions: Iterable[str] = tuple(RESOLUTIONS),
+    concurrency: int = CANDLES_BACKFILL_CONCURRENCY,
+) -> int:
+    """
+    Догрузить историю свечей из ISS
+
+    Для ряда с данными запрашивается только хвост начиная с дня последней
+    свечи; пустой ряд загружается на глубину срока хранения.
+
+    Args:
+        instruments: (SECID, рынок ISS: shares или index)
+
+    Returns:
+        Число добавленных или обновленных свечей
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    now = time.time()
+
+    async def _one(secid: str, market: str, resolution: str) -> int:
+        series = store.series(secid, resolution)
+        last = series.last_time
+        since = last if last is not None else now - store.retention_days.get(resolution, 365) * 86400
+        async with semaphore:
+            try:
+                candles = await fetch_candles(session, secid, market, resolution, since)
+            except Exception as e:
+                logger.warning(f"⚠️ Свечи {secid} {resolution} не загружены: {e}")
+                increment_metric('candles_backfill_errors_total')
+                return 0
+        return store.merge(secid, resolution, candles)
+
+    results = await asyncio.gather(*(
+        _one(secid, market, resolution)
+        for secid, market in instruments
+        for resolution in resolutions
+    ))
+    added = sum(results)
+    increment_metric('candles_backfilled_total', added)
+    return added
+
+
+candle_store = CandleStore(CANDLES_DIR, CANDLES_BACKFILL_DAYS)
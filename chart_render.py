@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Графики цен для /chart.
+PNG рисуется в отдельном процессе по сериализуемым рядам свечей (Pillow
+импортируется только в рабочем процессе). Готовые графики кэшируются по
+ключу (актив, период, последняя свеча); одинаковый PNG отправляется
+повторно по file_id Telegram (media_cache).
+"""
+
+import importlib.util
+import io
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+# Pillow (может отсутствовать) проверяется по наличию пакета, без импорта при старте
+PILLOW_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# Период -> (интервал свечей, глубина в днях)
+CHART_PERIODS: Dict[str, Tuple[str, int]] = {
+    '1d': ('1m', 1),
+    '1w': ('1h', 7),
+    '1mo': ('1h', 30),
+    '3mo': ('1d', 90),
+    '1y': ('1d', 365),
+    '5y': ('1d', 1825),
+}
+CHART_PERIOD_ALIASES = {
+    'день': '1d', 'неделя': '1w', 'месяц': '1mo', '3месяца': '3mo', 'год': '1y', '5лет': '5y',
+}
+DEFAULT_CHART_PERIOD = '1mo'
+
+_WIDTH, _HEIGHT = 960, 540
+_MARGIN_LEFT, _MARGIN_RIGHT, _MARGIN_TOP, _MARGIN_BOTTOM = 20, 110, 50, 40
+_GRID_LINES = 5
+
+_chart_executor: Optional[ProcessPoolExecutor] = None
+_chart_cache: 'OrderedDict[tuple, bytes]' = OrderedDict()
+
+
+def get_chart_executor(max_workers: int = 1) -> ProcessPoolExecutor:
+    """Получить (или создать) пул процессов для рендера графиков"""
+    global _chart_executor
+    if _chart_executor is None:
+        _chart_executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _chart_executor
+
+
+def shutdown_chart_executor() -> None:
+    """Остановить пул процессов рендера графиков"""
+    global _chart_executor
+    if _chart_executor is not None:
+        _chart_executor.shutdown(wait=False, cancel_futures=True)
+        _chart_executor = None
+
+
+def resolve_period(text: Optional[str]) -> Optional[str]:
+    """Период из пользовательского ввода (1w, 1MO, месяц); None — неизвестный"""
+    if not text:
+        return DEFAULT_CHART_PERIOD
+    lowered = text.strip().lower()
+    lowered = CHART_PERIOD_ALIASES.get(lowered, lowered)
+    return lowered if lowered in CHART_PERIODS else None
+
+
+def get_cached_chart(key: tuple) -> Optional[bytes]:
+    """Готовый PNG графика или None"""
+    png = _chart_cache.get(key)
+    if png is not None:
+        _chart_cache.move_to_end(key)
+    return png
+
+
+def store_chart(key: tuple, png: bytes, limit: int) -> None:
+    """Сохранить график в кэш (LRU на limit записей)"""
+    _chart_cache[key] = png
+    _chart_cache.move_to_end(key)
+    while len(_chart_cache) > limit:
+        _chart_cache.popitem(last=False)
+
+
+def _format_value(value: float) -> str:
+    if abs(value) >= 1000:
+        return f"{value:,.0f}".replace(',', ' ')
+    if abs(value) >= 10:
+        return f"{value:.2f}"
+    return f"{value:.4f}"
+
+
+def _format_time(ts: float, resolution: str) -> str:
+    # Подписи по московскому времени (UTC+3)
+    pattern = '%d.%m %H:%M' if resolution != '1d' else '%d.%m.%Y'
+    return time.strftime(pattern, time.gmtime(ts + 3 * 3600))
+
+
+def build_chart_png(payload: Dict[str, Any]) -> bytes:
+    """
+    Нарисовать линейный график цены закрытия (выполняется в рабочем процессе)
+
+    Args:
+        payload: {'title', 'resolution', 'time': [...], 'close': [...], 'high': [...], 'low': [...]}
+
+    Returns:
+        PNG в байтах
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    times = payload['time']
+    closes = payload['close']
+    lows = payload.get('low') or closes
+    highs = payload.get('high') or closes
+    low, high = min(lows), max(highs)
+    if high == low:
+        high, low = high + 1, low - 1
+
+    image = Image.new('RGB', (_WIDTH, _HEIGHT), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    left, top = _MARGIN_LEFT, _MARGIN_TOP
+    right, bottom = _WIDTH - _MARGIN_RIGHT, _HEIGHT - _MARGIN_BOTTOM
+
+    def y_of(value: float) -> float:
+        return bottom - (value - low) / (high - low) * (bottom - top)
+
+    # Сетка и шкала цен справа
+    for i in range(_GRID_LINES + 1):
+        value = low + (high - low) * i / _GRID_LINES
+        y = y_of(value)
+        draw.line([(left, y), (right, y)], fill=(230, 230, 230))
+        draw.text((right + 8, y - 6), _format_value(value), fill=(90, 90, 90), font=font)
+
+    # Диапазон high/low и линия закрытия
+    count = len(closes)
+    step = (right - left) / max(count - 1, 1)
+    if count > 1:
+        band = [(left + i * step, y_of(highs[i])) for i in range(count)]
+        band += [(left + i * step, y_of(lows[i])) for i in reversed(range(count))]
+        draw.polygon(band, fill=(222, 235, 250))
+    color = (30, 160, 80) if closes[-1] >= closes[0] else (210, 50, 50)
+    points = [(left + i * step, y_of(value)) for i, value in enumerate(closes)]
+    if count > 1:
+        draw.line(points, fill=color, width=2)
+    last_x, last_y = points[-1]
+    draw.ellipse([last_x - 3, last_y - 3, last_x + 3, last_y + 3], fill=color)
+
+    # Заголовок и подписи времени
+    change = (closes[-1] - closes[0]) / closes[0] * 100 if closes[0] else 0.0
+    header = f"{payload['title']}  {_format_value(closes[-1])}  ({change:+.2f}%)"
+    draw.text((left, 16), header, fill=(20, 20, 20), font=font)
+    draw.text((left, bottom + 12), _format_time(times[0], payload['resolution']), fill=(90, 90, 90), font=font)
+    end_label = _format_time(times[-1], payload['resolution'])
+    end_width = draw.textlength(end_label, font=font)
+    draw.text((right - end_width, bottom + 12), end_label, fill=(90, 90, 90), font=font)
+    draw.rectangle([left, top, right, bottom], outline=(180, 180, 180))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
@@ -17,6 +17,8 @@ FMP_API_KEY = os.getenv('FMP_API_KEY', 'demo')
 ALPHA_VANTAGE_KEY = os.getenv('ALPHA_VANTAGE_KEY', 'demo')
 EIA_API_KEY = os.getenv('EIA_API_KEY', 'demo')
 TINVEST_API_TOKEN = os.getenv('TINVEST_API_TOKEN', '')
+# Базовый URL REST API T-Invest (можно направить на локальный tinvest_mock.py)
+TINVEST_REST_BASE = os.getenv('TINVEST_REST_BASE', 'https://invest-public-api.tinkoff.ru/rest')
 FINNHUB_API_KEY = os.getenv('FINNHUB_API_KEY', 'demo')
 
 # Константы для настроек бота
@@ -33,6 +35,42 @@ CACHE_TTL_CRYPTO = 60  # Кэш для криптовалют (1 минута)
 CACHE_TTL_STOCKS = 300  # Кэш для акций (5 минут)
 CACHE_TTL_COMMODITIES = 300  # Кэш для товаров (5 минут)
 CACHE_TTL_INDICES = 300  # Кэш для индексов (5 минут)
+CACHE_TTL_PDF_REPORT = 300  # Кэш готового PDF отчета (5 минут)
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(16 * 1024 * 1024)))  # Бюджет памяти кэша API (оценка, байты)
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '512'))  # Максимум записей в кэше API
+CACHE_WHEEL_TICK = 1.0  # Шаг колеса таймеров кэша (секунды)
+CACHE_WHEEL_SLOTS = 512  # Слотов в колесе таймеров
+CACHE_HOT_HITS = 2  # Попаданий за время жизни, после которых запись обновляется в фоне, а не удаляется
+
+# Снимок рынка на диске: восстанавливается после рестарта и обновляется в фоне
+MARKET_SNAPSHOT_FILE = os.getenv('MARKET_SNAPSHOT_FILE', 'market_snapshot.bin')
+MARKET_SNAPSHOT_PERSIST_INTERVAL = 300  # Период сохранения (секунды)
+MARKET_SNAPSHOT_MAX_AGE = int(os.getenv('MARKET_SNAPSHOT_MAX_AGE', '43200'))  # Старше не восстанавливаем (12 часов)
+
+# История свечей MOEX (candle_store.py)
+CANDLES_DIR = os.getenv('CANDLES_DIR', 'candles')  # Каталог колоночных рядов свечей
+CANDLES_BACKFILL_DAYS = {  # Глубина загрузки и срок хранения по интервалам (дни)
+    '1m': int(os.getenv('CANDLES_DAYS_1M', '7')),
+    '1h': int(os.getenv('CANDLES_DAYS_1H', '180')),
+    '1d': int(os.getenv('CANDLES_DAYS_1D', '1825')),
+}
+CANDLES_BACKFILL_CONCURRENCY = 4  # Параллельных запросов к ISS при загрузке истории
+CANDLES_BACKFILL_INTERVAL = 6 * 3600  # Период догрузки истории (секунды)
+CANDLES_FLUSH_INTERVAL = 300  # Период записи рядов на диск (секунды)
+
+# Графики /chart
+CHART_RENDER_WORKERS = int(os.getenv('CHART_RENDER_WORKERS', '1'))  # Процессов в пуле рендера
+CHART_CACHE_SIZE = 64  # Готовых графиков в кэше (PNG и file_id Telegram)
+
+# Кэш file_id отправленных файлов: хэш содержимого -> file_id Telegram
+MEDIA_CACHE_FILE = os.getenv('MEDIA_CACHE_FILE', 'media_cache.json')
+MEDIA_CACHE_SIZE = 1024  # Максимум записей
+
+# Рендер PDF отчетов
+PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', '1'))  # Процессов в пуле рендера
+
+# Бюджет холодного старта: время импорта admin_bot (см. startup_benchmark.py)
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '700'))
 
 # Настройки retry для API запросов
 API_RETRY_ATTEMPTS = 3  # Количество попыток
@@ -40,10 +78,67 @@ API_RETRY_DELAY_MIN = 2  # Минимальная задержка между п
 API_RETRY_DELAY_MAX = 10  # Максимальная задержка между попытками (секунды)
 API_TIMEOUT = 10  # Таймаут запросов (секунды)
 
+# Кэш поиска счета и инструментов для автопокупки
+AUTOBUY_ACCOUNT_CACHE_TTL = 3600  # ID счета (1 час)
+AUTOBUY_INSTRUMENT_CACHE_TTL = 86400  # FIGI/UID, лот, флаги торгов (24 часа)
+AUTOBUY_MAX_CONCURRENT_ORDERS = int(os.getenv('AUTOBUY_MAX_CONCURRENT_ORDERS', '10'))  # Одновременных PostOrder
+AUTOBUY_WARMUP_SECONDS = int(os.getenv('AUTOBUY_WARMUP_SECONDS', '60'))  # Прогрев за N секунд до покупки (0 — выключен)
+AUTOBUY_KEEPALIVE_INTERVAL = 10  # Секунд между легкими запросами, удерживающими соединение до времени покупки
+AUTOBUY_CONNECTIONS_LEAD = 3  # За сколько секунд до покупки открыть все соединения (простаивающие пул закрывает через 15 с)
+AUTOBUY_PENDING_RETRY_DELAY = 30  # Через сколько секунд повторить заявки, оборвавшиеся в полете
+AUTOBUY_PENDING_RETRIES = 3  # Автоповторов с тем же orderId, дальше — при следующем рестарте
+
+# Активы (единый реестр asset_registry.py строится из этих таблиц).
+# Символы провайдеров: coingecko, coinbase, binance — крипта; tinvest, moex — акции.
+CURRENCY_ASSETS = [
+    {'key': 'USD', 'name': 'USD'},
+    {'key': 'EUR', 'name': 'EUR'},
+    {'key': 'CNY', 'name': 'CNY'},
+]
+CRYPTO_ASSETS = [
+    {'key': 'BTC', 'name': 'Bitcoin', 'decimals': 0, 'coingecko': 'bitcoin'},
+    {'key': 'TON', 'name': 'TON', 'decimals': 2, 'coingecko': 'the-open-network'},
+    {'key': 'SOL', 'name': 'Solana', 'decimals': 2, 'coingecko': 'solana'},
+    {'key': 'USDT', 'name': 'Tether', 'decimals': 2, 'coingecko': 'tether'},
+]
+# section: в каком блоке /rates показывать акцию (stocks или real_estate)
+STOCK_ASSETS = [
+    {'key': 'SBER', 'name': 'Сбер', 'emoji': '🟢'},
+    {'key': 'YDEX', 'name': 'Яндекс', 'emoji': '🔴'},
+    {'key': 'VKCO', 'name': 'ВК', 'emoji': '🔵'},
+    {'key': 'T', 'name': 'Т-Технологии', 'emoji': '🟡'},
+    {'key': 'GAZP', 'name': 'Газпром', 'emoji': '💎'},
+    {'key': 'GMKN', 'name': 'Норникель', 'emoji': '⚡'},
+    {'key': 'ROSN', 'name': 'Роснефть', 'emoji': '🛢️'},
+    {'key': 'LKOH', 'name': 'ЛУКОЙЛ', 'emoji': '⛽'},
+    {'key': 'MTSS', 'name': 'МТС', 'emoji': '📱'},
+    {'key': 'MFON', 'name': 'Мегафон', 'emoji': '📶'},
+    {'key': 'PIKK', 'name': 'ПИК', 'emoji': '🏗️', 'section': 'real_estate'},
+    {'key': 'SMLT', 'name': 'Самолёт', 'emoji': '✈️', 'section': 'real_estate'},
+    {'key': 'TGLD@', 'name': 'TGLD', 'emoji': '🪙', 'tinvest': 'TGLD@_SPBRU'},
+    {'key': 'TOFZ@', 'name': 'TOFZ', 'emoji': '📄', 'tinvest': 'TOFZ@_SPBRU'},
+    {'key': 'DOMRF', 'name': 'DOMRF', 'emoji': '🏛️'},
+]
+# Дополнительные акции TQBR без правки кода: EXTRA_STOCKS="NVTK:Новатэк,PLZL:Полюс"
+for _item in os.getenv('EXTRA_STOCKS', '').split(','):
+    _ticker, _, _name = _item.strip().partition(':')
+    if _ticker:
+        STOCK_ASSETS.append({'key': _ticker.upper(), 'name': _name or _ticker.upper(), 'emoji': '📈'})
+COMMODITY_ASSETS = [
+    {'key': 'gold', 'name': 'Золото'},
+    {'key': 'silver', 'name': 'Серебро'},
+    {'key': 'brent', 'name': 'Нефть Brent'},
+    {'key': 'urals', 'name': 'Нефть Urals'},
+]
+INDEX_ASSETS = [
+    {'key': 'imoex', 'name': 'IMOEX', 'moex': 'IMOEX'},
+    {'key': 'sp500', 'name': 'S&P 500'},
+]
+
 # Поддерживаемые активы
-SUPPORTED_CURRENCIES = ['USD', 'EUR', 'CNY']
-SUPPORTED_CRYPTO = ['BTC', 'TON', 'SOL', 'USDT']
-SUPPORTED_STOCKS = ['SBER', 'YDEX', 'VKCO', 'T', 'GAZP', 'GMKN', 'ROSN', 'LKOH', 'MTSS', 'MFON', 'PIKK', 'SMLT', 'TGLD@', 'TOFZ@', 'DOMRF']
+SUPPORTED_CURRENCIES = [a['key'] for a in CURRENCY_ASSETS]
+SUPPORTED_CRYPTO = [a['key'] for a in CRYPTO_ASSETS]
+SUPPORTED_STOCKS = [a['key'] for a in STOCK_ASSETS]
 
 # Серверы для проверки доступности/задержки командой /ping
 PING_TARGETS = [
@@ -52,6 +147,35 @@ PING_TARGETS = [
     if ip.strip()
 ]
 
+# Потоковый вывод /ping: одно сообщение редактируется по мере готовности хостов
+PING_STREAMING = os.getenv('PING_STREAMING', '1').lower() not in ('0', 'false', 'no')
+PING_EDIT_INTERVAL = float(os.getenv('PING_EDIT_INTERVAL', '1.0'))  # Минимум секунд между правками
+
+# Фоновый мониторинг задержек до PING_TARGETS
+LATENCY_PROBE_INTERVAL = float(os.getenv('LATENCY_PROBE_INTERVAL', '30'))  # Период замеров (секунды)
+LATENCY_WINDOW_SAMPLES = int(os.getenv('LATENCY_WINDOW_SAMPLES', '120'))  # Размер скользящего окна (замеров)
+
+# Режим получения обновлений: 'polling' или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Публичный HTTPS URL, например https://bot.example.com/telegram
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')  # Путь, который слушает встроенный сервер
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', os.getenv('WEBHOOK_PORT', '8080')))  # Railway передает порт в PORT
+
+# Координация нескольких экземпляров бота: 'none', 'sqlite' или 'flock'
+COORDINATION_BACKEND = os.getenv('COORDINATION_BACKEND', 'none').strip().lower()
+COORDINATION_LEASE_FILE = os.getenv('COORDINATION_LEASE_FILE', 'scheduler_lease.sqlite3')  # Общий файл аренды
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '30'))  # Время жизни аренды лидера (секунды)
+
+# Расчет уведомлений о ценах шардами в пуле процессов
+ALERT_SHARDS = int(os.getenv('ALERT_SHARDS', str(os.cpu_count() or 1)))  # Количество шардов/процессов
+ALERT_SHARD_MIN_SUBSCRIBERS = int(os.getenv('ALERT_SHARD_MIN_SUBSCRIBERS', '500'))  # Меньше - считаем в event loop
+
+# Мониторинг задержек event loop
+LOOP_LAG_CHECK_INTERVAL = float(os.getenv('LOOP_LAG_CHECK_INTERVAL', '0.5'))  # Период heartbeat (секунды)
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.25'))  # Порог блокировки loop (секунды)
+
 # Настройки сохранения данных
 SAVE_DEBOUNCE_DELAY = 5  # Задержка перед сохранением данных (секунды)
 
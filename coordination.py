@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Координация нескольких экземпляров бота.
+Экземпляры берут аренду (lease) в общем хранилище; только лидер выполняет
+задачи по расписанию, обработчики команд работают на всех экземплярах.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+from functools import wraps
+from typing import Optional
+from uuid import uuid4
+
+from monitoring import increment_metric, set_metric
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseBackend:
+    """Интерфейс хранилища аренды лидера"""
+
+    def acquire(self, holder: str, ttl: float) -> bool:
+        """Взять или продлить аренду. True, если аренда принадлежит holder"""
+        raise NotImplementedError
+
+    def release(self, holder: str) -> None:
+        """Освободить аренду, если она принадлежит holder"""
+        raise NotImplementedError
+
+
+class SQLiteLeaseBackend(LeaseBackend):
+    """Аренда в общем SQLite файле (строка с владельцем и временем истечения)"""
+
+    def __init__(self, path: str, name: str = "scheduler"):
+        self.path = path
+        self.name = name
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def acquire(self, holder: str, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE берет блокировку записи: проверка и захват атомарны
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row is None or row[0] == holder or row[1] < now:
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                    (self.name, holder, now + ttl),
+                )
+                conn.execute("COMMIT")
+                return True
+            conn.execute("COMMIT")
+            return False
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, holder: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, holder))
+        finally:
+            conn.close()
+
+
+class FileLockLeaseBackend(LeaseBackend):
+    """
+    Advisory-блокировка файла (fcntl.flock)
+
+    Блокировка держится, пока жив процесс, поэтому ttl не нужен:
+    ОС освободит ее при падении лидера. Работает для экземпляров на одном хосте.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, holder: str, ttl: float) -> bool:
+        import fcntl
+
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, holder.encode("utf-8"))
+        self._fd = fd
+        return True
+
+    def release(self, holder: str) -> None:
+        import fcntl
+
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class LeaderElector:
+    """Периодически продлевает аренду и хранит текущий статус лидера"""
+
+    def __init__(self, backend: LeaseBackend, ttl: float = 30.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._leader = False
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # Лидерство считается действительным только пока не истекла последняя продленная аренда
+        return self._leader and time.monotonic() < self._valid_until
+
+    def _set_leader(self, leader: bool) -> None:
+        if leader != self._leader:
+            if leader:
+                logger.info(f"👑 Экземпляр {self.holder} стал лидером: задачи по расписанию выполняются здесь")
+                increment_metric('leader_elections_total')
+            else:
+                logger.warning(f"⚠️ Экземпляр {self.holder} больше не лидер")
+        self._leader = leader
+        set_metric('is_leader', 1 if leader else 0)
+
+    async def renew_once(self) -> bool:
+        """Попытаться взять/продлить аренду"""
+        started = time.monotonic()
+        try:
+            acquired = await asyncio.to_thread(self.backend.acquire, self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"Ошибка продления аренды лидера: {e}")
+            acquired = False
+        if acquired:
+            self._valid_until = started + self.ttl
+        self._set_leader(acquired)
+        return acquired
+
+    async def _run(self) -> None:
+        while True:
+            await self.renew_once()
+            await asyncio.sleep(self.ttl / 3)
+
+    def start(self) -> None:
+        """Запустить фоновое продление аренды (из работающего event loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить продление и освободить аренду"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._leader:
+            try:
+                await asyncio.to_thread(self.backend.release, self.holder)
+            except Exception as e:
+                logger.error(f"Ошибка освобождения аренды лидера: {e}")
+        self._set_leader(False)
+
+
+leader_elector: Optional[LeaderElector] = None
+
+
+def configure_coordination(backend_name: str, lease_path: str, ttl: float) -> Optional[LeaderElector]:
+    """
+    Настроить координацию экземпляров
+
+    Args:
+        backend_name: 'none' (один экземпляр), 'sqlite' или 'flock'
+        lease_path: Путь к общему файлу аренды
+        ttl: Время жизни аренды в секундах
+    """
+    global leader_elector
+    if backend_name == "sqlite":
+        backend: LeaseBackend = SQLiteLeaseBackend(lease_path)
+    elif backend_name == "flock":
+        backend = FileLockLeaseBackend(lease_path)
+    else:
+        if backend_name not in ("", "none"):
+            logger.warning(f"⚠️ Неизвестный backend координации '{backend_name}', работаю как единственный экземпляр")
+        leader_elector = None
+        return None
+
+    leader_elector = LeaderElector(backend, ttl=ttl)
+    logger.info(f"🤝 Координация экземпляров: {backend_name} ({lease_path}), id {leader_elector.holder}")
+    return leader_elector
+
+
+def is_leader() -> bool:
+    """True, если этот экземпляр должен выполнять задачи по расписанию"""
+    return leader_elector is None or leader_elector.is_leader
+
+
+def leader_only(callback):
+    """Обернуть задачу JobQueue: выполнять ее только на экземпляре-лидере"""
+    @wraps(callback)
+    async def wrapper(context):
+        if not is_leader():
+            logger.info(f"⏭️ {callback.__name__}: пропуск, экземпляр не является лидером")
+            increment_metric('leader_skipped_jobs_total')
+            return None
+        return await callback(context)
+    return wrapper
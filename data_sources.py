@@ -18,15 +18,27 @@ from config import (
     CACHE_TTL_COMMODITIES, CACHE_TTL_INDICES, API_TIMEOUT,
     API_RETRY_ATTEMPTS, API_RETRY_DELAY_MIN, API_RETRY_DELAY_MAX,
     URALS_DISCOUNT, EIA_API_KEY, ALPHA_VANTAGE_KEY,
-    GOLD_SILVER_RATIO, USO_TO_BRENT_MULTIPLIER, TINVEST_API_TOKEN
+    GOLD_SILVER_RATIO, USO_TO_BRENT_MULTIPLIER, TINVEST_API_TOKEN, TINVEST_REST_BASE
 )
 from utils import get_cached_data, fetch_with_retry, save_last_known_rate, get_last_known_rate
+from asset_registry import registry
+from iss_stream import iss_params, read_iss_tables
 
 logger = logging.getLogger(__name__)
 
 # Используем просто число для таймаута, чтобы избежать проблем с контекстным менеджером
 _TIMEOUT = API_TIMEOUT
-_TINVEST_REST_BASE = "https://invest-public-api.tinkoff.ru/rest"
+_TINVEST_REST_BASE = TINVEST_REST_BASE
+
+# Колонки таблиц MOEX ISS, которые реально используются: запрашиваются только они
+MOEX_STOCK_COLUMNS = {
+    'marketdata': ('LAST', 'CHANGE', 'CHANGEPRCNT', 'VALTODAY', 'OPEN', 'HIGH', 'LOW'),
+}
+MOEX_INDEX_COLUMNS = {
+    'marketdata': ('LAST', 'CURRENTVALUE', 'PREVPRICE', 'CHANGEPRCNT'),
+}
+MOEX_STOCKS_URL = "https://iss.moex.com/iss/engines/stock/markets/shares/boards/TQBR/securities.json"
+MOEX_INDICES_URL = "https://iss.moex.com/iss/engines/stock/markets/index/boards/SNDX/securities.json"
 
 
 def _tinvest_money_to_float(value: Optional[Dict[str, Any]]) -> Optional[float]:
@@ -55,7 +67,10 @@ def _tinvest_is_live_status(status: Optional[str]) -> bool:
 
 async def safe_json_response(resp: aiohttp.ClientResponse) -> Any:
     """
-    Безопасное получение JSON из ответа с обработкой ошибок Content-Type
+    Безопасное получение JSON из ответа независимо от Content-Type
+    
+    Тело читается один раз и разбирается из байтов: без проверки заголовка
+    и без промежуточной строки, которую делал повторный разбор через resp.text().
     
     Args:
         resp: Объект ответа aiohttp
@@ -63,12 +78,7 @@ async def safe_json_response(resp: aiohttp.ClientResponse) -> Any:
     Returns:
         Распарсенный JSON объект
     """
-    try:
-        return await resp.json()
-    except aiohttp.client_exceptions.ContentTypeError:
-        # Если Content-Type неправильный, получаем текст и парсим вручную
-        text = await resp.text(encoding='utf-8')
-        return json.loads(text)
+    return json.loads(await resp.read())
 
 
 async def get_cbr_rates(session: aiohttp.ClientSession) -> Dict[str, Any]:
@@ -112,12 +122,11 @@ async def get_crypto_data(session: aiohttp.ClientSession) -> Dict[str, Dict[str,
     """Получить данные криптовалют с резервными источниками"""
     crypto_data = {}
     
-    # Список криптовалют для мониторинга
+    # Список криптовалют для мониторинга (из реестра активов)
     crypto_list = [
-        {'id': 'bitcoin', 'symbol': 'BTC', 'name': 'Bitcoin'},
-        {'id': 'the-open-network', 'symbol': 'TON', 'name': 'TON'},
-        {'id': 'solana', 'symbol': 'SOL', 'name': 'Solana'},
-        {'id': 'tether', 'symbol': 'USDT', 'name': 'Tether'}
+        {'id': asset.symbol('coingecko'), 'symbol': asset.key, 'name': asset.name,
+         'coinbase': asset.symbol('coinbase'), 'binance': asset.symbol('binance')}
+        for asset in registry.in_category('crypto')
     ]
     
     # 1. Пробуем CoinGecko (основной источник)
@@ -154,9 +163,9 @@ async def get_crypto_data(session: aiohttp.ClientSession) -> Dict[str, Dict[str,
     logger.debug("Пробуем получить данные криптовалют с Coinbase...")
     try:
         for crypto in crypto_list:
-            symbol = crypto['symbol']
+            symbol = crypto['coinbase']
             try:
-                url = f"https://api.coinbase.com/v2/prices/{symbol}-USD/spot"
+                url = f"https://api.coinbase.com/v2/prices/{symbol}/spot"
                 async with session.get(url, timeout=_TIMEOUT) as resp:
                     if resp.status == 200:
                         data = await safe_json_response(resp)
@@ -183,7 +192,7 @@ async def get_crypto_data(session: aiohttp.ClientSession) -> Dict[str, Dict[str,
     logger.debug("Пробуем получить данные криптовалют с Binance...")
     try:
         for crypto in crypto_list:
-            symbol = f"{crypto['symbol']}USDT"
+            symbol = crypto['binance']
             try:
                 url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
                 async with session.get(url, timeout=_TIMEOUT) as resp:
@@ -223,23 +232,10 @@ async def get_moex_stocks(session: aiohttp.ClientSession) -> Dict[str, Dict[str,
     
     logger.debug(f"Проверка торговых дней: {'Выходной' if is_weekend else 'Торговый день'}")
     
-    # Список акций для мониторинга
+    # Список акций для мониторинга (из реестра активов)
     stocks = {
-        'SBER': {'name': 'Сбер', 'emoji': '🟢'},
-        'YDEX': {'name': 'Яндекс', 'emoji': '🔴'},
-        'VKCO': {'name': 'ВК', 'emoji': '🔵'},
-        'T': {'name': 'Т-Технологии', 'emoji': '🟡'},
-        'GAZP': {'name': 'Газпром', 'emoji': '💎'},
-        'GMKN': {'name': 'Норникель', 'emoji': '⚡'},
-        'ROSN': {'name': 'Роснефть', 'emoji': '🛢️'},
-        'LKOH': {'name': 'ЛУКОЙЛ', 'emoji': '⛽'},
-        'MTSS': {'name': 'МТС', 'emoji': '📱'},
-        'MFON': {'name': 'Мегафон', 'emoji': '📶'},
-        'PIKK': {'name': 'ПИК', 'emoji': '🏗️'},
-        'SMLT': {'name': 'Самолёт', 'emoji': '✈️'},
-        'TGLD@': {'name': 'TGLD', 'emoji': '🪙'},
-        'TOFZ@': {'name': 'TOFZ', 'emoji': '📄'},
-        'DOMRF': {'name': 'DOMRF', 'emoji': '🏛️'}
+        asset.key: {'name': asset.name, 'emoji': asset.emoji}
+        for asset in registry.in_category('stocks')
     }
     
     # Если выходной день, возвращаем пустые данные
@@ -261,21 +257,9 @@ async def get_moex_stocks(session: aiohttp.ClientSession) -> Dict[str, Dict[str,
     try:
         if TINVEST_API_TOKEN:
             tinvest_ids = {
-                'SBER': 'SBER_TQBR',
-                'YDEX': 'YDEX_TQBR',
-                'VKCO': 'VKCO_TQBR',
-                'T': 'T_TQBR',
-                'GAZP': 'GAZP_TQBR',
-                'GMKN': 'GMKN_TQBR',
-                'ROSN': 'ROSN_TQBR',
-                'LKOH': 'LKOH_TQBR',
-                'MTSS': 'MTSS_TQBR',
-                'MFON': 'MFON_TQBR',
-                'PIKK': 'PIKK_TQBR',
-                'SMLT': 'SMLT_TQBR',
-                'TGLD@': 'TGLD@_SPBRU',
-                'TOFZ@': 'TOFZ@_SPBRU',
-                'DOMRF': 'DOMRF_TQBR'
+                asset.key: asset.symbol('tinvest')
+                for asset in registry.in_category('stocks')
+                if asset.symbol('tinvest')
             }
 
             headers = {
@@ -346,58 +330,33 @@ async def get_moex_stocks(session: aiohttp.ClientSession) -> Dict[str, Dict[str,
         logger.error(f"Ошибка получения данных MOEX через T-Invest: {e}")
 
     try:
-        trading_url = "https://iss.moex.com/iss/engines/stock/markets/shares/boards/TQBR/securities.json"
-        params = {
-            'securities': ','.join(stocks.keys()),
-            'iss.meta': 'off',
-            'iss.only': 'securities,marketdata'
-        }
-        
         async with session.get(
-            trading_url,
-            params=params,
+            MOEX_STOCKS_URL,
+            params=iss_params(MOEX_STOCK_COLUMNS, secids=stocks),
             timeout=_TIMEOUT
         ) as resp:
             if resp.status == 200:
-                data = await safe_json_response(resp)
-                
-                securities_data = {}
-                marketdata = {}
-                
-                if 'securities' in data and 'data' in data['securities']:
-                    securities_cols = data['securities']['columns']
-                    for row in data['securities']['data']:
-                        row_data = dict(zip(securities_cols, row))
-                        secid = row_data.get('SECID')
-                        if secid in stocks:
-                            securities_data[secid] = {
-                                'shortname': row_data.get('SHORTNAME', stocks[secid]['name']),
-                                'lotsize': row_data.get('LOTSIZE', 1)
-                            }
-                
-                if 'marketdata' in data and 'data' in data['marketdata']:
-                    marketdata_cols = data['marketdata']['columns']
-                    for row in data['marketdata']['data']:
-                        row_data = dict(zip(marketdata_cols, row))
-                        secid = row_data.get('SECID')
-                        if secid in stocks:
-                            marketdata[secid] = {
-                                'last': row_data.get('LAST'),
-                                'change': row_data.get('CHANGE'),
-                                'changeprcnt': row_data.get('CHANGEPRCNT'),
-                                'volume': row_data.get('VALTODAY'),
-                                'open': row_data.get('OPEN'),
-                                'high': row_data.get('HIGH'),
-                                'low': row_data.get('LOW')
-                            }
+                tables = await read_iss_tables(resp, MOEX_STOCK_COLUMNS, secids=stocks)
+                marketdata = {
+                    secid: {
+                        'last': row.get('LAST'),
+                        'change': row.get('CHANGE'),
+                        'changeprcnt': row.get('CHANGEPRCNT'),
+                        'volume': row.get('VALTODAY'),
+                        'open': row.get('OPEN'),
+                        'high': row.get('HIGH'),
+                        'low': row.get('LOW')
+                    }
+                    for secid, row in tables['marketdata'].items()
+                }
                 
                 # Объединяем данные
                 for ticker in stocks:
-                    if ticker in securities_data or ticker in marketdata:
+                    if ticker in marketdata:
                         stocks_data[ticker] = {
                             'name': stocks[ticker]['name'],
                             'emoji': stocks[ticker]['emoji'],
-                            'shortname': securities_data.get(ticker, {}).get('shortname', stocks[ticker]['name']),
+                            'shortname': stocks[ticker]['name'],
                             'price': marketdata.get(ticker, {}).get('last'),
                             'change': marketdata.get(ticker, {}).get('change'),
                             'change_pct': marketdata.get(ticker, {}).get('changeprcnt'),
@@ -625,26 +584,23 @@ async def get_indices_data(session: aiohttp.ClientSession) -> Dict[str, Dict[str
             logger.debug("Запрашиваю индексы MOEX (fallback)...")
             try:
                 async with session.get(
-                    "https://iss.moex.com/iss/engines/stock/markets/index/boards/SNDX/securities.json",
-                    params={'iss.meta': 'off', 'iss.only': 'securities,marketdata'},
+                    MOEX_INDICES_URL,
+                    params=iss_params(MOEX_INDEX_COLUMNS, secids=('IMOEX',)),
                     timeout=_TIMEOUT
                 ) as resp:
                     if resp.status == 200:
-                        data = await safe_json_response(resp)
-                        if 'marketdata' in data and 'data' in data['marketdata']:
-                            marketdata_cols = data['marketdata']['columns']
-                            for row in data['marketdata']['data']:
-                                row_data = dict(zip(marketdata_cols, row))
-                                if row_data.get('SECID') == 'IMOEX':
-                                    last_value = row_data.get('LAST')
-                                    price = last_value or row_data.get('CURRENTVALUE') or row_data.get('PREVPRICE')
-                                    if price:
-                                        indices_data['imoex'] = {
-                                            'name': 'IMOEX',
-                                            'price': price,
-                                            'change_pct': row_data.get('CHANGEPRCNT', 0),
-                                            'is_live': last_value is not None
-                                        }
+                        tables = await read_iss_tables(resp, MOEX_INDEX_COLUMNS, secids=('IMOEX',))
+                        row_data = tables['marketdata'].get('IMOEX')
+                        if row_data is not None:
+                            last_value = row_data.get('LAST')
+                            price = last_value or row_data.get('CURRENTVALUE') or row_data.get('PREVPRICE')
+                            if price:
+                                indices_data['imoex'] = {
+                                    'name': 'IMOEX',
+                                    'price': price,
+                                    'change_pct': row_data.get('CHANGEPRCNT', 0),
+                                    'is_live': last_value is not None
+                                }
             except Exception as e:
                 logger.error(f"Ошибка получения индексов MOEX: {e}")
         
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Планировщик запросов к источникам рыночных данных.
+По набору активов (избранное пользователя или объединение избранного
+активных подписчиков) определяет, какие источники нужно опросить:
+для избранного из BTC и SBER не нужно ходить за товарами и индексами.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from asset_registry import registry
+from market_snapshot import CATEGORIES
+
+# Источники, нужные для показа актива категории
+# (крипта и товары котируются в долларах и пересчитываются в рубли по курсу USD)
+SOURCES_BY_CATEGORY = {
+    'currencies': ('currencies', 'forex'),
+    'crypto': ('crypto', 'currencies', 'forex'),
+    'stocks': ('stocks',),
+    'commodities': ('commodities', 'currencies', 'forex'),
+    'indices': ('indices',),
+}
+
+
+def plan_sources(asset_keys: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """
+    Источники для набора активов
+
+    Args:
+        asset_keys: Ключи активов реестра; None — все активы
+
+    Returns:
+        Категории источников в порядке CATEGORIES
+    """
+    if asset_keys is None:
+        return CATEGORIES
+    needed: Set[str] = set()
+    for key in asset_keys:
+        asset = registry.get(key)
+        if asset is not None:
+            needed.update(SOURCES_BY_CATEGORY.get(asset.category, ()))
+    return tuple(name for name in CATEGORIES if name in needed)
+
+
+def demanded_assets(notifications: Dict[str, Dict[str, Any]]) -> Optional[Set[str]]:
+    """
+    Объединение активов, которые нужны активным подписчикам
+
+    Подписчик без избранного получает уведомления по всем активам,
+    поэтому в этом случае возвращается None (нужны все источники).
+    """
+    demand: Set[str] = set()
+    for user_notifications in notifications.values():
+        if not user_notifications.get('subscribed', False):
+            continue
+        watchlist = user_notifications.get('watchlist')
+        if not watchlist:
+            return None
+        demand.update(watchlist)
+        demand.update(user_notifications.get('alerts', {}))
+    return demand
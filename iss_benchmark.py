@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк запросов MOEX ISS: широкий запрос (все колонки, SNDX без фильтра бумаг)
+против узкого (только нужные колонки и бумаги). Печатает размер ответа и время
+разбора: прежний способ (json.loads всего тела + dict(zip) по строкам) против
+потокового разбора iss_stream.
+
+    python iss_benchmark.py               # живые ответы ISS
+    python iss_benchmark.py --synthetic   # без сети, ответы сгенерированы по схеме ISS
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+os.environ.setdefault("BOT_TOKEN", "iss-benchmark")
+
+from config import SUPPORTED_STOCKS
+from data_sources import MOEX_INDEX_COLUMNS, MOEX_INDICES_URL, MOEX_STOCK_COLUMNS, MOEX_STOCKS_URL
+from iss_stream import iss_params, parse_iss_bytes
+
+# Колонки ISS для синтетических ответов (как на досках TQBR и SNDX)
+_SECURITIES_COLUMNS = (
+    "SECID", "BOARDID", "SHORTNAME", "PREVPRICE", "LOTSIZE", "FACEVALUE", "STATUS", "BOARDNAME",
+    "DECIMALS", "SECNAME", "REMARKS", "MARKETCODE", "INSTRID", "SECTORID", "MINSTEP", "PREVWAPRICE",
+    "FACEUNIT", "PREVDATE", "ISSUESIZE", "ISIN", "LATNAME", "REGNUMBER", "PREVLEGALCLOSEPRICE",
+    "CURRENCYID", "SECTYPE", "LISTLEVEL", "SETTLEDATE",
+)
+_MARKETDATA_COLUMNS = (
+    "SECID", "BOARDID", "BID", "BIDDEPTH", "OFFER", "OFFERDEPTH", "SPREAD", "BIDDEPTHT", "OFFERDEPTHT",
+    "OPEN", "LOW", "HIGH", "LAST", "LASTCHANGE", "LASTCHANGEPRCNT", "QTY", "VALUE", "VALUE_USD",
+    "WAPRICE", "LASTCNGTOLASTWAPRICE", "WAPTOPREVWAPRICEPRCNT", "WAPTOPREVWAPRICE", "CLOSEPRICE",
+    "MARKETPRICETODAY", "MARKETPRICE", "LASTTOPREVPRICE", "NUMTRADES", "VOLTODAY", "VALTODAY",
+    "VALTODAY_USD", "ETFSETTLEPRICE", "TRADINGSTATUS", "UPDATETIME", "LASTBID", "LASTOFFER",
+    "LCLOSEPRICE", "LCURRENTPRICE", "MARKETPRICE2", "CHANGE", "CHANGEPRCNT", "CURRENTVALUE", "TIME",
+    "HIGHBID", "LOWOFFER", "PRICEMINUSPREVWAPRICE", "OPENPERIODPRICE", "SEQNUM", "SYSTIME",
+    "ISSUECAPITALIZATION", "ISSUECAPITALIZATION_UPDATETIME", "VALTODAY_RUR", "TRADINGSESSION",
+)
+_SNDX_BOARD_SIZE = 250  # примерно столько индексов на доске SNDX
+
+
+def _cell(column: str, secid: str, rnd: random.Random) -> Any:
+    if column == "SECID":
+        return secid
+    if column in ("BOARDID", "STATUS", "CURRENCYID", "FACEUNIT", "TRADINGSTATUS"):
+        return "TQBR"
+    if column in ("SHORTNAME", "SECNAME", "LATNAME", "BOARDNAME", "REMARKS"):
+        return f"{secid} ПАО ао"
+    if column in ("PREVDATE", "SETTLEDATE", "ISSUECAPITALIZATION_UPDATETIME"):
+        return "2024-01-01"
+    if column in ("UPDATETIME", "TIME"):
+        return "18:39:59"
+    return rnd.choice((None, round(rnd.uniform(1, 5000), 2), rnd.randint(1, 10 ** 9)))
+
+
+def _synthetic_body(
+    blocks: Dict[str, Sequence[str]],
+    secids: Sequence[str],
+    params: Dict[str, str],
+    board_size: int,
+) -> bytes:
+    """Ответ ISS так, как его вернул бы сервер на эти параметры"""
+    rnd = random.Random(42)
+    board = list(secids) + [f"X{i:04d}" for i in range(max(0, board_size - len(secids)))]
+    if 'securities' in params:
+        board = params['securities'].split(',')
+    full_columns = {'securities': _SECURITIES_COLUMNS, 'marketdata': _MARKETDATA_COLUMNS}
+    doc = {}
+    for name in params['iss.only'].split(','):
+        columns = full_columns[name]
+        if f'{name}.columns' in params:
+            columns = tuple(params[f'{name}.columns'].split(','))
+        doc[name] = {
+            "columns": list(columns),
+            "data": [[_cell(column, secid, rnd) for column in columns] for secid in board],
+        }
+    return json.dumps(doc, ensure_ascii=False).encode('utf-8')
+
+
+async def _fetch_body(url: str, params: Dict[str, str]) -> bytes:
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+
+def _parse_wide(body: bytes, blocks: Dict[str, Sequence[str]], secids: Sequence[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Прежний разбор: все тело в объекты Python, затем dict(zip) по каждой строке"""
+    data = json.loads(body)
+    wanted = set(secids)
+    result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for name, columns in blocks.items():
+        result[name] = {}
+        table = data.get(name, {})
+        for row in table.get('data', []):
+            row_data = dict(zip(table['columns'], row))
+            if row_data.get('SECID') in wanted:
+                result[name][row_data['SECID']] = {column: row_data.get(column) for column in columns}
+    return result
+
+
+def _time_ms(func: Callable[[], Any], runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run_case(
+    title: str,
+    url: str,
+    blocks: Dict[str, Sequence[str]],
+    secids: Sequence[str],
+    wide_params: Dict[str, str],
+    runs: int,
+    synthetic: bool,
+    board_size: int,
+) -> Tuple[str, List[str]]:
+    narrow_params = iss_params(blocks, secids=secids)
+    bodies = {}
+    for label, params in (('wide', wide_params), ('narrow', narrow_params)):
+        if synthetic:
+            bodies[label] = _synthetic_body(blocks, secids, params, board_size)
+        else:
+            bodies[label] = asyncio.run(_fetch_body(url, params))
+
+    wide_ms = _time_ms(lambda: _parse_wide(bodies['wide'], blocks, secids), runs)
+    stream_wide_ms = _time_ms(lambda: parse_iss_bytes(bodies['wide'], blocks, secids), runs)
+    narrow_ms = _time_ms(lambda: parse_iss_bytes(bodies['narrow'], blocks, secids), runs)
+
+    wide_bytes, narrow_bytes = len(bodies['wide']), len(bodies['narrow'])
+    lines = [
+        f"{'ответ':<34}{'байт':>10}{'разбор, мс':>12}",
+        f"{'широкий, json.loads + dict(zip)':<34}{wide_bytes:>10}{wide_ms:>12.3f}",
+        f"{'широкий, потоковый разбор':<34}{wide_bytes:>10}{stream_wide_ms:>12.3f}",
+        f"{'узкий, потоковый разбор':<34}{narrow_bytes:>10}{narrow_ms:>12.3f}",
+        f"байты: x{wide_bytes / max(narrow_bytes, 1):.1f} меньше, разбор: x{wide_ms / max(narrow_ms, 1e-6):.1f} быстрее",
+    ]
+    return title, lines
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Размер и время разбора ответов MOEX ISS: широкий vs узкий запрос")
+    parser.add_argument("--runs", type=int, default=50, help="Повторов разбора для медианы")
+    parser.add_argument("--synthetic", action="store_true", help="Не ходить в сеть, сгенерировать ответы")
+    parser.add_argument("--board-size", type=int, default=_SNDX_BOARD_SIZE,
+                        help="Число бумаг на доске для синтетического ответа без фильтра")
+    args = parser.parse_args(argv)
+
+    tickers = list(SUPPORTED_STOCKS)
+    cases = (
+        ("TQBR: акции", MOEX_STOCKS_URL, MOEX_STOCK_COLUMNS, tickers,
+         {'iss.meta': 'off', 'iss.only': 'securities,marketdata', 'securities': ','.join(tickers)}),
+        ("SNDX: IMOEX", MOEX_INDICES_URL, MOEX_INDEX_COLUMNS, ['IMOEX'],
+         {'iss.meta': 'off', 'iss.only': 'securities,marketdata'}),
+    )
+    mode = "синтетические ответы" if args.synthetic else "живые ответы ISS"
+    print(f"MOEX ISS ({mode}), медиана из {args.runs} разборов\n")
+    for title, url, blocks, secids, wide_params in cases:
+        title, lines = run_case(title, url, blocks, secids, wide_params, args.runs, args.synthetic, args.board_size)
+        print(title)
+        for line in lines:
+            print(f"  {line}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Потоковый разбор ответов MOEX ISS.
+ISS отдает таблицы вида {"блок": {"columns": [...], "data": [[...], ...]}}.
+Парсер читает тело по частям, один раз сопоставляет заголовок columns
+с нужными колонками и разбирает строки data по мере поступления, оставляя
+только нужные SECID и колонки. Целиком ответ в памяти не строится.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+_WHITESPACE = ' \t\r\n'
+_decoder = json.JSONDecoder()
+_STRUCTURE_SPECIAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# Состояния разбора
+_TOP = 'top'  # ожидаем '{' корневого объекта
+_TOP_KEY = 'top_key'  # ключ блока или '}'
+_BLOCK_OPEN = 'block_open'  # '{' нужного блока
+_BLOCK_KEY = 'block_key'  # columns/data/прочее или '}'
+_COLUMNS = 'columns'  # массив имен колонок
+_DATA_OPEN = 'data_open'  # '[' массива строк
+_ROWS = 'rows'  # строки таблицы или ']'
+_SKIP = 'skip'  # пропуск ненужного значения
+_DONE = 'done'
+
+
+class IssTableParser:
+    """
+    Инкрементальный парсер таблиц ISS
+
+    Args:
+        blocks: Блок -> нужные колонки (например, {'marketdata': ['SECID', 'LAST']})
+        secids: Оставить только эти бумаги (None — все)
+        key_column: Колонка с идентификатором бумаги
+    """
+
+    def __init__(
+        self,
+        blocks: Dict[str, Sequence[str]],
+        secids: Optional[Iterable[str]] = None,
+        key_column: str = 'SECID',
+    ):
+        self.blocks = {name: list(columns) for name, columns in blocks.items()}
+        self.secids: Optional[Set[str]] = set(secids) if secids is not None else None
+        self.key_column = key_column
+        self.result: Dict[str, Dict[str, Dict[str, Any]]] = {name: {} for name in blocks}
+        self.rows_seen = 0
+
+        self._buf = ''
+        self._pos = 0
+        self._state = _TOP
+        self._after_skip = _TOP_KEY
+        self._block: Optional[str] = None
+        # Позиции нужных колонок текущего блока: [(имя, индекс)], индекс ключевой колонки
+        self._picks: List[tuple] = []
+        self._key_index: Optional[int] = None
+        # Пропуск значения: глубина вложенности и состояние строки
+        self._skip_depth = 0
+        self._skip_in_string = False
+        self._skip_started = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, text: str) -> None:
+        """Добавить очередной фрагмент тела ответа"""
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        while self._step():
+            pass
+
+    # --- Вспомогательные методы разбора ---
+
+    def _peek(self) -> Optional[str]:
+        """Следующий значимый символ (пробелы пропускаются) или None, если данных нет"""
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def _decode(self):
+        """Разобрать значение целиком; при неполных данных вернуть (False, None)"""
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+        except ValueError:
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _read_key(self) -> Optional[str]:
+        """Прочитать "ключ": (None, если данных пока не хватает)"""
+        start = self._pos
+        ok, key = self._decode()
+        if not ok:
+            return None
+        if self._peek() != ':':
+            self._pos = start
+            return None
+        self._pos += 1
+        return key
+
+    def _start_skip(self, after: str) -> None:
+        self._state = _SKIP
+        self._after_skip = after
+        self._skip_depth = 0
+        self._skip_in_string = False
+        self._skip_started = False
+
+    def _skip(self) -> bool:
+        """Пропустить значение без разбора (может растянуться на несколько фрагментов)"""
+        buf = self._buf
+        pos = self._pos
+        if not self._skip_started:
+            char = self._peek()
+            if char is None:
+                return False
+            pos = self._pos
+            self._skip_started = True
+            if char not in '{["':
+                # Скаляр: до ближайшего разделителя
+                end = pos
+                while end < len(buf) and buf[end] not in ',}]':
+                    end += 1
+                if end == len(buf):
+                    self._skip_started = False
+                    return False
+                self._pos = end
+                self._state = self._after_skip
+                return True
+        while True:
+            # Перескакиваем сразу к следующему значимому символу
+            match = (_STRING_SPECIAL if self._skip_in_string else _STRUCTURE_SPECIAL).search(buf, pos)
+            if match is None:
+                self._pos = len(buf)
+                return False
+            char = match.group()
+            pos = match.end()
+            if self._skip_in_string:
+                if char == '\\':
+                    if pos >= len(buf):
+                        # Экранированный символ еще не пришел
+                        self._pos = pos - 1
+                        return False
+                    pos += 1
+                else:
+                    self._skip_in_string = False
+                    if self._skip_depth == 0:
+                        break
+            elif char == '"':
+                self._skip_in_string = True
+            elif char in '{[':
+                self._skip_depth += 1
+            else:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    break
+        self._pos = pos
+        self._state = self._after_skip
+        return True
+
+    def _set_columns(self, columns: List[str]) -> None:
+        wanted = self.blocks[self._block]
+        index = {name: i for i, name in enumerate(columns)}
+        self._picks = [(name, index[name]) for name in wanted if name in index]
+        self._key_index = index.get(self.key_column)
+
+    def _take_row(self, row: List[Any]) -> None:
+        self.rows_seen += 1
+        if self._key_index is None or self._key_index >= len(row):
+            return
+        secid = row[self._key_index]
+        if self.secids is not None and secid not in self.secids:
+            return
+        self.result[self._block][secid] = {
+            name: row[i] if i < len(row) else None for name, i in self._picks
+        }
+
+    # --- Конечный автомат ---
+
+    def _step(self) -> bool:
+        """Один шаг разбора; False — нужны следующие данные или разбор окончен"""
+        state = self._state
+        if state == _DONE:
+            return False
+        if state == _SKIP:
+            return self._skip()
+
+        char = self._peek()
+        if char is None:
+            return False
+
+        if state == _TOP:
+            if char != '{':
+                raise ValueError(f"ISS: ожидался объект, получено {char!r}")
+            self._pos += 1
+            self._state = _TOP_KEY
+            return True
+
+        if state == _TOP_KEY:
+            if char == '}':
+                self._pos += 1
+                self._state = _DONE
+                return False
+            if char == ',':
+                self._pos += 1
+                return True
+            key = self._read_key()
+            if key is None:
+                return False
+            if key in self.blocks:
+                self._block = key
+                self._picks, self._key_index = [], None
+                self._state = _BLOCK_OPEN
+            else:
+                self._start_skip(_TOP_KEY)
+            return True
+
+        if state == _BLOCK_OPEN:
+            if char != '{':
+                # Блок не таблица — пропускаем
+                self._start_skip(_TOP_KEY)
+                return True
+            self._pos += 1
+            self._state = _BLOCK_KEY
+            return True
+
+        if state == _BLOCK_KEY:
+            if char == '}':
+                self._pos += 1
+                self._state = _TOP_KEY
+                return True
+            if char == ',':
+                self._pos += 1
+                return True
+            key = self._read_key()
+            if key is None:
+                return False
+            if key == 'columns':
+                self._state = _COLUMNS
+            elif key == 'data' and self._key_index is not None:
+                self._state = _DATA_OPEN
+            else:
+                # metadata и прочее; data без заголовка columns разобрать нельзя
+                self._start_skip(_BLOCK_KEY)
+            return True
+
+        if state == _COLUMNS:
+            ok, columns = self._decode()
+            if not ok:
+                return False
+            self._set_columns(columns)
+            self._state = _BLOCK_KEY
+            return True
+
+        if state == _DATA_OPEN:
+            if char != '[':
+                self._start_skip(_BLOCK_KEY)
+                return True
+            self._pos += 1
+            self._state = _ROWS
+            return True
+
+        if state == _ROWS:
+            # Строки разбираются подряд без возврата в общий цикл
+            buf = self._buf
+            pos = self._pos
+            size = len(buf)
+            raw_decode = _decoder.raw_decode
+            take_row = self._take_row
+            while pos < size:
+                char = buf[pos]
+                if char in _WHITESPACE or char == ',':
+                    pos += 1
+                    continue
+                if char == ']':
+                    self._pos = pos + 1
+                    self._state = _BLOCK_KEY
+                    return True
+                try:
+                    row, pos = raw_decode(buf, pos)
+                except ValueError:
+                    break
+                take_row(row)
+            self._pos = pos
+            return False
+
+        return False
+
+
+def parse_iss_bytes(
+    body: bytes,
+    blocks: Dict[str, Sequence[str]],
+    secids: Optional[Iterable[str]] = None,
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Разобрать тело ISS целиком (для тестов и бенчмарков)"""
+    parser = IssTableParser(blocks, secids)
+    parser.feed(body.decode('utf-8'))
+    return parser.result
+
+
+async def read_iss_tables(
+    resp,
+    blocks: Dict[str, Sequence[str]],
+    secids: Optional[Iterable[str]] = None,
+    chunk_size: int = 16 * 1024,
+    key_column: str = 'SECID',
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Потоково прочитать таблицы ISS из ответа aiohttp
+
+    Args:
+        resp: Ответ aiohttp со статусом 200
+        blocks: Блок -> нужные колонки (SECID для фильтра читается всегда)
+        secids: Оставить только эти бумаги (None — все)
+        key_column: Колонка-ключ строк (для свечей — begin)
+
+    Returns:
+        Блок -> значение ключа -> {колонка: значение}
+    """
+    parser = IssTableParser(blocks, secids, key_column)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    async for chunk in resp.content.iter_chunked(chunk_size):
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    parser.feed(decoder.decode(b'', final=True))
+    return parser.result
+
+
+def iss_params(
+    blocks: Dict[str, Sequence[str]],
+    secids: Optional[Iterable[str]] = None,
+    key_column: str = 'SECID',
+) -> Dict[str, str]:
+    """
+    Параметры запроса ISS: только нужные блоки и колонки, фильтр бумаг на сервере
+
+    Args:
+        blocks: Блок -> нужные колонки (ключевая колонка добавляется в каждый блок)
+        secids: Бумаги для параметра securities (None — без фильтра)
+    """
+    params = {
+        'iss.meta': 'off',
+        'iss.only': ','.join(blocks),
+    }
+    for name, columns in blocks.items():
+        wanted = [key_column] + [column for column in columns if column != key_column]
+        params[f'{name}.columns'] = ','.join(wanted)
+    if secids is not None:
+        params['securities'] = ','.join(secids)
+    return params
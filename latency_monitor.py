@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Фоновый мониторинг задержек до серверов из PING_TARGETS.
+Замеры копятся в скользящем окне на базе гистограммы с логарифмическими
+корзинами (в стиле HDR), поэтому /ping без аргументов отвечает мгновенно.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from probe_engine import probe_host
+
+logger = logging.getLogger(__name__)
+
+# Корзины: от 0.01 мс с шагом 4% — относительная погрешность перцентилей ~2%
+_BUCKET_MIN_MS = 0.01
+_BUCKET_RATIO = 1.04
+_BUCKET_COUNT = 400  # Верхняя граница ~66 секунд
+_LOG_RATIO = math.log(_BUCKET_RATIO)
+_LOST = -1
+
+
+def _bucket_index(latency_ms: float) -> int:
+    if latency_ms <= _BUCKET_MIN_MS:
+        return 0
+    return min(_BUCKET_COUNT - 1, int(math.log(latency_ms / _BUCKET_MIN_MS) / _LOG_RATIO))
+
+
+def _bucket_value(index: int) -> float:
+    # Середина корзины в геометрическом смысле
+    return _BUCKET_MIN_MS * _BUCKET_RATIO ** (index + 0.5)
+
+
+class RollingLatencyHistogram:
+    """Гистограмма задержек по последним window замерам (фиксированный размер памяти)"""
+
+    def __init__(self, window: int):
+        self.counts: List[int] = [0] * _BUCKET_COUNT
+        self.samples: Deque[int] = deque(maxlen=window)
+        self.received = 0
+        self.jitter_ms = 0.0
+        self._last_latency: Optional[float] = None
+        self.last_updated: Optional[float] = None
+
+    def record(self, latency_ms: Optional[float]) -> None:
+        """Добавить замер (None — потерянный пакет)"""
+        if len(self.samples) == self.samples.maxlen:
+            evicted = self.samples[0]
+            if evicted != _LOST:
+                self.counts[evicted] -= 1
+                self.received -= 1
+
+        if latency_ms is None:
+            self.samples.append(_LOST)
+        else:
+            index = _bucket_index(latency_ms)
+            self.samples.append(index)
+            self.counts[index] += 1
+            self.received += 1
+            # Сглаженный jitter по RFC 3550: J += (|D| - J) / 16
+            if self._last_latency is not None:
+                self.jitter_ms += (abs(latency_ms - self._last_latency) - self.jitter_ms) / 16
+            self._last_latency = latency_ms
+        self.last_updated = time.time()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Перцентиль задержки в мс по полученным ответам"""
+        if self.received == 0:
+            return None
+        rank = max(1, math.ceil(self.received * pct / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return _bucket_value(index)
+        return _bucket_value(_BUCKET_COUNT - 1)
+
+    @property
+    def loss_pct(self) -> float:
+        if not self.samples:
+            return 0.0
+        return (len(self.samples) - self.received) / len(self.samples) * 100
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            'samples': len(self.samples),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'jitter_ms': self.jitter_ms if self.received > 1 else None,
+            'loss_pct': self.loss_pct,
+            'last_updated': self.last_updated,
+        }
+
+
+class LatencyMonitor:
+    """Периодически опрашивает цели и обновляет их гистограммы"""
+
+    def __init__(self, targets: List[str], interval: float, window: int, timeout: float = 2):
+        self.targets = list(targets)
+        self.interval = interval
+        self.timeout = timeout
+        self.histograms: Dict[str, RollingLatencyHistogram] = {
+            host: RollingLatencyHistogram(window) for host in self.targets
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe_target(self, host: str) -> None:
+        try:
+            result = await probe_host(host, None, count=1, timeout_seconds=self.timeout)
+            latency = float(result['avg_ms']) if result['avg_ms'] is not None else None
+        except Exception as e:
+            logger.debug(f"Ошибка фонового замера {host}: {e}")
+            latency = None
+        self.histograms[host].record(latency)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.gather(*(self._probe_target(host) for host in self.targets))
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Запустить фоновые замеры (из работающего event loop)"""
+        if not self.targets:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"📡 Фоновый мониторинг задержек: {len(self.targets)} целей каждые {self.interval:g}с")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def has_data(self, min_samples: int = 1) -> bool:
+        return bool(self.histograms) and all(
+            len(h.samples) >= min_samples for h in self.histograms.values()
+        )
+
+    def summaries(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {host: h.summary() for host, h in self.histograms.items()}
+
+
+latency_monitor: Optional[LatencyMonitor] = None
+
+
+def start_latency_monitor(targets: List[str], interval: float, window: int) -> LatencyMonitor:
+    """Создать и запустить глобальный монитор задержек"""
+    global latency_monitor
+    if latency_monitor is None:
+        latency_monitor = LatencyMonitor(targets, interval=interval, window=window)
+    latency_monitor.start()
+    return latency_monitor
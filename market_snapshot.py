@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Типизированный снимок рынка.
+Ответы источников (вложенные словари) один раз превращаются в записи Quote
+со __slots__ и неизменяемый MarketSnapshot с колонками цен в array('d'),
+индексированными по ID актива. Потребители читают поля напрямую, без цепочек .get().
+"""
+
+import itertools
+import math
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from asset_registry import registry
+
+# Категории снимка в порядке источников fetch_market_data
+CATEGORIES = ('currencies', 'forex', 'crypto', 'stocks', 'commodities', 'indices')
+
+_NAN = float('nan')
+_version_counter = itertools.count(1)
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+class Quote:
+    """Котировка одного актива"""
+
+    __slots__ = (
+        'asset_id', 'key', 'category', 'name', 'emoji',
+        'price', 'change_pct', 'is_live', 'source', 'note', 'estimated',
+    )
+
+    def __init__(
+        self,
+        key: str,
+        category: str,
+        name: str,
+        price: Optional[float],
+        change_pct: Optional[float] = 0.0,
+        is_live: bool = True,
+        source: str = '',
+        note: str = '',
+        emoji: str = '',
+        estimated: bool = False,
+    ):
+        # Активы, которых нет в config (например, новые тикеры источника), дорегистрируются
+        self.asset_id = registry.register(key, category, name=name, emoji=emoji).id
+        self.key = key
+        self.category = category
+        self.name = name
+        self.emoji = emoji
+        self.price = price
+        self.change_pct = change_pct
+        self.is_live = is_live
+        self.source = source
+        self.note = note
+        self.estimated = estimated
+
+    def __repr__(self) -> str:
+        return f"Quote({self.key!r}, price={self.price!r})"
+
+
+class MarketSnapshot:
+    """
+    Неизменяемый снимок рынка
+
+    version растет при каждом обновлении любого источника,
+    section_versions — отдельно по категориям (для кэширования производных данных).
+    """
+
+    __slots__ = (
+        'version', 'section_versions', 'created_at',
+        'usd_rub', 'eur_rub', 'cny_rub',
+        'forex_usd_rub', 'forex_eur_usd', 'forex_cny_usd',
+        'prices', 'change_pct', 'quotes', 'categories',
+    )
+
+    def __init__(
+        self,
+        version: int,
+        section_versions: Dict[str, int],
+        quotes: List[Quote],
+        usd_rub: Optional[float] = None,
+        eur_rub: Optional[float] = None,
+        cny_rub: Optional[float] = None,
+        forex_usd_rub: Optional[float] = None,
+        forex_eur_usd: Optional[float] = None,
+        forex_cny_usd: Optional[float] = None,
+    ):
+        size = max((q.asset_id for q in quotes), default=-1) + 1
+        prices = array('d', itertools.repeat(_NAN, size))
+        change_pct = array('d', itertools.repeat(_NAN, size))
+        by_id: List[Optional[Quote]] = [None] * size
+        categories: Dict[str, List[int]] = {}
+        for quote in quotes:
+            by_id[quote.asset_id] = quote
+            if quote.price is not None:
+                prices[quote.asset_id] = quote.price
+            if quote.change_pct is not None:
+                change_pct[quote.asset_id] = quote.change_pct
+            categories.setdefault(quote.category, []).append(quote.asset_id)
+
+        assign = object.__setattr__
+        assign(self, 'version', version)
+        assign(self, 'section_versions', dict(section_versions))
+        assign(self, 'created_at', time.time())
+        assign(self, 'usd_rub', usd_rub)
+        assign(self, 'eur_rub', eur_rub)
+        assign(self, 'cny_rub', cny_rub)
+        assign(self, 'forex_usd_rub', forex_usd_rub)
+        assign(self, 'forex_eur_usd', forex_eur_usd)
+        assign(self, 'forex_cny_usd', forex_cny_usd)
+        assign(self, 'prices', prices)
+        assign(self, 'change_pct', change_pct)
+        assign(self, 'quotes', tuple(by_id))
+        assign(self, 'categories', {name: tuple(ids) for name, ids in categories.items()})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MarketSnapshot неизменяем")
+
+    def quote(self, key: str) -> Optional[Quote]:
+        index = registry.id_of(key)
+        if index is None or index >= len(self.quotes):
+            return None
+        return self.quotes[index]
+
+    def price(self, key: str) -> Optional[float]:
+        """Цена актива или None, если источник ее не дал"""
+        index = registry.id_of(key)
+        if index is None or index >= len(self.prices):
+            return None
+        value = self.prices[index]
+        return None if math.isnan(value) else value
+
+    def quotes_in(self, category: str) -> Iterator[Quote]:
+        for index in self.categories.get(category, ()):
+            yield self.quotes[index]
+
+    def alert_prices(self) -> Dict[str, Optional[float]]:
+        """Цены для уведомлений: валюты ЦБ, крипта, акции и товары"""
+        return {
+            quote.key: quote.price
+            for category in ('currencies', 'crypto', 'stocks', 'commodities')
+            for quote in self.quotes_in(category)
+        }
+
+    def estimated_assets(self) -> Set[str]:
+        """Активы с расчетной ценой (по ним не уведомляем)"""
+        return {quote.key for quote in self.quotes if quote is not None and quote.estimated}
+
+    def to_report_dict(self, generated_at: str) -> Dict[str, Any]:
+        """Сериализуемый снимок для рендера PDF в рабочем процессе"""
+        return {
+            'generated_at': generated_at,
+            'usd_rate': self.usd_rub or 0,
+            'eur_rate': self.eur_rub or 0,
+            'cny_rate': self.cny_rub or 0,
+            'forex_usd_rub': self.forex_usd_rub,
+            'crypto': {
+                q.key: {'name': q.name, 'price': q.price, 'change_24h': q.change_pct, 'source': q.source}
+                for q in self.quotes_in('crypto')
+            },
+            'commodities': {
+                q.key: {'name': q.name, 'price': q.price, 'note': q.note}
+                for q in self.quotes_in('commodities')
+            },
+            'indices': {
+                q.key: {'name': q.name, 'price': q.price, 'change_pct': q.change_pct, 'is_live': q.is_live}
+                for q in self.quotes_in('indices')
+            },
+        }
+
+
+def _currency_quotes(cbr_data: Any) -> Tuple[List[Quote], Dict[str, Optional[float]]]:
+    valute = cbr_data.get('Valute', {}) if isinstance(cbr_data, dict) else {}
+    quotes, rates = [], {}
+    for asset in registry.in_category('currencies'):
+        info = valute.get(asset.key)
+        rate = _number(info.get('Value')) if isinstance(info, dict) else None
+        rates[asset.key] = rate
+        quotes.append(Quote(asset.key, 'currencies', asset.name, rate, source='ЦБ РФ'))
+    return quotes, rates
+
+
+def _crypto_quotes(crypto_data: Any) -> List[Quote]:
+    quotes = []
+    if not isinstance(crypto_data, dict):
+        return quotes
+    for asset in registry.in_category('crypto'):
+        info = crypto_data.get(asset.symbol('coingecko'))
+        if not isinstance(info, dict):
+            continue
+        quotes.append(Quote(
+            asset.key, 'crypto', asset.name, _number(info.get('price')),
+            change_pct=_number(info.get('change_24h')) or 0.0,
+            source=info.get('source', ''),
+        ))
+    return quotes
+
+
+def _stock_quotes(stocks_data: Any) -> List[Quote]:
+    quotes = []
+    if not isinstance(stocks_data, dict):
+        return quotes
+    for ticker, info in stocks_data.items():
+        if not isinstance(info, dict):
+            continue
+        quotes.append(Quote(
+            ticker, 'stocks', info.get('name', ticker), _number(info.get('price')),
+            change_pct=_number(info.get('change_pct')),
+            is_live=info.get('is_live', True),
+            note=info.get('note', ''),
+            emoji=info.get('emoji', ''),
+        ))
+    return quotes
+
+
+def _is_estimated_commodity(key: str, info: Dict[str, Any]) -> bool:
+    # Для Urals цена всегда расчетная
+    note = str(info.get('note', '')).lower()
+    name = str(info.get('name', '')).lower()
+    return (
+        key == 'urals'
+        or 'расчет' in note
+        or 'calculated' in note
+        or 'расчет' in name
+        or 'calculated' in name
+    )
+
+
+def _commodity_quotes(commodities_data: Any) -> List[Quote]:
+    quotes = []
+    if not isinstance(commodities_data, dict):
+        return quotes
+    for key, info in commodities_data.items():
+        if not isinstance(info, dict):
+            continue
+        quotes.append(Quote(
+            key, 'commodities', info.get('name', key), _number(info.get('price')),
+            change_pct=_number(info.get('change_pct')) or 0.0,
+            note=info.get('note', ''),
+            source=info.get('source', ''),
+            estimated=_is_estimated_commodity(key, info),
+        ))
+    return quotes
+
+
+def _index_quotes(indices_data: Any) -> List[Quote]:
+    quotes = []
+    if not isinstance(indices_data, dict):
+        return quotes
+    for key, info in indices_data.items():
+        if not isinstance(info, dict):
+            continue
+        quotes.append(Quote(
+            key, 'indices', info.get('name', key.upper()), _number(info.get('price')),
+            change_pct=_number(info.get('change_pct')) or 0.0,
+            is_live=info.get('is_live', True),
+            note=info.get('note', ''),
+        ))
+    return quotes
+
+
+# Последние исходные объекты по категориям: get_cached_data возвращает тот же
+# объект, пока жив кэш, поэтому снимок пересобирается только при обновлении источника
+_last_sources: Dict[str, Any] = {}
+_last_snapshot: Optional[MarketSnapshot] = None
+
+
+def snapshot_from_sources(sources: Dict[str, Any]) -> MarketSnapshot:
+    """
+    Получить снимок для результатов fetch_market_data
+
+    Args:
+        sources: Ответы источников по категориям CATEGORIES
+                 (исключение на месте источника — временный сбой: категория
+                 и ее версия остаются из предыдущего снимка, как и у незапрошенных)
+    """
+    global _last_snapshot
+    changed = [
+        name for name in CATEGORIES
+        if name in sources
+        and not isinstance(sources[name], Exception)
+        and sources[name] is not _last_sources.get(name)
+    ]
+    if _last_snapshot is not None and not changed:
+        return _last_snapshot
+
+    version = next(_version_counter)
+    section_versions = dict(_last_snapshot.section_versions) if _last_snapshot else {}
+    for name in changed:
+        section_versions[name] = version
+        _last_sources[name] = sources[name]
+    sources = _last_sources
+
+    currency_quotes, rates = _currency_quotes(sources.get('currencies'))
+    forex = sources.get('forex')
+    forex_rates = forex.get('rates', {}) if isinstance(forex, dict) else {}
+
+    quotes = (
+        currency_quotes
+        + _crypto_quotes(sources.get('crypto'))
+        + _stock_quotes(sources.get('stocks'))
+        + _commodity_quotes(sources.get('commodities'))
+        + _index_quotes(sources.get('indices'))
+    )
+    _last_snapshot = MarketSnapshot(
+        version,
+        section_versions,
+        quotes,
+        usd_rub=rates.get('USD'),
+        eur_rub=rates.get('EUR'),
+        cny_rub=rates.get('CNY'),
+        forex_usd_rub=_number(forex_rates.get('RUB')),
+        forex_eur_usd=_number(forex_rates.get('EUR')),
+        forex_cny_usd=_number(forex_rates.get('CNY')),
+    )
+    return _last_snapshot
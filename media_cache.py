@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Кэш загруженных в Telegram файлов.
+Хэш содержимого -> file_id первой загрузки: повторная отправка тех же
+байтов (PDF того же снимка, тот же график, картинка рассылки) ссылается
+на file_id и не загружает файл заново. Соответствие сохраняется на диск —
+file_id бота действует и после рестарта.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Optional
+
+from telegram.error import TelegramError
+
+from config import MEDIA_CACHE_FILE, MEDIA_CACHE_SIZE
+from monitoring import increment_metric
+
+logger = logging.getLogger(__name__)
+
+# Тип медиа -> (метод бота, аргумент с файлом)
+_SENDERS = {
+    'document': ('send_document', 'document'),
+    'photo': ('send_photo', 'photo'),
+}
+
+
+class MediaCache:
+    """
+    LRU-соответствие хэша содержимого и file_id Telegram
+
+    Args:
+        path: JSON-файл для сохранения (None — только в памяти)
+        limit: Максимум записей
+    """
+
+    def __init__(self, path: Optional[str], limit: int):
+        self.path = path
+        self.limit = limit
+        self._file_ids: 'OrderedDict[str, str]' = OrderedDict()
+        self._loaded = False
+
+    @staticmethod
+    def key(kind: str, content: bytes) -> str:
+        return f"{kind}:{hashlib.sha256(content).hexdigest()}"
+
+    def _load(self) -> None:
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._file_ids.update(json.load(f))
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш file_id {self.path} не прочитан: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._file_ids, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения кэша file_id: {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._loaded:
+            self._load()
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+        return file_id
+
+    def put(self, key: str, file_id: str) -> None:
+        if not self._loaded:
+            self._load()
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.limit:
+            self._file_ids.popitem(last=False)
+        self._save()
+
+    def discard(self, key: str) -> None:
+        if self._file_ids.pop(key, None) is not None:
+            self._save()
+
+
+def _uploaded_file_id(message: Any, kind: str) -> Optional[str]:
+    if kind == 'photo':
+        return message.photo[-1].file_id if message.photo else None
+    document = getattr(message, kind, None)
+    return document.file_id if document is not None else None
+
+
+async def send_cached_media(
+    bot,
+    kind: str,
+    chat_id: int,
+    content: bytes,
+    filename: Optional[str] = None,
+    cache_key: Optional[str] = None,
+    **kwargs
+):
+    """
+    Отправить документ или фото, переиспользуя file_id для того же содержимого
+
+    Args:
+        bot: Объект бота
+        kind: 'document' или 'photo'
+        content: Байты файла
+        filename: Имя файла при первой загрузке
+        cache_key: Ключ вместо хэша содержимого — для файлов, байты которых
+                   меняются при тех же данных (например, время генерации в PDF)
+        **kwargs: Остальные параметры send_document/send_photo (caption и т.д.)
+
+    Returns:
+        Отправленное сообщение
+    """
+    method_name, file_arg = _SENDERS[kind]
+    send = getattr(bot, method_name)
+    key = f"{kind}:{cache_key}" if cache_key is not None else MediaCache.key(kind, content)
+
+    file_id = media_cache.get(key)
+    if file_id is not None:
+        try:
+            message = await send(chat_id=chat_id, **{file_arg: file_id}, **kwargs)
+            increment_metric('media_cache_hits_total')
+            increment_metric('media_cache_bytes_saved_total', len(content))
+            return message
+        except TelegramError as e:
+            # file_id мог устареть (например, сменился токен бота) — загружаем заново
+            logger.warning(f"⚠️ file_id не принят Telegram, загружаю файл заново: {e}")
+            media_cache.discard(key)
+
+    increment_metric('media_cache_misses_total')
+    upload = io.BytesIO(content)
+    if filename:
+        kwargs['filename'] = filename
+    message = await send(chat_id=chat_id, **{file_arg: upload}, **kwargs)
+    uploaded = _uploaded_file_id(message, kind)
+    if uploaded:
+        media_cache.put(key, uploaded)
+    return message
+
+
+media_cache = MediaCache(MEDIA_CACHE_FILE, MEDIA_CACHE_SIZE)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Метрики бота и мониторинг задержек event loop.
+Сторожевой поток ловит синхронные вызовы, блокирующие loop, и сохраняет их стек.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, float] = {}
+
+
+def increment_metric(name: str, value: float = 1) -> None:
+    """Увеличить счетчик метрики"""
+    with _metrics_lock:
+        _metrics[name] = _metrics.get(name, 0) + value
+
+
+def set_metric(name: str, value: float) -> None:
+    """Установить значение метрики (gauge)"""
+    with _metrics_lock:
+        _metrics[name] = value
+
+
+def get_metrics() -> Dict[str, float]:
+    """Получить копию всех метрик"""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class LoopLagMonitor:
+    """
+    Измеряет задержку планирования event loop.
+
+    Heartbeat-задача в loop периодически засыпает на interval и измеряет,
+    насколько позже запланированного она проснулась. Отдельный поток следит
+    за временем последнего heartbeat: если loop не отвечает дольше threshold,
+    поток снимает стек потока loop через sys._current_frames() — это и есть
+    блокирующий синхронный вызов.
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.25, max_events: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._beat_seq = 0
+        self._reported_seq = -1
+
+    def start(self) -> None:
+        """Запустить мониторинг (вызывать из работающего event loop)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"✅ Мониторинг event loop запущен (интервал {self.interval}с, порог {self.threshold * 1000:.0f} мс)"
+        )
+
+    def stop(self) -> None:
+        """Остановить мониторинг"""
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self._last_beat = time.monotonic()
+            self._beat_seq += 1
+
+            lag_ms = lag * 1000
+            set_metric('loop_lag_last_ms', round(lag_ms, 2))
+            with _metrics_lock:
+                if lag_ms > _metrics.get('loop_lag_max_ms', 0):
+                    _metrics['loop_lag_max_ms'] = round(lag_ms, 2)
+            if lag >= self.threshold:
+                increment_metric('loop_lag_events_total')
+                logger.warning(f"⚠️ Задержка event loop: {lag_ms:.0f} мс")
+
+    def _watchdog(self) -> None:
+        while not self._stop_event.wait(self.interval / 2):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            seq = self._beat_seq
+            if stalled_for < self.threshold or seq == self._reported_seq:
+                continue
+
+            # Один отчет на одну блокировку: ждем следующий heartbeat
+            self._reported_seq = seq
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame, limit=12) if frame is not None else []
+            location = stack[-1].strip().splitlines()[0] if stack else "неизвестно"
+
+            self.events.append({
+                'timestamp': time.time(),
+                'stalled_ms': round(stalled_for * 1000, 1),
+                'location': location,
+                'stack': ''.join(stack),
+            })
+            increment_metric('loop_blocked_total')
+            logger.warning(
+                f"🐢 Event loop заблокирован >{stalled_for * 1000:.0f} мс в {location}\n{''.join(stack)}"
+            )
+
+    def get_recent_events(self) -> List[Dict[str, Any]]:
+        """Последние зафиксированные блокировки"""
+        return list(self.events)
+
+
+loop_monitor: Optional[LoopLagMonitor] = None
+
+
+def start_loop_monitor(interval: float, threshold: float) -> LoopLagMonitor:
+    """Создать и запустить глобальный монитор event loop"""
+    global loop_monitor
+    if loop_monitor is None:
+        loop_monitor = LoopLagMonitor(interval=interval, threshold=threshold)
+    loop_monitor.start()
+    return loop_monitor
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Генерация PDF отчета.
+Рендер выполняется в отдельном процессе по сериализуемому снимку данных,
+чтобы reportlab не блокировал event loop бота.
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from utils import format_price
+
+logger = logging.getLogger(__name__)
+
+# reportlab (может отсутствовать) импортируется только в рабочем процессе рендера:
+# при старте бота проверяем лишь наличие пакета, чтобы не замедлять холодный старт
+REPORTLAB_AVAILABLE = importlib.util.find_spec('reportlab') is not None
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_pdf_executor(max_workers: int = 1) -> ProcessPoolExecutor:
+    """Получить (или создать) пул процессов для рендера PDF"""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _pdf_executor
+
+
+def shutdown_pdf_executor() -> None:
+    """Остановить пул процессов рендера PDF"""
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+
+def snapshot_version(snapshot: Dict[str, Any]) -> str:
+    """
+    Версия снимка данных для ключа кэша PDF
+
+    Время генерации не входит в версию: одинаковые данные дают одинаковый отчет.
+    """
+    payload = {k: v for k, v in snapshot.items() if k != 'generated_at'}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _header_table_style(header_color, body_color, align: str = 'CENTER'):
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), align),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), body_color),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ])
+
+
+def build_pdf_report(snapshot: Dict[str, Any]) -> bytes:
+    """
+    Построить PDF отчет по снимку данных (выполняется в рабочем процессе)
+
+    Args:
+        snapshot: Сериализуемый снимок рыночных данных
+
+    Returns:
+        Содержимое PDF файла
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise RuntimeError("reportlab не установлен")
+
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+
+    current_time = snapshot['generated_at']
+    usd_rate = snapshot.get('usd_rate') or 0
+    eur_rate = snapshot.get('eur_rate') or 0
+    cny_rate = snapshot.get('cny_rate') or 0
+    forex_usd_rub = snapshot.get('forex_usd_rub')
+    crypto_data = snapshot.get('crypto') or {}
+    commodities_data = snapshot.get('commodities') or {}
+    indices_data = snapshot.get('indices') or {}
+
+    # Создаем PDF в памяти (invariant=1: без даты создания и случайного ID в метаданных)
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, invariant=1)
+    story = []
+
+    # Создаем стили с поддержкой русского языка
+    styles = getSampleStyleSheet()
+
+    # Стиль для заголовка
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=20,
+        alignment=1,  # Центр
+        textColor=colors.darkblue,
+        fontName='Helvetica-Bold',
+        encoding='utf-8'
+    )
+
+    # Стиль для подзаголовков
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=12,
+        spaceAfter=10,
+        spaceBefore=15,
+        textColor=colors.darkgreen,
+        fontName='Helvetica-Bold',
+        encoding='utf-8'
+    )
+
+    # Стиль для обычного текста
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=9,
+        spaceAfter=5,
+        fontName='Helvetica',
+        encoding='utf-8'
+    )
+
+    # Стиль для информации
+    info_style = ParagraphStyle(
+        'CustomInfo',
+        parent=styles['Normal'],
+        fontSize=8,
+        spaceAfter=3,
+        textColor=colors.grey,
+        fontName='Helvetica',
+        encoding='utf-8'
+    )
+
+    # Заголовок отчета
+    story.append(Paragraph(f"<b>FINANCIAL REPORT</b><br/>from {current_time}", title_style))
+
+    # Информация о боте
+    story.append(Paragraph(
+        "Financial Bot - current data on currencies, cryptocurrencies, stocks and indices",
+        info_style
+    ))
+    story.append(Spacer(1, 20))
+
+    # 1. КУРСЫ ВАЛЮТ
+    story.append(Paragraph("<b>CURRENCY RATES</b>", heading_style))
+
+    currency_data = [
+        ['Currency', 'Rate (RUB)', 'Source', 'Status']
+    ]
+
+    currencies = [
+        ('USD', usd_rate, 'CBR'),
+        ('EUR', eur_rate, 'CBR'),
+        ('CNY', cny_rate, 'CBR')
+    ]
+
+    for currency, rate, source in currencies:
+        if rate and rate > 0:
+            status = "Active"
+            if currency == 'USD' and forex_usd_rub:
+                diff = forex_usd_rub - rate
+                diff_pct = (diff / rate) * 100
+                status = f"FOREX: {forex_usd_rub:.2f}RUB ({diff:+.2f}, {diff_pct:+.2f}%)"
+        else:
+            status = "No data"
+
+        currency_data.append([currency, f"{format_price(rate)}", source, status])
+
+    currency_table = Table(currency_data, colWidths=[1.2*inch, 1.5*inch, 1.2*inch, 2.1*inch])
+    currency_table.setStyle(_header_table_style(colors.darkblue, colors.lightblue))
+    story.append(currency_table)
+    story.append(Spacer(1, 15))
+
+    # 2. КРИПТОВАЛЮТЫ
+    story.append(Paragraph("<b>CRYPTOCURRENCIES</b>", heading_style))
+
+    crypto_table_data = [['Cryptocurrency', 'Price (USD)', '24h Change', 'Status']]
+
+    # Порядок и названия криптовалют задает реестр активов при сборке снимка
+    for crypto_key, crypto_info in crypto_data.items():
+        crypto_name = crypto_info.get('name', crypto_key)
+        price = crypto_info.get('price', 0)
+        change = crypto_info.get('change_24h', 0)
+
+        if price and price > 0:
+            change_str = f"{change:+.2f}%" if change is not None else "N/A"
+            if change and change > 0:
+                status = "Up"
+            elif change and change < 0:
+                status = "Down"
+            else:
+                status = "No change"
+
+            crypto_table_data.append([crypto_name, f"${format_price(price)}", change_str, status])
+
+    if len(crypto_table_data) > 1:  # Есть данные
+        crypto_table = Table(crypto_table_data, colWidths=[1.5*inch, 1.5*inch, 1.2*inch, 1.8*inch])
+        crypto_table.setStyle(_header_table_style(colors.darkgreen, colors.lightgreen))
+        story.append(crypto_table)
+    else:
+        story.append(Paragraph("Cryptocurrency data temporarily unavailable", normal_style))
+
+    story.append(Spacer(1, 15))
+
+    # 3. ФОНДОВЫЕ ИНДЕКСЫ
+    if indices_data:
+        story.append(Paragraph("<b>STOCK INDICES</b>", heading_style))
+
+        indices_data_table = [['Index', 'Value', 'Change', 'Status']]
+
+        for index_id, index_info in indices_data.items():
+            name = index_info.get('name', index_id.upper())
+            price = index_info.get('price', 0)
+            change = index_info.get('change_pct', 0)
+            is_live = index_info.get('is_live', True)
+
+            if price and price > 0:
+                change_str = f"{change:+.2f}%" if change != 0 else "0.00%"
+                status = "Trading open" if is_live else "Trading closed"
+                indices_data_table.append([name, str(price), change_str, status])
+
+        if len(indices_data_table) > 1:
+            indices_table = Table(indices_data_table, colWidths=[1.5*inch, 1.5*inch, 1.2*inch, 1.8*inch])
+            indices_table.setStyle(_header_table_style(colors.darkred, colors.lightcoral))
+            story.append(indices_table)
+
+    story.append(Spacer(1, 15))
+
+    # 4. ДРАГОЦЕННЫЕ МЕТАЛЛЫ
+    if commodities_data:
+        story.append(Paragraph("<b>PRECIOUS METALS</b>", heading_style))
+
+        metals_data = [['Metal', 'Price (USD)', 'Price (RUB)', 'Status']]
+
+        metals = {
+            'gold': ('Gold', 'XAU'),
+            'silver': ('Silver', 'XAG')
+        }
+
+        for metal_id, (metal_name, symbol) in metals.items():
+            if metal_id in commodities_data:
+                price_usd = commodities_data[metal_id]['price']
+                price_rub = price_usd * usd_rate if usd_rate > 0 else 0
+
+                if price_usd and price_usd > 0:
+                    metals_data.append([
+                        metal_name,
+                        f"${format_price(price_usd)}",
+                        f"{format_price(price_rub)} RUB",
+                        "Active"
+                    ])
+
+        if len(metals_data) > 1:
+            metals_table = Table(metals_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1.5*inch])
+            metals_table.setStyle(_header_table_style(colors.darkgoldenrod, colors.lightyellow))
+            story.append(metals_table)
+
+    story.append(Spacer(1, 20))
+
+    # 5. ИСТОЧНИКИ ДАННЫХ
+    story.append(Paragraph("<b>DATA SOURCES</b>", heading_style))
+
+    sources_data = [
+        ['Source', 'Data', 'Status'],
+        ['CBR', 'Currency rates', 'Active'],
+        ['CoinGecko', 'Cryptocurrencies', 'Active'],
+        ['MOEX', 'Russian indices and stocks', 'Active'],
+        ['Gold-API', 'Precious metals', 'Active'],
+        ['Alpha Vantage', 'International data', 'Demo key'],
+        ['FOREX', 'Interbank rates', 'Active']
+    ]
+
+    sources_table = Table(sources_data, colWidths=[2*inch, 3*inch, 1*inch])
+    sources_table.setStyle(_header_table_style(colors.darkgrey, colors.lightgrey, align='LEFT'))
+    story.append(sources_table)
+
+    story.append(Spacer(1, 20))
+
+    # 6. ФУТЕР
+    footer_text = f"""
+    <b>Report generated:</b> {current_time}<br/>
+    <b>Financial Bot</b> - your assistant in the world of finance<br/>
+    <i>Data updates in real time</i>
+    """
+    story.append(Paragraph(footer_text, info_style))
+
+    # Создаем PDF
+    doc.build(story)
+    return buffer.getvalue()
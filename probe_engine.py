@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Асинхронные проверки доступности хостов для /ping без запуска процессов.
+ICMP echo через непривилегированные datagram-сокеты (если разрешены ядром),
+иначе конкурентная TCP-проверка.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import struct
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TCP_PORTS = (443, 80, 53)
+
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+_ICMPV6_ECHO_REQUEST = 128
+_ICMPV6_ECHO_REPLY = 129
+
+_icmp_available: Optional[bool] = None
+
+
+def icmp_available() -> bool:
+    """Проверить (один раз), разрешены ли непривилегированные ICMP-сокеты"""
+    global _icmp_available
+    if _icmp_available is None:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            sock.close()
+            _icmp_available = True
+        except (OSError, AttributeError) as e:
+            logger.info(f"ℹ️ ICMP datagram-сокеты недоступны ({e}), /ping будет использовать TCP")
+            _icmp_available = False
+    return _icmp_available
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _build_echo_request(seq: int, ipv6: bool) -> bytes:
+    icmp_type = _ICMPV6_ECHO_REQUEST if ipv6 else _ICMP_ECHO_REQUEST
+    # Идентификатор для datagram-сокета подставляет ядро
+    payload = struct.pack("!Q", time.perf_counter_ns()) + b"tgbot-ping"
+    header = struct.pack("!BBHHH", icmp_type, 0, 0, os.getpid() & 0xFFFF, seq)
+    checksum = 0 if ipv6 else _checksum(header + payload)  # ICMPv6 checksum считает ядро
+    header = struct.pack("!BBHHH", icmp_type, 0, checksum, os.getpid() & 0xFFFF, seq)
+    return header + payload
+
+
+async def icmp_probe_once(host: str, seq: int, timeout_seconds: float = 2) -> Tuple[Optional[float], str]:
+    """
+    Отправить один ICMP echo и дождаться ответа
+
+    Returns:
+        (задержка в мс или None, текст ошибки)
+    """
+    ipv6 = ipaddress.ip_address(host).version == 6
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    proto = socket.IPPROTO_ICMPV6 if ipv6 else socket.IPPROTO_ICMP
+    reply_type = _ICMPV6_ECHO_REPLY if ipv6 else _ICMP_ECHO_REPLY
+
+    loop = asyncio.get_running_loop()
+    sock = None
+    try:
+        # Без непривилегированного ICMP (часто для IPv6) ошибка уже здесь: отдаем ее
+        # как результат пробы, чтобы вызывающий переключился на TCP
+        sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+        sock.setblocking(False)
+        packet = _build_echo_request(seq, ipv6)
+        started = time.perf_counter_ns()
+        deadline = loop.time() + timeout_seconds
+        await loop.sock_sendto(sock, packet, (host, 0))
+
+        # Каждая проба живет в своем сокете: ядро доставляет сюда только ответы
+        # с нашим идентификатором, сверяем лишь тип и номер последовательности
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None, "таймаут"
+            data, _ = await asyncio.wait_for(loop.sock_recvfrom(sock, 1024), timeout=remaining)
+            if len(data) >= 8 and data[0] == reply_type and struct.unpack("!H", data[6:8])[0] == seq:
+                return (time.perf_counter_ns() - started) / 1_000_000, ""
+    except asyncio.TimeoutError:
+        return None, "таймаут"
+    except OSError as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+async def tcp_probe_port_once(host: str, port: int, timeout_seconds: float = 2) -> Tuple[Optional[float], str]:
+    """Измерить время TCP-рукопожатия до host:port"""
+    started = time.perf_counter_ns()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout_seconds)
+        latency_ms = (time.perf_counter_ns() - started) / 1_000_000
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return latency_ms, ""
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+
+
+async def tcp_probe_sample(host: str, ports: List[int], timeout_seconds: float = 2) -> Tuple[Optional[float], Optional[int], str]:
+    """
+    Одна TCP-проба: параллельно подключаемся ко всем портам, берем первый успешный
+
+    Returns:
+        (задержка в мс или None, порт ответа, последняя ошибка)
+    """
+    tasks = {
+        asyncio.ensure_future(tcp_probe_port_once(host, port, timeout_seconds)): port
+        for port in ports
+    }
+    last_error = ""
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                latency_ms, err = task.result()
+                if latency_ms is not None:
+                    return latency_ms, tasks[task], ""
+                if err:
+                    last_error = err
+        return None, None, last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def _format_loss(failures: int, count: int) -> str:
+    loss = (failures / count) * 100
+    return f"{loss:.1f}".rstrip("0").rstrip(".")
+
+
+async def probe_host(host: str, port: Optional[int], count: int = 4, timeout_seconds: float = 2) -> dict:
+    """
+    Проверить хост: все пробы выполняются одновременно
+
+    ICMP используется, если порт не указан и ICMP-сокеты доступны;
+    иначе TCP до указанного порта или до портов по умолчанию.
+    """
+    result = {
+        "host": host,
+        "ok": False,
+        "packet_loss": "100",
+        "min_ms": None,
+        "avg_ms": None,
+        "max_ms": None,
+        "raw_error": "",
+        "mode": "tcp_fallback",
+        "probe_port": port,
+        "checked_ports": []
+    }
+
+    latencies: List[float] = []
+    last_error = ""
+
+    if port is None and icmp_available():
+        result["mode"] = "icmp"
+        samples = await asyncio.gather(
+            *(icmp_probe_once(host, seq, timeout_seconds) for seq in range(1, count + 1))
+        )
+        for latency_ms, err in samples:
+            if latency_ms is not None:
+                latencies.append(latency_ms)
+            elif err:
+                last_error = err
+        # Сокет не создался или не отправил пакет (не таймаут) — ICMP для этого
+        # адреса недоступен (например, IPv6), проверяем по TCP
+        if not latencies and all(err and err != "таймаут" for _, err in samples):
+            logger.info(f"ℹ️ ICMP до {host} недоступен ({last_error}), проверка по TCP")
+            result["mode"] = "tcp_fallback"
+            last_error = ""
+    if result["mode"] == "tcp_fallback":
+        ports_to_try = [port] if port is not None else list(DEFAULT_TCP_PORTS)
+        result["checked_ports"] = ports_to_try
+        samples = await asyncio.gather(
+            *(tcp_probe_sample(host, ports_to_try, timeout_seconds) for _ in range(count))
+        )
+        used_port = port
+        for latency_ms, sample_port, err in samples:
+            if latency_ms is not None:
+                latencies.append(latency_ms)
+                if used_port is None:
+                    used_port = sample_port
+            elif err:
+                last_error = err
+        if used_port is not None:
+            result["probe_port"] = used_port
+
+    result["packet_loss"] = _format_loss(count - len(latencies), count)
+    result["ok"] = len(latencies) > 0
+    result["raw_error"] = last_error
+
+    if latencies:
+        result["min_ms"] = f"{min(latencies):.2f}"
+        result["avg_ms"] = f"{(sum(latencies) / len(latencies)):.2f}"
+        result["max_ms"] = f"{max(latencies):.2f}"
+
+    return result
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Рендер сообщения /rates по секциям с кэшированием фрагментов.
+Шаблоны строк компилируются один раз при импорте; фрагмент секции
+хранится вместе с ключом данных, от которых он зависит (версия категории
+снимка, курс рубля, история цен). Повторный /rates без новых данных
+сводится к склейке готовых строк.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from asset_registry import Asset, registry
+from market_snapshot import MarketSnapshot
+from monitoring import increment_metric
+from utils import format_price
+
+TITLE = "📊 **На сегодня курсы такие:**\n\n"
+
+# Предкомпилированные шаблоны строк
+_CURRENCY_ROW = "{} {}: **{}**\n".format
+_CRYPTO_ROW = "{} {}: ${}{}{}{}\n".format
+_CRYPTO_MISSING = "{} {}: ❌ Н/Д\n".format
+_STOCK_ROW = "{} {} {}: **{} ₽**{}{}\n".format
+_COMMODITY_ROW = "{} {}: **${}**{}{}\n".format
+_INDEX_ROW = "{} {} {}: **{}** {}{}{}\n".format
+_INDEX_MISSING = "{} 🔴 {}: **Данные временно недоступны**\n".format
+_DELTA = " (Δ {:+.2f}% от последнего)".format
+
+# Кэш фрагментов: (секция, ключи активов) -> (ключ зависимостей, текст)
+_FRAGMENT_CACHE_LIMIT = 256
+_fragments: Dict[Tuple[str, Tuple[str, ...]], Tuple[Any, str]] = {}
+
+
+def _prefix(index: int, total: int) -> str:
+    return "├" if index < total - 1 else "└"
+
+
+def _delta(price_history: Dict[str, float], key: str, price: Optional[float]) -> str:
+    """Изменение относительно последней зафиксированной цены"""
+    if price is None:
+        return ""
+    previous = price_history.get(key)
+    if not previous:
+        return ""
+    return _DELTA((price - previous) / previous * 100)
+
+
+def _render_currencies(assets, snapshot, ctx) -> str:
+    values = ctx['currency_values']
+    rows = [asset.key for asset in assets if asset.key in values]
+    if not rows:
+        return ""
+    parts = ["🏛️ **ВАЛЮТЫ (по курсу ЦБ РФ):**\n"]
+    for i, key in enumerate(rows):
+        parts.append(_CURRENCY_ROW(_prefix(i, len(rows)), key, values[key]))
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _render_crypto(assets, snapshot, ctx) -> str:
+    usd_to_rub = ctx['usd_to_rub_rate']
+    parts = ["💎 **КРИПТА:**\n"]
+    for i, asset in enumerate(assets):
+        prefix = _prefix(i, len(assets))
+        quote = snapshot.quote(asset.key)
+        if quote is None or quote.price is None:
+            parts.append(_CRYPTO_MISSING(prefix, asset.name))
+            continue
+        decimals = asset.decimals
+        change = f" ({quote.change_pct:+.2f}% за 24ч)" if quote.change_pct else ""
+        source = f" [{quote.source}]" if quote.source != 'CoinGecko' else ""
+        rub = f" ({format_price(quote.price * usd_to_rub, decimals)} ₽)" if usd_to_rub > 0 else ""
+        parts.append(_CRYPTO_ROW(prefix, asset.name, format_price(quote.price, decimals), rub, change, source))
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _render_stock_rows(assets, snapshot, ctx) -> str:
+    quotes = [snapshot.quote(asset.key) for asset in assets]
+    if not any(q is not None and q.price is not None for q in quotes):
+        if ctx['is_weekend']:
+            return "🔴 **Торги закрыты** (выходной день)\n\n"
+        return "🔴 **Данные временно недоступны**\n\n"
+    history = ctx['price_history']
+    parts = []
+    for i, (asset, quote) in enumerate(zip(assets, quotes)):
+        if quote is None or not quote.price:
+            continue
+        icon = "🟢" if quote.is_live else "🟡"
+        # Изменение с открытия показываем только во время торгов
+        change = f" ({quote.change_pct:+.2f}% с открытия)" if quote.change_pct and quote.is_live else ""
+        parts.append(_STOCK_ROW(
+            _prefix(i, len(assets)), icon, asset.name, format_price(quote.price),
+            change, _delta(history, asset.key, quote.price)
+        ))
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _render_stocks(assets, snapshot, ctx) -> str:
+    return "📈 **РОССИЙСКИЕ АКЦИИ (MOEX):**\n" + _render_stock_rows(assets, snapshot, ctx)
+
+
+def _render_real_estate(assets, snapshot, ctx) -> str:
+    return "🏠 **НЕДВИЖИМОСТЬ:**\n" + _render_stock_rows(assets, snapshot, ctx)
+
+
+def _render_commodities(assets, snapshot, ctx) -> str:
+    usd_to_rub = ctx['usd_to_rub_rate']
+    history = ctx['price_history']
+    parts = ["🛠️ **ЗОЛОТО, НЕФТЬ:**\n"]
+    for i, asset in enumerate(assets):
+        quote = snapshot.quote(asset.key)
+        if quote is None or quote.price is None:
+            continue
+        price = quote.price
+        rub_price = price * usd_to_rub if usd_to_rub > 0 else 0
+        rub = f" ({format_price(rub_price)} ₽)" if rub_price > 0 else ""
+        parts.append(_COMMODITY_ROW(
+            _prefix(i, len(assets)), asset.name, format_price(price), rub,
+            _delta(history, asset.key, price)
+        ))
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _render_indices(assets, snapshot, ctx) -> str:
+    history = ctx['price_history']
+    parts = ["📊 **ФОНДОВЫЕ ИНДЕКСЫ:**\n"]
+    for i, asset in enumerate(assets):
+        prefix = _prefix(i, len(assets))
+        quote = snapshot.quote(asset.key)
+        if quote is None:
+            parts.append(_INDEX_MISSING(prefix, asset.name))
+            continue
+        if not quote.price:
+            parts.append(_INDEX_MISSING(prefix, quote.name))
+            continue
+        # IMOEX: с открытия во время торгов, иначе с закрытия
+        period = "с открытия" if quote.is_live else "с закрытия"
+        change = f"({quote.change_pct:+.2f}% {period})" if quote.change_pct else ""
+        icon = "🟢" if quote.is_live else "🟡"
+        note = f" ({quote.note})" if quote.note else ""
+        parts.append(_INDEX_ROW(
+            prefix, icon, quote.name, format_price(quote.price), change, note,
+            _delta(history, asset.key, quote.price)
+        ))
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _history_key(ctx, assets) -> tuple:
+    history = ctx['price_history']
+    return tuple(history.get(asset.key) for asset in assets)
+
+
+# Секции в порядке вывода: (имя, активы, ключ зависимостей, рендер)
+SECTIONS: Tuple[Tuple[str, Callable[[], List[Asset]], Callable, Callable], ...] = (
+    ('currencies', lambda: registry.in_category('currencies'),
+     lambda snap, ctx, assets: tuple(ctx['currency_values'].get(a.key) for a in assets),
+     _render_currencies),
+    ('crypto', lambda: registry.in_category('crypto'),
+     lambda snap, ctx, assets: (snap.section_versions.get('crypto'), ctx['usd_to_rub_rate']),
+     _render_crypto),
+    ('stocks', lambda: registry.in_section('stocks'),
+     lambda snap, ctx, assets: (snap.section_versions.get('stocks'), ctx['is_weekend'], _history_key(ctx, assets)),
+     _render_stocks),
+    ('real_estate', lambda: registry.in_section('real_estate'),
+     lambda snap, ctx, assets: (snap.section_versions.get('stocks'), ctx['is_weekend'], _history_key(ctx, assets)),
+     _render_real_estate),
+    ('commodities', lambda: registry.in_category('commodities'),
+     lambda snap, ctx, assets: (
+         snap.section_versions.get('commodities'), ctx['usd_to_rub_rate'], _history_key(ctx, assets)
+     ),
+     _render_commodities),
+    ('indices', lambda: registry.in_category('indices'),
+     lambda snap, ctx, assets: (snap.section_versions.get('indices'), _history_key(ctx, assets)),
+     _render_indices),
+)
+
+
+def section_assets(watch: Optional[Iterable[str]] = None) -> Dict[str, List[Asset]]:
+    """Активы каждой секции (только избранные, если watch задан)"""
+    watch_set = set(watch) if watch is not None else None
+    return {
+        name: [asset for asset in assets() if watch_set is None or asset.key in watch_set]
+        for name, assets, _, _ in SECTIONS
+    }
+
+
+def render_rates(
+    snapshot: MarketSnapshot,
+    currency_values: Dict[str, str],
+    usd_to_rub_rate: float,
+    price_history: Dict[str, float],
+    watch: Optional[Iterable[str]] = None,
+    is_weekend: bool = False,
+) -> str:
+    """
+    Собрать тело сообщения /rates (без строки времени и источников)
+
+    Args:
+        snapshot: Снимок рынка
+        currency_values: Готовые строки курсов валют ЦБ РФ/FOREX по ключу валюты
+        usd_to_rub_rate: Курс для пересчета крипты и товаров в рубли (0 — не пересчитывать)
+        price_history: Последние зафиксированные цены для дельт
+        watch: Избранные активы (None — все)
+        is_weekend: Выходной на MOEX (текст для пустой секции акций)
+    """
+    ctx = {
+        'currency_values': currency_values,
+        'usd_to_rub_rate': usd_to_rub_rate,
+        'price_history': price_history,
+        'is_weekend': is_weekend,
+    }
+    assets_by_section = section_assets(watch)
+    parts = [TITLE]
+    for name, _, dependency_key, render in SECTIONS:
+        assets = assets_by_section[name]
+        if not assets:
+            continue
+        cache_key = (name, tuple(asset.key for asset in assets))
+        deps = dependency_key(snapshot, ctx, assets)
+        cached = _fragments.get(cache_key)
+        if cached is not None and cached[0] == deps:
+            increment_metric('rates_fragment_hits_total')
+            parts.append(cached[1])
+            continue
+        increment_metric('rates_fragment_misses_total')
+        text = render(assets, snapshot, ctx)
+        if len(_fragments) >= _FRAGMENT_CACHE_LIMIT:
+            _fragments.clear()
+        _fragments[cache_key] = (deps, text)
+        parts.append(text)
+    return "".join(parts)
+
+
+def clear_fragment_cache() -> None:
+    """Сбросить кэш фрагментов"""
+    _fragments.clear()
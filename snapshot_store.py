@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сохранение последнего снимка рынка на диск.
+Хранятся ответы источников, из которых строится MarketSnapshot, вместе со
+временем получения. Формат компактный бинарный: заголовок (магия, версия
+формата, время сохранения, длина) и сжатый zlib JSON.
+"""
+
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'MSNP'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('>4sBdI')  # магия, версия, время сохранения, длина данных
+
+
+def save_snapshot(path: str, entries: Dict[str, Tuple[float, Any]]) -> int:
+    """
+    Атомарно записать снимок
+
+    Args:
+        path: Путь к файлу
+        entries: Ключ кэша -> (время получения, ответ источника)
+
+    Returns:
+        Размер файла в байтах
+    """
+    payload = json.dumps(
+        {key: [fetched_at, data] for key, (fetched_at, data) in entries.items()},
+        ensure_ascii=False,
+        separators=(',', ':'),
+        default=str,
+    ).encode('utf-8')
+    body = zlib.compress(payload, 6)
+    blob = _HEADER.pack(_MAGIC, _FORMAT_VERSION, time.time(), len(body)) + body
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(blob)
+
+
+def load_snapshot(path: str, max_age: float) -> Dict[str, Tuple[float, Any]]:
+    """
+    Прочитать снимок, пропуская записи старше max_age секунд
+
+    Поврежденный файл или файл другой версии формата считается отсутствующим.
+    """
+    try:
+        with open(path, 'rb') as f:
+            blob = f.read()
+    except FileNotFoundError:
+        return {}
+
+    try:
+        magic, version, saved_at, length = _HEADER.unpack_from(blob)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            logger.warning(f"⚠️ Снимок рынка {path}: неизвестный формат, пропускаю")
+            return {}
+        body = blob[_HEADER.size:_HEADER.size + length]
+        raw = json.loads(zlib.decompress(body).decode('utf-8'))
+    except (struct.error, zlib.error, ValueError) as e:
+        logger.warning(f"⚠️ Снимок рынка {path} поврежден: {e}")
+        return {}
+
+    now = time.time()
+    return {
+        key: (fetched_at, data)
+        for key, (fetched_at, data) in raw.items()
+        if now - fetched_at <= max_age
+    }
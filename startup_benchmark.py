@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк холодного старта бота по `python -X importtime`.
+Каждый замер — отдельный процесс, импортирующий admin_bot; печатает медиану
+времени импорта и самые тяжелые модули. С флагом --check завершается с кодом 1,
+если медиана превышает бюджет STARTUP_IMPORT_BUDGET_MS или при старте
+загрузился модуль, который должен импортироваться лениво (регрессия для CI).
+
+    python startup_benchmark.py --runs 5 --top 15
+    python startup_benchmark.py --check
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("BOT_TOKEN", "startup-benchmark")
+
+from config import STARTUP_IMPORT_BUDGET_MS
+
+# Модули, которые не должны загружаться при старте (импортируются при первом использовании)
+LAZY_MODULES = ("reportlab", "PIL", "schedule", "aiohttp.web", "webhook_server")
+
+_PROBE = (
+    "import sys, {module}; "
+    "print(','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def measure_import(module: str = "admin_bot") -> Tuple[float, Dict[str, float], List[str]]:
+    """
+    Импортировать модуль в новом процессе с -X importtime
+
+    Returns:
+        (время импорта модуля в мс, кумулятивное время по модулям в мс, загруженные ленивые модули)
+    """
+    code = _PROBE.format(module=module, lazy=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{result.stderr[-2000:]}")
+
+    cumulative: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative_us, name = line[len("import time:"):].split("|")
+            cumulative[name.strip()] = int(cumulative_us) / 1000
+        except ValueError:
+            continue  # строка заголовка
+    eager = [name for name in result.stdout.strip().split(",") if name]
+    return cumulative.get(module, 0.0), cumulative, eager
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время холодного старта (импорта) бота")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых тяжелых модулей показать")
+    parser.add_argument("--module", default="admin_bot")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--check", action="store_true", help="Код возврата 1 при превышении бюджета")
+    args = parser.parse_args()
+
+    totals = []
+    heaviest: Dict[str, float] = {}
+    eager: List[str] = []
+    for _ in range(max(1, args.runs)):
+        total, cumulative, eager = measure_import(args.module)
+        totals.append(total)
+        for name, value in cumulative.items():
+            heaviest[name] = min(value, heaviest.get(name, value))
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: медиана {median:.1f} мс, min {min(totals):.1f}, max {max(totals):.1f} ({len(totals)} замеров)")
+    print(f"бюджет: {args.budget_ms:g} мс")
+    print(f"\n{'мс':>9}  модуль (кумулятивно, лучший замер)")
+    top_level = {name: value for name, value in heaviest.items() if name != args.module}
+    for name, value in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{value:>9.1f}  {name}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"медиана {median:.1f} мс превышает бюджет {args.budget_ms:g} мс")
+    if eager:
+        failures.append(f"при старте загружены ленивые модули: {', '.join(eager)}")
+    for failure in failures:
+        print(f"\n❌ {failure}")
+    if not failures:
+        print("\n✅ холодный старт в бюджете")
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальная замена REST API T-Invest для проверки автопокупки и рыночных данных
+без брокерского токена. Задержки, ошибки и исполнение заявок настраиваются.
+
+Запуск сервера (бот направляется на него через TINVEST_REST_BASE):
+    python tinvest_mock.py serve --port 8088 --latency-ms 30
+
+Бенчмарк autobuy_job на сотнях позиций:
+    python tinvest_mock.py bench --positions 300 --latency-ms 20 --concurrency 1 10 50
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+_SERVICE_PREFIX = "/rest/tinkoff.public.invest.api.contract.v1."
+MOCK_ACCOUNT_ID = "mock-account-0001"
+IMOEX_UID = "4821c9aa-36e8-4743-b37c-861e58581b25"
+FILL_STATUS = "EXECUTION_REPORT_STATUS_FILL"
+REJECTED_STATUS = "EXECUTION_REPORT_STATUS_REJECTED"
+NORMAL_TRADING = "SECURITY_TRADING_STATUS_NORMAL_TRADING"
+
+
+def _quotation(value: float) -> Dict[str, Any]:
+    units = int(value)
+    return {"units": str(units), "nano": int(round((value - units) * 1_000_000_000))}
+
+
+def _money(value: float, currency: str = "rub") -> Dict[str, Any]:
+    return dict(_quotation(value), currency=currency)
+
+
+class MockScenario:
+    """
+    Сценарий поведения mock-сервера
+
+    Attributes:
+        latency_ms: Базовая задержка ответа
+        jitter_ms: Случайная добавка к задержке (0..jitter_ms)
+        error_rate: Доля ответов 500 по методам, например {"PostOrder": 0.05}
+        order_outcomes: Исход заявки по тикеру: статус исполнения или HTTP код ошибки
+        unknown_tickers: Тикеры, которые FindInstrument не находит
+        prices: Цены по тикерам (остальные детерминированно выводятся из тикера)
+        trading_status: Статус торгов для GetTradingStatuses
+        seed: Зерно генератора для воспроизводимых ошибок и задержек
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: Optional[Dict[str, float]] = None,
+        order_outcomes: Optional[Dict[str, Any]] = None,
+        unknown_tickers: Optional[Set[str]] = None,
+        prices: Optional[Dict[str, float]] = None,
+        trading_status: str = NORMAL_TRADING,
+        seed: int = 42,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = dict(error_rate or {})
+        self.order_outcomes = dict(order_outcomes or {})
+        self.unknown_tickers = {t.upper() for t in (unknown_tickers or set())}
+        self.prices = {t.upper(): p for t, p in (prices or {}).items()}
+        self.trading_status = trading_status
+        self.rng = random.Random(seed)
+        # Очередь заранее заданных HTTP кодов для следующих вызовов метода
+        self.scripted_errors: Dict[str, Deque[int]] = defaultdict(deque)
+
+    def fail_next(self, method: str, *statuses: int) -> None:
+        """Следующие вызовы method вернут указанные HTTP коды (по одному на вызов)"""
+        self.scripted_errors[method].extend(statuses)
+
+    def price_for(self, ticker: str) -> float:
+        ticker = ticker.upper()
+        if ticker in self.prices:
+            return self.prices[ticker]
+        digest = int(hashlib.sha1(ticker.encode("utf-8")).hexdigest()[:8], 16)
+        return round(10 + digest % 500000 / 100, 2)
+
+
+class TInvestMock:
+    """aiohttp сервер, имитирующий используемые ботом методы T-Invest REST API"""
+
+    def __init__(self, scenario: Optional[MockScenario] = None):
+        self.scenario = scenario or MockScenario()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.duplicate_orders = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+        self._handlers = {
+            "UsersService/GetAccounts": self._get_accounts,
+            "OperationsService/GetPortfolio": self._get_portfolio,
+            "OperationsService/GetPositions": self._get_positions,
+            "InstrumentsService/FindInstrument": self._find_instrument,
+            "OrdersService/PostOrder": self._post_order,
+            "MarketDataService/GetLastPrices": self._get_last_prices,
+            "MarketDataService/GetTradingStatuses": self._get_trading_statuses,
+        }
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(_SERVICE_PREFIX + "{method:.+}", self._dispatch)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Поднять сервер; возвращает базовый URL для TINVEST_REST_BASE"""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}/rest"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": dict(self.calls),
+            "orders": len(self.orders),
+            "duplicate_orders": self.duplicate_orders,
+            "max_in_flight_orders": self.max_in_flight,
+        }
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        method_path = request.match_info["method"]
+        handler = self._handlers.get(method_path)
+        if handler is None:
+            return web.json_response({"code": 12, "message": "method not implemented"}, status=404)
+        method = method_path.split("/")[-1]
+        self.calls[method] += 1
+
+        if method != "PostOrder":
+            return await self._respond(request, method, handler)
+        # Для заявок считаем, сколько их одновременно обрабатывается сервером
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await self._respond(request, method, handler)
+        finally:
+            self.in_flight -= 1
+
+    async def _respond(self, request: web.Request, method: str, handler) -> web.Response:
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return web.json_response({"code": 16, "message": "authentication token is missing"}, status=401)
+
+        scenario = self.scenario
+        delay = scenario.latency_ms + scenario.rng.uniform(0, scenario.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if scenario.scripted_errors[method]:
+            status = scenario.scripted_errors[method].popleft()
+            return web.json_response({"code": 13, "message": "scripted error"}, status=status)
+        if scenario.rng.random() < scenario.error_rate.get(method, 0.0):
+            return web.json_response({"code": 13, "message": "internal error"}, status=500)
+
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            body = {}
+        return await handler(body)
+
+    async def _get_accounts(self, body: Dict[str, Any]) -> web.Response:
+        return web.json_response({
+            "accounts": [{
+                "id": MOCK_ACCOUNT_ID,
+                "type": "ACCOUNT_TYPE_TINKOFF",
+                "name": "Mock брокерский счет",
+                "status": "ACCOUNT_STATUS_OPEN",
+                "accessLevel": "ACCOUNT_ACCESS_LEVEL_FULL_ACCESS",
+            }]
+        })
+
+    def _filled_total(self) -> float:
+        return sum(
+            order["price"] * order["lots"]
+            for order in self.orders.values()
+            if order["status"] == FILL_STATUS
+        )
+
+    async def _get_portfolio(self, body: Dict[str, Any]) -> web.Response:
+        return web.json_response({
+            "accountId": body.get("accountId", MOCK_ACCOUNT_ID),
+            "totalAmountPortfolio": _money(1_000_000.0),
+            "totalAmountShares": _money(self._filled_total()),
+        })
+
+    async def _get_positions(self, body: Dict[str, Any]) -> web.Response:
+        return web.json_response({
+            "money": [_money(1_000_000.0 - self._filled_total())],
+            "blocked": [],
+            "securities": [],
+        })
+
+    def _instrument(self, ticker: str) -> Dict[str, Any]:
+        ticker = ticker.upper()
+        return {
+            "figi": f"MOCK{ticker}",
+            "ticker": ticker,
+            "classCode": "TQBR",
+            "instrumentType": "share",
+            "name": f"Mock {ticker}",
+            "uid": f"uid-{ticker.lower()}",
+            "lot": 1,
+            "apiTradeAvailableFlag": True,
+        }
+
+    async def _find_instrument(self, body: Dict[str, Any]) -> web.Response:
+        query = str(body.get("query", "")).upper()
+        if not query or query in self.scenario.unknown_tickers:
+            return web.json_response({"instruments": []})
+        return web.json_response({"instruments": [self._instrument(query)]})
+
+    async def _post_order(self, body: Dict[str, Any]) -> web.Response:
+        order_id = body.get("orderId")
+        if not order_id:
+            return web.json_response({"code": 3, "message": "orderId is required"}, status=400)
+
+        # orderId — ключ идемпотентности: повтор возвращает ту же заявку без нового исполнения
+        if order_id in self.orders:
+            self.duplicate_orders += 1
+            return web.json_response(self.orders[order_id]["response"])
+
+        figi = str(body.get("instrumentId", ""))
+        ticker = figi[4:] if figi.startswith("MOCK") else figi
+        lots = int(body.get("quantity", "1"))
+        outcome = self.scenario.order_outcomes.get(ticker, FILL_STATUS)
+        if isinstance(outcome, int):
+            return web.json_response({"code": 30034, "message": "scripted order failure"}, status=outcome)
+
+        price = self.scenario.price_for(ticker)
+        executed = lots if outcome == FILL_STATUS else 0
+        response = {
+            "orderId": f"broker-{len(self.orders) + 1:06d}",
+            "executionReportStatus": outcome,
+            "lotsRequested": str(lots),
+            "lotsExecuted": str(executed),
+            "initialOrderPrice": _money(price * lots),
+            "executedOrderPrice": _money(price),
+            "figi": figi,
+            "direction": body.get("direction"),
+            "orderType": body.get("orderType"),
+            "orderRequestId": order_id,
+        }
+        self.orders[order_id] = {"response": response, "status": outcome, "price": price, "lots": executed}
+        return web.json_response(response)
+
+    def _resolve_ids(self, body: Dict[str, Any]) -> List[Dict[str, str]]:
+        items = []
+        for instrument_id in body.get("instrumentId") or []:
+            instrument_id = str(instrument_id)
+            if instrument_id == IMOEX_UID:
+                items.append({"ticker": "IMOEX", "classCode": "SNDX", "uid": IMOEX_UID})
+                continue
+            # Формат ticker_classCode, как в data_sources.get_moex_stocks
+            ticker, _, class_code = instrument_id.rpartition("_")
+            if not ticker:
+                ticker, class_code = instrument_id, "TQBR"
+            items.append({"ticker": ticker, "classCode": class_code, "uid": f"uid-{ticker.lower()}"})
+        return items
+
+    async def _get_last_prices(self, body: Dict[str, Any]) -> web.Response:
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return web.json_response({
+            "lastPrices": [
+                {
+                    "figi": f"MOCK{item['ticker']}",
+                    "ticker": item["ticker"],
+                    "classCode": item["classCode"],
+                    "instrumentUid": item["uid"],
+                    "price": _quotation(self.scenario.price_for(item["ticker"])),
+                    "time": now,
+                    "lastPriceType": "LAST_PRICE_EXCHANGE",
+                }
+                for item in self._resolve_ids(body)
+            ]
+        })
+
+    async def _get_trading_statuses(self, body: Dict[str, Any]) -> web.Response:
+        return web.json_response({
+            "tradingStatuses": [
+                {
+                    "figi": f"MOCK{item['ticker']}",
+                    "ticker": item["ticker"],
+                    "classCode": item["classCode"],
+                    "instrumentUid": item["uid"],
+                    "tradingStatus": self.scenario.trading_status,
+                    "limitOrderAvailableFlag": True,
+                    "marketOrderAvailableFlag": True,
+                    "apiTradeAvailableFlag": True,
+                }
+                for item in self._resolve_ids(body)
+            ]
+        })
+
+
+class _BenchBot:
+    def __init__(self):
+        self.messages: List[str] = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append(text)
+
+
+class _BenchContext:
+    def __init__(self):
+        self.bot = _BenchBot()
+
+
+async def run_autobuy_benchmark(
+    positions: int,
+    concurrency: int,
+    scenario: MockScenario,
+    warmup: bool = False,
+) -> Dict[str, Any]:
+    """
+    Один прогон autobuy_job против mock-сервера во временном каталоге
+
+    Returns:
+        Время прогона, пропускная способность заявок и статистика сервера
+    """
+    import autobuy_module
+
+    mock = TInvestMock(scenario)
+    base_url = await mock.start()
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="autobuy-bench-") as workdir:
+        os.chdir(workdir)
+        patched = {
+            "_TINVEST_REST_BASE": base_url,
+            "TINVEST_API_TOKEN": "mock-token",
+            "AUTOBUY_MAX_CONCURRENT_ORDERS": concurrency,
+            "_lookup_cache": None,
+            "_warm_state": None,
+        }
+        saved = {name: getattr(autobuy_module, name) for name in patched}
+        for name, value in patched.items():
+            setattr(autobuy_module, name, value)
+        try:
+            settings = autobuy_module._default_settings()
+            settings.update(
+                enabled=True,
+                positions=[{"ticker": f"MCK{i:04d}", "qty": 1} for i in range(positions)],
+            )
+            autobuy_module.save_autobuy_settings(settings)
+
+            context = _BenchContext()
+            if warmup:
+                await autobuy_module.autobuy_warmup_job(context)
+            started = time.perf_counter()
+            await autobuy_module.autobuy_job(context)
+            elapsed = time.perf_counter() - started
+            results = autobuy_module.load_autobuy_settings().get("last_results", [])
+        finally:
+            autobuy_module._stop_keepalive()
+            for name, value in saved.items():
+                setattr(autobuy_module, name, value)
+            os.chdir(previous_cwd)
+            await mock.stop()
+            session = autobuy_module._own_session
+            if session is not None and not session.closed:
+                await session.close()
+            autobuy_module._own_session = None
+
+    ok = sum(1 for r in results if r.get("ok"))
+    return {
+        "positions": positions,
+        "concurrency": concurrency,
+        "warmup": warmup,
+        "elapsed_s": elapsed,
+        "orders_per_s": ok / elapsed if elapsed > 0 else 0.0,
+        "ok": ok,
+        "failed": len(results) - ok,
+        "server": mock.stats(),
+    }
+
+
+async def _bench_main(args: argparse.Namespace) -> None:
+    print(
+        f"autobuy_job: {args.positions} позиций, задержка {args.latency_ms:g}±{args.jitter_ms:g} мс, "
+        f"ошибки PostOrder {args.error_rate:.0%}"
+    )
+    print(f"{'параллельно':>12} {'прогрев':>8} {'время, с':>9} {'заявок/с':>9} {'ok':>5} {'ошибок':>7} {'в полете':>9}")
+    for concurrency in args.concurrency:
+        for warmup in ((False, True) if args.with_warmup else (False,)):
+            scenario = MockScenario(
+                latency_ms=args.latency_ms,
+                jitter_ms=args.jitter_ms,
+                error_rate={"PostOrder": args.error_rate},
+            )
+            result = await run_autobuy_benchmark(args.positions, concurrency, scenario, warmup=warmup)
+            print(
+                f"{concurrency:>12} {'да' if warmup else 'нет':>8} {result['elapsed_s']:>9.3f} "
+                f"{result['orders_per_s']:>9.1f} {result['ok']:>5} {result['failed']:>7} "
+                f"{result['server']['max_in_flight_orders']:>9}"
+            )
+
+
+async def _serve_main(args: argparse.Namespace) -> None:
+    mock = TInvestMock(MockScenario(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate={"PostOrder": args.error_rate},
+    ))
+    base_url = await mock.start(args.host, args.port)
+    print(f"T-Invest mock: TINVEST_REST_BASE={base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mock.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальный mock T-Invest REST API и бенчмарк автопокупки")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("serve", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--latency-ms", type=float, default=20.0)
+        p.add_argument("--jitter-ms", type=float, default=5.0)
+        p.add_argument("--error-rate", type=float, default=0.0, help="Доля ошибок PostOrder (0..1)")
+        if name == "serve":
+            p.add_argument("--host", default="127.0.0.1")
+            p.add_argument("--port", type=int, default=8088)
+        else:
+            p.add_argument("--positions", type=int, default=300)
+            p.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+            p.add_argument("--with-warmup", action="store_true", help="Дополнительно замерить с прогревом")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == "serve":
+        asyncio.run(_serve_main(args))
+    else:
+        os.environ.setdefault("BOT_TOKEN", "mock")
+        asyncio.run(_bench_main(args))
+
+
+if __name__ == "__main__":
+    main()
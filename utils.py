@@ -8,17 +8,219 @@
 import logging
 import os
 import json
+import sys
 import threading
+from collections import OrderedDict
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, Callable, Awaitable
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
 from functools import wraps
 import asyncio
 
+from config import (
+    CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_WHEEL_TICK, CACHE_WHEEL_SLOTS, CACHE_HOT_HITS
+)
+from monitoring import increment_metric, set_metric
+
 logger = logging.getLogger(__name__)
 _rates_file_lock = threading.RLock()
 
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Оценить объем объекта в памяти (байты) с учетом вложенных контейнеров
+    
+    Оценка приблизительная, но стабильная: ее достаточно для бюджета кэша.
+    """
+    if _seen is None:
+        _seen = set()
+    obj_id = id(obj)
+    if obj_id in _seen:
+        return 0
+    _seen.add(obj_id)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    return size
+
+
+def _entry_deadline(entry: Dict[str, Any]) -> float:
+    """Момент (time.monotonic), после которого запись кэша больше не нужна"""
+    return max(entry.get('expires_at') or 0.0, entry.get('stale_until') or 0.0)
+
+
+class TimerWheel:
+    """
+    Хешированное колесо таймеров
+
+    Постановка таймера — O(1), продвижение обходит только наступившие слоты.
+    Время — time.monotonic(), поэтому переводы системных часов не влияют на сроки.
+    """
+
+    def __init__(self, tick: float, slots: int, now: float):
+        self.tick = tick
+        self._slots = [dict() for _ in range(slots)]
+        self._where: Dict[str, int] = {}
+        self._current = int(now / tick)
+
+    def schedule(self, key: str, deadline: float) -> None:
+        """Поставить (или переставить) таймер ключа"""
+        self.cancel(key)
+        deadline_tick = max(int(deadline / self.tick) + 1, self._current + 1)
+        index = deadline_tick % len(self._slots)
+        self._slots[index][key] = deadline_tick
+        self._where[key] = index
+
+    def cancel(self, key: str) -> None:
+        index = self._where.pop(key, None)
+        if index is not None:
+            self._slots[index].pop(key, None)
+
+    def advance(self, now: float) -> List[str]:
+        """Продвинуть колесо до now и вернуть ключи наступивших таймеров"""
+        target = int(now / self.tick)
+        due: List[str] = []
+        # При отставании больше чем на оборот достаточно одного полного прохода
+        steps = min(target - self._current, len(self._slots))
+        for step in range(1, steps + 1):
+            slot = self._slots[(self._current + step) % len(self._slots)]
+            ready = [key for key, deadline_tick in slot.items() if deadline_tick <= target]
+            for key in ready:
+                del slot[key]
+                del self._where[key]
+            due.extend(ready)
+        self._current = max(self._current, target)
+        return due
+
+    def clear(self) -> None:
+        for slot in self._slots:
+            slot.clear()
+        self._where.clear()
+
+
+class BoundedCache:
+    """
+    Кэш API с LRU-вытеснением и колесом таймеров
+
+    Ограничен количеством записей и оценочным объемом в байтах. Запись — словарь
+    {'data', 'stamp', 'fetched_at', 'expires_at', 'ttl', 'refresh', 'hits'[, 'stale_until']},
+    сроки — по time.monotonic(). Когда срок записи наступает, колесо таймеров
+    удаляет ее, а популярную запись (не меньше CACHE_HOT_HITS попаданий)
+    оставляет устаревшей и отдает на фоновое обновление. Счетчики попаданий,
+    промахов и вытеснений публикуются в метрики бота (/metrics).
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._wheel = TimerWheel(CACHE_WHEEL_TICK, CACHE_WHEEL_SLOTS, time.monotonic())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        return self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Получить запись и отметить ее как недавно использованную"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def __setitem__(self, key: str, entry: Dict[str, Any]) -> None:
+        self._discard(key)
+        size = estimate_size(entry['data'])
+        if size > self.max_bytes:
+            logger.debug(f"Запись кэша {key} ({size} байт) больше бюджета, не кэшируем")
+            increment_metric('cache_rejected_total')
+            self._publish()
+            return
+        self._entries[key] = entry
+        self._sizes[key] = size
+        self.total_bytes += size
+        self._wheel.schedule(key, _entry_deadline(entry))
+        while self._entries and (self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            increment_metric('cache_evictions_total')
+            logger.debug(f"Вытеснена запись кэша: {oldest}")
+        self._publish()
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self._entries:
+            raise KeyError(key)
+        self._discard(key)
+        self._publish()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._sizes.clear()
+        self._wheel.clear()
+        self.total_bytes = 0
+        self._publish()
+
+    def expire_due(self, now: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Обработать наступившие таймеры
+
+        Returns:
+            Популярные записи (ключ, запись), которые нужно обновить в фоне
+        """
+        to_refresh = []
+        expired = 0
+        for key in self._wheel.advance(now):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            deadline = _entry_deadline(entry)
+            if deadline > now:
+                self._wheel.schedule(key, deadline)
+                continue
+            if entry.get('refresh') is not None and entry.get('hits', 0) >= CACHE_HOT_HITS:
+                # Популярная запись: до обновления отдаем устаревшие данные
+                entry['stale_until'] = now + entry['ttl']
+                entry['hits'] = 0
+                self._wheel.schedule(key, entry['stale_until'])
+                to_refresh.append((key, entry))
+                continue
+            self._discard(key)
+            expired += 1
+        if expired:
+            increment_metric('cache_expired_total', expired)
+            self._publish()
+        return to_refresh
+
+    def _discard(self, key: str) -> None:
+        if key in self._entries:
+            del self._entries[key]
+            self.total_bytes -= self._sizes.pop(key, 0)
+            self._wheel.cancel(key)
+
+    def _publish(self) -> None:
+        set_metric('cache_entries', len(self._entries))
+        set_metric('cache_bytes', self.total_bytes)
+
+
 # Глобальный кэш
-api_cache: Dict[str, Dict[str, Any]] = {}
+api_cache = BoundedCache(CACHE_MAX_BYTES, CACHE_MAX_ENTRIES)
+
+# Фоновые обновления устаревших записей кэша (восстановленных из снимка или популярных)
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+_cache_ticker: Optional[asyncio.Task] = None
 
 # Файл для хранения последних известных значений
 from config import LAST_KNOWN_RATES_FILE
@@ -30,10 +232,24 @@ def is_admin(user_id: int) -> bool:
     return user_id == ADMIN_USER_ID
 
 
+def _make_entry(data: Any, ttl: float, fetch_func: Optional[Callable[[], Awaitable[Any]]]) -> Dict[str, Any]:
+    now = time.monotonic()
+    return {
+        'data': data,
+        'stamp': now,
+        'fetched_at': time.time(),  # Настенное время — только для сохранения на диск
+        'expires_at': now + ttl,
+        'ttl': ttl,
+        'refresh': fetch_func,
+        'hits': 0
+    }
+
+
 async def get_cached_data(
     cache_key: str,
     fetch_func: Callable[[], Awaitable[Any]],
-    ttl: int = 60
+    ttl: int = 60,
+    refresh: bool = True
 ) -> Any:
     """
     Получить данные с кэшированием
@@ -42,34 +258,128 @@ async def get_cached_data(
         cache_key: Ключ кэша
         fetch_func: Асинхронная функция для получения данных
         ttl: Время жизни кэша в секундах
+        refresh: Обновлять популярную запись в фоне по истечении ttl
+                 (False — для неизменяемых данных: запись просто истекает)
     
     Returns:
         Данные из кэша или результат fetch_func
     """
-    now = datetime.now()
+    now = time.monotonic()
     
     # Проверяем кэш
-    if cache_key in api_cache:
-        cached_data = api_cache[cache_key]
-        cache_timestamp = cached_data.get('timestamp')
-        
-        if cache_timestamp and (now - cache_timestamp).total_seconds() < ttl:
+    cached_data = api_cache.get(cache_key)
+    if cached_data is not None:
+        if now - cached_data['stamp'] < ttl:
             logger.debug(f"Кэш попадание для ключа: {cache_key}")
+            cached_data['hits'] = cached_data.get('hits', 0) + 1
+            increment_metric('cache_hits_total')
+            return cached_data['data']
+        
+        # Запись восстановлена после рестарта или ждет фонового обновления:
+        # отдаем сразу, обновляем в фоне
+        stale_until = cached_data.get('stale_until')
+        if stale_until and now < stale_until:
+            logger.debug(f"Устаревшие данные для ключа: {cache_key}, обновляем в фоне")
+            increment_metric('cache_stale_hits_total')
+            _schedule_refresh(cache_key, fetch_func, ttl)
             return cached_data['data']
     
     # Получаем свежие данные
     logger.debug(f"Кэш промах для ключа: {cache_key}, запрашиваем свежие данные")
+    increment_metric('cache_misses_total')
     data = await fetch_func()
     
     # Сохраняем в кэш
-    api_cache[cache_key] = {
-        'data': data,
-        'timestamp': now
-    }
+    api_cache[cache_key] = _make_entry(data, ttl, fetch_func if refresh else None)
     
     return data
 
 
+def _schedule_refresh(cache_key: str, fetch_func: Callable[[], Awaitable[Any]], ttl: float) -> None:
+    """Запустить фоновое обновление записи кэша (не более одного на ключ)"""
+    task = _refresh_tasks.get(cache_key)
+    if task is not None and not task.done():
+        return
+    
+    async def _refresh():
+        try:
+            data = await fetch_func()
+            api_cache[cache_key] = _make_entry(data, ttl, fetch_func)
+            increment_metric('cache_refreshes_total')
+        except Exception as e:
+            logger.warning(f"Фоновое обновление кэша {cache_key} не удалось: {e}")
+        finally:
+            _refresh_tasks.pop(cache_key, None)
+    
+    _refresh_tasks[cache_key] = asyncio.create_task(_refresh())
+
+
+async def _run_cache_ticker() -> None:
+    while True:
+        await asyncio.sleep(CACHE_WHEEL_TICK)
+        try:
+            for key, entry in api_cache.expire_due(time.monotonic()):
+                _schedule_refresh(key, entry['refresh'], entry['ttl'])
+        except Exception as e:
+            logger.error(f"Ошибка обработки таймеров кэша: {e}")
+
+
+def start_cache_ticker() -> None:
+    """Запустить фоновое продвижение колеса таймеров кэша (в работающем event loop)"""
+    global _cache_ticker
+    if _cache_ticker is None or _cache_ticker.done():
+        _cache_ticker = asyncio.create_task(_run_cache_ticker())
+
+
+def stop_cache_ticker() -> None:
+    """Остановить продвижение колеса таймеров кэша"""
+    global _cache_ticker
+    if _cache_ticker is not None:
+        _cache_ticker.cancel()
+        _cache_ticker = None
+
+
+def export_cache_entries(keys) -> Dict[str, tuple]:
+    """
+    Выгрузить записи кэша для сохранения на диск
+    
+    Returns:
+        Ключ -> (время получения в секундах epoch, данные)
+    """
+    return {
+        key: (api_cache[key]['fetched_at'], api_cache[key]['data'])
+        for key in keys
+        if key in api_cache
+    }
+
+
+def restore_cache_entries(entries: Dict[str, tuple], stale_ttl: float) -> int:
+    """
+    Восстановить записи кэша после рестарта
+    
+    Записи сохраняют исходный возраст, поэтому считаются просроченными,
+    но еще stale_ttl секунд с момента получения отдаются сразу с обновлением в фоне.
+    
+    Returns:
+        Количество восстановленных записей
+    """
+    restored = 0
+    now, wall_now = time.monotonic(), time.time()
+    for key, (fetched_at, data) in entries.items():
+        if key in api_cache:
+            continue
+        stamp = now - max(0.0, wall_now - fetched_at)
+        api_cache[key] = {
+            'data': data,
+            'stamp': stamp,
+            'fetched_at': fetched_at,
+            'stale_until': stamp + stale_ttl,
+            'hits': 0
+        }
+        restored += 1
+    return restored
+
+
 def clear_cache(cache_key: Optional[str] = None):
     """
     Очистить кэш
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка webhook-сервера без Telegram и без сети.
+Поднимает create_webhook_app на локальном порту и шлет фейковое обновление:
+с верным секретом (ожидается 200 и обновление в update_queue), с неверным
+и без заголовка (403), с битым JSON (400), плюс GET /health. С флагом --check
+завершается с кодом 1 при любом расхождении (регрессия для CI).
+
+    python webhook_check.py
+    python webhook_check.py --check
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import List
+
+os.environ.setdefault("BOT_TOKEN", "webhook-check")
+
+import aiohttp
+from aiohttp import web
+from telegram.ext import Application
+
+from webhook_server import SECRET_HEADER, create_webhook_app
+
+_PATH = "/telegram"
+_SECRET = "webhook-check-secret"
+# Фиктивный токен в формате Telegram: бот не инициализируется и в сеть не ходит
+_TOKEN = "123456:webhook-check"
+
+_FAKE_UPDATE = {
+    "update_id": 424242,
+    "message": {
+        "message_id": 1,
+        "date": 1700000000,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Check"},
+        "text": "/start",
+    },
+}
+
+
+async def run_checks() -> List[str]:
+    """Прогнать запросы к webhook-серверу; вернуть список расхождений"""
+    application = Application.builder().token(_TOKEN).updater(None).build()
+    runner = web.AppRunner(create_webhook_app(application, _PATH, _SECRET))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = f"http://127.0.0.1:{port}{_PATH}"
+
+    failures: List[str] = []
+
+    def expect(name: str, status: int, expected: int) -> None:
+        mark = "✅" if status == expected else "❌"
+        print(f"{mark} {name}: {status} (ожидался {expected})")
+        if status != expected:
+            failures.append(f"{name}: {status} вместо {expected}")
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=_FAKE_UPDATE, headers={SECRET_HEADER: _SECRET}) as resp:
+                expect("верный секрет", resp.status, 200)
+            async with session.post(url, json=_FAKE_UPDATE, headers={SECRET_HEADER: "wrong-secret"}) as resp:
+                expect("неверный секрет", resp.status, 403)
+            async with session.post(url, json=_FAKE_UPDATE) as resp:
+                expect("без секрета", resp.status, 403)
+            async with session.post(url, data=b"{not json", headers={SECRET_HEADER: _SECRET}) as resp:
+                expect("битый JSON", resp.status, 400)
+            async with session.get(f"http://127.0.0.1:{port}/health") as resp:
+                expect("GET /health", resp.status, 200)
+    finally:
+        await runner.cleanup()
+
+    # В очередь должно попасть ровно одно обновление — от запроса с верным секретом
+    queued = []
+    while not application.update_queue.empty():
+        queued.append(application.update_queue.get_nowait())
+    update_ids = [update.update_id for update in queued]
+    if update_ids == [_FAKE_UPDATE["update_id"]]:
+        print(f"✅ update_queue: обновление {update_ids[0]} передано боту")
+    else:
+        print(f"❌ update_queue: {update_ids}")
+        failures.append(f"в update_queue {update_ids} вместо [{_FAKE_UPDATE['update_id']}]")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Проверка приема обновлений webhook-сервером")
+    parser.add_argument("--check", action="store_true", help="Код возврата 1 при расхождении")
+    args = parser.parse_args()
+
+    failures = asyncio.run(run_checks())
+    if not failures:
+        print("\n✅ webhook принимает только запросы с верным секретом")
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Режим webhook: встроенный aiohttp сервер принимает обновления от Telegram
+и передает их в очередь обновлений python-telegram-bot.
+"""
+
+import asyncio
+import hmac
+import logging
+import signal
+from typing import List, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from monitoring import increment_metric
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def create_webhook_app(application: Application, path: str, secret_token: str) -> web.Application:
+    """
+    Создать aiohttp приложение, принимающее обновления Telegram
+
+    Args:
+        application: Приложение python-telegram-bot
+        path: Путь webhook (например, '/telegram')
+        secret_token: Секрет, который Telegram передает в заголовке SECRET_HEADER
+
+    Returns:
+        aiohttp приложение (можно поднять локально и слать в него фейковые обновления)
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        received_secret = request.headers.get(SECRET_HEADER, "")
+        if not secret_token or not hmac.compare_digest(received_secret, secret_token):
+            increment_metric('webhook_rejected_total')
+            logger.warning(f"🚫 Webhook: неверный секрет от {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except Exception:
+            increment_metric('webhook_bad_request_total')
+            return web.Response(status=400)
+
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return web.Response(status=400)
+
+        await application.update_queue.put(update)
+        increment_metric('webhook_updates_total')
+        return web.Response()
+
+    async def handle_health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+async def run_webhook(
+    application: Application,
+    listen: str,
+    port: int,
+    path: str,
+    webhook_url: str,
+    secret_token: str,
+    allowed_updates: Optional[List[str]] = None,
+) -> None:
+    """
+    Запустить бота в режиме webhook до получения SIGINT/SIGTERM
+
+    Повторяет жизненный цикл Application.run_polling: initialize → post_init →
+    start → ... → stop → post_shutdown → shutdown.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    runner = web.AppRunner(create_webhook_app(application, path, secret_token))
+    await runner.setup()
+    site = web.TCPSite(runner, listen, port)
+    await site.start()
+    logger.info(f"🌐 Webhook сервер слушает {listen}:{port}{path}")
+
+    try:
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=secret_token,
+            allowed_updates=allowed_updates,
+            drop_pending_updates=False,
+        )
+        logger.info(f"✅ Webhook зарегистрирован: {webhook_url}")
+
+        await application.start()
+        await stop_event.wait()
+    finally:
+        logger.info("🛑 Остановка webhook сервера...")
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()